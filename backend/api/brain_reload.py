@@ -0,0 +1,282 @@
+"""Hot reload of the brain database and standards embeddings.
+
+Re-running scripts/seed_database.py or scripts/embed_standards.py used to
+need a restart, which also reloaded the VLM. BrainReloader instead opens
+the new brain.db connection and embedding matrix next to the ones in use,
+validates them, and swaps them onto app state in one step (no await
+between the assignments, so no request sees half of each).
+
+Requests that read the brain hold the snapshot they started on through
+``pinned``; a replaced snapshot's connection is closed when its last
+such request finishes. The sentence-transformer itself is not reloaded:
+new snapshots share it.
+
+A reload runs on ``POST /api/admin/reload`` or when the watcher sees the
+files change (polled every BRAIN_RELOAD_POLL seconds, 0 to disable). It
+waits for one quiet poll after a change so it does not open a file that
+is still being written. Each API worker watches for itself.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+
+from .components import DATA_DIR, READY, UNAVAILABLE
+from brain.database import Database
+from brain.lookup import BrainLookup
+from brain.manufacturing import ManufacturingLookup
+from models.metrics import BRAIN_RELOADS
+
+logger = logging.getLogger(__name__)
+
+BRAIN_DB_PATH = DATA_DIR / "brain.db"
+EMBEDDINGS_PATH = DATA_DIR / "embeddings" / "standards_embeddings.npz"
+POLL_INTERVAL = float(os.environ.get("BRAIN_RELOAD_POLL", "5"))
+
+# Seeded by scripts/seed_database.py; an empty one means a broken seed
+REQUIRED_TABLES = ("geometric_characteristics", "tolerance_tables", "material_properties", "datum_patterns")
+
+
+class BrainSnapshotInvalidError(Exception):
+    """The new brain.db or embeddings failed validation; the old snapshot stays in use."""
+
+
+class BrainSnapshot:
+    """One generation of the brain connection, its lookups and the embedder."""
+
+    def __init__(self, version: int, db: Database | None, brain_lookup, manufacturing_lookup, embedder):
+        self.version = version
+        self.db = db
+        self.brain_lookup = brain_lookup
+        self.manufacturing_lookup = manufacturing_lookup
+        self.embedder = embedder
+        self.loaded_at = time.time()
+        self.users = 0
+        self.retired = False
+        self._closed = False
+
+    @classmethod
+    def of(cls, state, version: int = 1) -> "BrainSnapshot":
+        """The components currently on ``state``."""
+        return cls(version, getattr(state, "db", None), getattr(state, "brain_lookup", None),
+                   getattr(state, "manufacturing_lookup", None), getattr(state, "embedder", None))
+
+    async def release(self) -> None:
+        self.users -= 1
+        if self.retired and not self.users:
+            await self._close()
+
+    async def retire(self) -> None:
+        """Close once no request holds this snapshot any more."""
+        self.retired = True
+        if not self.users:
+            await self._close()
+
+    async def _close(self) -> None:
+        if not self._closed and self.db is not None:
+            self._closed = True
+            await self.db.close()
+            logger.info("Brain snapshot %d closed", self.version)
+
+
+@asynccontextmanager
+async def pinned(state):
+    """Keep the current brain snapshot open until the block exits.
+
+    Read the brain components off ``state`` inside the block, before any
+    await, and they belong to the yielded snapshot (None when reloading is
+    not set up).
+    """
+    snapshot = getattr(state, "brain_snapshot", None)
+    if snapshot is None:
+        yield None
+        return
+    snapshot.users += 1
+    try:
+        yield snapshot
+    finally:
+        await snapshot.release()
+
+
+async def _check_db(db: Database) -> None:
+    try:
+        row = await db.fetchone("PRAGMA quick_check")
+        if row is None or next(iter(row.values())) != "ok":
+            raise BrainSnapshotInvalidError(f"brain.db failed its integrity check: {row}")
+        for table in REQUIRED_TABLES:
+            row = await db.fetchone(f"SELECT COUNT(*) AS n FROM {table}")
+            if not row["n"]:
+                raise BrainSnapshotInvalidError(f"brain.db table {table} is empty")
+    except sqlite3.Error as e:
+        raise BrainSnapshotInvalidError(f"brain.db: {e}") from e
+
+
+def _check_embeddings(new, current) -> None:
+    matrix = new.standard_embeddings
+    if matrix is None:
+        raise BrainSnapshotInvalidError("Standards embeddings not found")
+    if matrix.ndim != 2 or not len(matrix) or len(matrix) != len(new.standard_keys):
+        raise BrainSnapshotInvalidError(
+            f"Standards embeddings malformed: matrix {matrix.shape} for {len(new.standard_keys)} keys")
+    if current.standard_embeddings is not None and matrix.shape[1] != current.standard_embeddings.shape[1]:
+        raise BrainSnapshotInvalidError(
+            f"Standards embeddings are {matrix.shape[1]}-d, the model produces "
+            f"{current.standard_embeddings.shape[1]}-d")
+    if not np.isfinite(matrix).all():
+        raise BrainSnapshotInvalidError("Standards embeddings contain NaN or infinite values")
+
+
+class BrainReloader:
+    """Swaps in a new BrainSnapshot on demand or when the files change.
+
+    Adopts the components already on ``state`` as snapshot 1.
+    """
+
+    def __init__(self, state, db_path: Path = BRAIN_DB_PATH, embeddings_path: Path = EMBEDDINGS_PATH,
+                 interval: float = POLL_INTERVAL):
+        self.state = state
+        self.db_path = Path(db_path)
+        self.embeddings_path = Path(embeddings_path)
+        self.interval = interval
+        self.reloads = 0
+        self.rejected = 0
+        self.last_error: str | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._seen = self._signature()
+        if getattr(state, "brain_snapshot", None) is None:
+            state.brain_snapshot = BrainSnapshot.of(state)
+
+    def _signature(self) -> tuple:
+        """What changes when either file is rewritten (in WAL mode, writes land in brain.db-wal)."""
+        signature = []
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal"), self.embeddings_path):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    async def reload(self) -> dict:
+        """Open, validate and swap in a new snapshot.
+
+        Raises BrainSnapshotInvalidError, leaving the current one in place,
+        if the new database or embeddings fail validation.
+        """
+        async with self._lock:
+            self._seen = self._signature()
+            old = self.state.brain_snapshot
+            t0 = time.monotonic()
+            try:
+                new = await self._open(old.version + 1)
+            except BrainSnapshotInvalidError as e:
+                self.rejected += 1
+                self.last_error = str(e)
+                BRAIN_RELOADS.inc(outcome="rejected")
+                logger.warning("Brain reload rejected, keeping snapshot %d: %s", old.version, e)
+                raise
+            self._swap(new)
+            in_use = old.users
+            await old.retire()
+            self.reloads += 1
+            self.last_error = None
+            BRAIN_RELOADS.inc(outcome="swapped")
+            seconds = time.monotonic() - t0
+            logger.info("Brain snapshot %d swapped in (%.2fs); snapshot %d closes after %d in-flight request(s)",
+                        new.version, seconds, old.version, in_use)
+            return {
+                "version": new.version,
+                "previous_version": old.version,
+                "previous_in_use": in_use,
+                "seconds": round(seconds, 3),
+                "standards_embedded": len(new.embedder.standard_keys) if new.embedder is not None else 0,
+            }
+
+    async def _open(self, version: int) -> BrainSnapshot:
+        try:
+            db = await Database.connect(str(self.db_path))
+        except (FileNotFoundError, sqlite3.Error) as e:
+            raise BrainSnapshotInvalidError(str(e)) from e
+        try:
+            await _check_db(db)
+            embedder = await self._open_embedder()
+        except BaseException:
+            await db.close()
+            raise
+        return BrainSnapshot(version, db, BrainLookup(db), ManufacturingLookup(db), embedder)
+
+    async def _open_embedder(self):
+        current = getattr(self.state, "embedder", None)
+        # No model to reuse (it failed to load), or no embeddings before or after
+        if current is None or (current.standard_embeddings is None and not self.embeddings_path.exists()):
+            return current
+        try:
+            embedder = await asyncio.to_thread(current.reloaded, str(self.embeddings_path))
+        except Exception as e:
+            raise BrainSnapshotInvalidError(f"Standards embeddings: {e}") from e
+        _check_embeddings(embedder, current)
+        return embedder
+
+    def _swap(self, snapshot: BrainSnapshot) -> None:
+        state = self.state
+        state.db = snapshot.db
+        state.brain_lookup = snapshot.brain_lookup
+        state.manufacturing_lookup = snapshot.manufacturing_lookup
+        state.embedder = snapshot.embedder
+        state.brain_snapshot = snapshot
+        # Cached analyses were built from the old standards and tolerances
+        result_cache = getattr(state, "result_cache", None)
+        if result_cache is not None:
+            result_cache.clear()
+        # A brain.db seeded after startup makes the brain available
+        readiness = getattr(state, "readiness", None)
+        if readiness is not None:
+            for name, value in (("brain", snapshot.db), ("embedder", snapshot.embedder)):
+                if value is not None and readiness.components.get(name, {}).get("status") == UNAVAILABLE:
+                    readiness.mark(name, READY)
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self) -> None:
+        changed = False
+        while True:
+            await asyncio.sleep(self.interval)
+            signature = self._signature()
+            if signature != self._seen:
+                # Possibly still being written: reload after a poll without changes
+                self._seen = signature
+                changed = True
+            elif changed:
+                changed = False
+                try:
+                    await self.reload()
+                except BrainSnapshotInvalidError:
+                    pass
+
+    def stats(self) -> dict:
+        snapshot = self.state.brain_snapshot
+        return {
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "in_use": snapshot.users,
+            "reloads": self.reloads,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "poll_interval_s": self.interval,
+        }
@@ -0,0 +1,243 @@
+"""Loading and closing the models, stores and clients the pipeline runs on.
+
+Shared by the API process (api.main) and standalone job workers
+(api.worker), so both run the pipeline against the same components.
+
+The components do not depend on each other, so they load concurrently
+and startup takes about as long as the slowest one (usually the VLM).
+``state.readiness`` tracks each one: routes that need a component still
+loading answer 503, and /api/ready reports the lot, along with the
+model warm-up that follows (api.warmup).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+from models.gemma import OllamaClient, OllamaUnavailableError
+from models.llm_cache import LLMResponseCache
+from models.mlx_vlm_client import MlxVlmClient
+from models.remote_vlm_client import RemoteVlmClient
+from models.embedder import Embedder
+from models.freecad_client import FreecadClient
+from brain.analysis_store import AnalysisStore
+from brain.database import Database
+from brain.lookup import BrainLookup
+from brain.manufacturing import ManufacturingLookup
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DATA_DIR = PROJECT_ROOT / "data"
+VLM_LOAD_TIMEOUT = 120.0
+
+LOADING = "loading"
+READY = "ready"
+# Failed to load: the server runs without it, as before
+UNAVAILABLE = "unavailable"
+WARMING = "warming"
+WARM = "warm"
+COLD = "cold"
+
+# Set in every worker by api.serve: use the shared VLM process instead of loading PaliGemma
+VLM_SERVER_SOCKET_ENV = "VLM_SERVER_SOCKET"
+
+# Read-only components api.serve loads in the parent process before forking
+# the workers, which then share them copy-on-write instead of loading their own
+PRELOADED: dict[str, object] = {}
+
+# What the analysis pipeline reads from app state; requests with an image
+# also need VISION_COMPONENTS, so text-only ones need not wait for the VLM
+PIPELINE_COMPONENTS = ("llm_cache", "ollama", "embedder", "brain", "freecad")
+VISION_COMPONENTS = ("vlm",)
+
+
+class Readiness:
+    """Load status of each named component, updated as loading progresses.
+
+    Also holds the warm-up status of each model once warm-up starts.
+    """
+
+    def __init__(self, names, clock=time.monotonic):
+        self._clock = clock
+        self.started_at = clock()
+        self.components = {name: {"status": LOADING} for name in names}
+        self._settled = {name: asyncio.Event() for name in names}
+        self.warmup: dict[str, dict] = {}
+
+    def mark(self, name: str, status: str, error: str | None = None) -> None:
+        entry = {"status": status, "load_seconds": round(self._clock() - self.started_at, 3)}
+        if error:
+            entry["error"] = error
+        self.components[name] = entry
+        self._settled[name].set()
+
+    def begin_warmup(self, names) -> None:
+        self.warmup = {name: {"status": WARMING} for name in names}
+
+    def mark_warm(self, name: str, seconds: float | None, error: str | None = None) -> None:
+        """Record a finished warm-up: ``seconds`` it took, or the ``error`` that left it cold."""
+        if error:
+            self.warmup[name] = {"status": COLD, "error": error}
+        else:
+            self.warmup[name] = {"status": WARM, "seconds": round(seconds, 3)}
+
+    def loading(self, *names: str) -> list[str]:
+        """The components among ``names`` (default: all) that have not finished loading."""
+        return [name for name in names or self.components if self.components[name]["status"] == LOADING]
+
+    async def wait(self, *names: str) -> None:
+        await asyncio.gather(*(self._settled[name].wait() for name in names or self.components))
+
+    def report(self) -> dict:
+        warming = any(w["status"] == WARMING for w in self.warmup.values())
+        return {
+            "ready": not self.loading() and not warming,
+            "components": dict(self.components),
+            "warmup": dict(self.warmup),
+        }
+
+
+async def _load_llm_cache(state) -> str:
+    state.llm_cache = await LLMResponseCache.open(str(DATA_DIR / "llm_cache.db"))
+    state.ollama.cache = state.llm_cache
+    return READY
+
+
+async def _load_ollama(state) -> str:
+    await state.ollama.health_check()
+    print("Ollama connected, models available")
+    try:
+        print(f"Ollama resident models: {await state.ollama.refresh_residency()}")
+    except OllamaUnavailableError as e:
+        print(f"WARNING: Ollama resident models unknown: {e}")
+    return READY
+
+
+async def _load_analysis_store(state) -> str:
+    state.analysis_store = await AnalysisStore.open(str(DATA_DIR / "analyses.db"))
+    return READY
+
+
+async def _load_vlm(state) -> str:
+    socket_path = os.environ.get(VLM_SERVER_SOCKET_ENV)
+    if socket_path:
+        vlm = RemoteVlmClient(socket_path)
+        try:
+            await vlm.wait_until_loaded(VLM_LOAD_TIMEOUT)
+        except Exception:
+            await vlm.close()
+            raise
+        state.vlm = vlm
+        print(f"mlx-vlm: using the shared VLM server at {socket_path}")
+        return READY
+    vlm = MlxVlmClient()
+    print("Loading mlx-vlm model (paligemma2-3b-mix-224-4bit)...")
+    try:
+        await asyncio.wait_for(asyncio.to_thread(vlm.load), timeout=VLM_LOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"mlx-vlm load timed out ({VLM_LOAD_TIMEOUT:.0f}s)") from None
+    state.vlm = vlm
+    print("mlx-vlm loaded: paligemma2-3b-mix-224-4bit")
+    return READY
+
+
+async def _load_embedder(state) -> str:
+    if "embedder" in PRELOADED:
+        state.embedder = PRELOADED["embedder"]
+        return READY
+    embedder = Embedder()
+    await asyncio.to_thread(embedder.load, str(DATA_DIR / "embeddings" / "standards_embeddings.npz"))
+    state.embedder = embedder
+    return READY
+
+
+async def _load_brain(state) -> str:
+    db = await Database.connect(str(DATA_DIR / "brain.db"))
+    state.brain_lookup = BrainLookup(db)
+    state.manufacturing_lookup = ManufacturingLookup(db)
+    state.db = db
+    return READY
+
+
+async def _load_freecad(state) -> str:
+    try:
+        connected = await state.freecad.health_check()
+    except Exception:
+        connected = False
+    if connected:
+        print("FreeCAD RPC: connected")
+    else:
+        state.freecad._mock_mode = True
+        print("FreeCAD RPC: using mock data (demo mode)")
+    # Mock mode still serves the pipeline
+    return READY
+
+
+LOADERS = {
+    "llm_cache": _load_llm_cache,
+    "ollama": _load_ollama,
+    "analysis_store": _load_analysis_store,
+    "vlm": _load_vlm,
+    "embedder": _load_embedder,
+    "brain": _load_brain,
+    "freecad": _load_freecad,
+}
+
+
+def init_components(state) -> Readiness:
+    """Set every component to its not-loaded value so routes can run while loading."""
+    state.llm_cache = None
+    state.ollama = OllamaClient()
+    state.analysis_store = None
+    state.vlm = None
+    state.embedder = None
+    state.brain_lookup = None
+    state.manufacturing_lookup = None
+    state.db = None
+    state.freecad = FreecadClient()
+    state.readiness = Readiness(LOADERS)
+    return state.readiness
+
+
+async def _load(state, name: str) -> None:
+    readiness = state.readiness
+    try:
+        readiness.mark(name, await LOADERS[name](state))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"WARNING: {name} unavailable: {e}")
+        readiness.mark(name, UNAVAILABLE, str(e))
+
+
+async def load_components(state) -> None:
+    """Populate ``state`` with every pipeline component, loading them concurrently.
+
+    Components that fail to load are left as None (Ollama and FreeCAD keep
+    their clients). Call init_components first to serve requests meanwhile;
+    otherwise it is called here.
+    """
+    if getattr(state, "readiness", None) is None:
+        init_components(state)
+    await asyncio.gather(*(_load(state, name) for name in LOADERS))
+    readiness = state.readiness
+    logger.info("Components loaded in %.1fs: %s", time.monotonic() - readiness.started_at,
+                ", ".join(f"{name}={c['status']} ({c['load_seconds']:.1f}s)"
+                          for name, c in readiness.components.items()))
+
+
+async def close_components(state) -> None:
+    await state.ollama.close()
+    if isinstance(getattr(state, "vlm", None), RemoteVlmClient):
+        await state.vlm.close()
+    if getattr(state, "llm_cache", None):
+        await state.llm_cache.close()
+    if getattr(state, "analysis_store", None):
+        await state.analysis_store.close()
+    if getattr(state, "freecad", None):
+        await state.freecad.close()
+    if getattr(state, "db", None):
+        await state.db.close()
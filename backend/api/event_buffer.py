@@ -0,0 +1,113 @@
+"""Decoupling pipeline progress from how fast a client reads the stream.
+
+``buffered(source)`` runs the event source in its own task, writing into
+a bounded EventBuffer that the response drains. Every /api/analyze and
+/api/analysis/{id}/events stream goes through one; its source is the
+client's subscription to the shared run (api.singleflight), or the
+pipeline itself when runs are not shared. A slow client therefore never
+pauses the pipeline between stages. When a ``progress`` event
+has waited undelivered for longer than PROGRESS_COALESCE_AFTER, the
+client is behind and a newer progress event replaces it, since only the
+latest step matters to it. Other events are never dropped: if the buffer
+fills with them, the producer (that client's feed, not the shared run)
+waits, and that wait is counted as stalled time.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import aclosing
+
+from models.metrics import SSE_COALESCED, SSE_PENDING_EVENTS, SSE_PRODUCER_STALL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = int(os.environ.get("SSE_BUFFER_SIZE", "64"))
+# Seconds an undelivered progress event may wait before a newer one replaces it
+PROGRESS_COALESCE_AFTER = 0.25
+
+
+class EventBuffer:
+    """Bounded FIFO of events between one producer and one consumer."""
+
+    def __init__(self, maxsize: int = DEFAULT_BUFFER_SIZE, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.closed = False
+        self.coalesced = 0
+        self.stalled_s = 0.0
+        self._clock = clock
+        # (event, time it was queued)
+        self._events: deque[tuple[dict, float]] = deque()
+        self._changed = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    async def put(self, event: dict) -> None:
+        async with self._changed:
+            if event["event"] == "progress":
+                self._drop_stale_progress()
+            if len(self._events) >= self.maxsize:
+                t0 = time.monotonic()
+                await self._changed.wait_for(lambda: len(self._events) < self.maxsize)
+                stalled = time.monotonic() - t0
+                self.stalled_s += stalled
+                SSE_PRODUCER_STALL.inc(stalled)
+            self._events.append((event, self._clock()))
+            self._changed.notify_all()
+
+    def _drop_stale_progress(self) -> None:
+        stale_before = self._clock() - PROGRESS_COALESCE_AFTER
+        for queued in [q for q in self._events if q[0]["event"] == "progress" and q[1] <= stale_before]:
+            self._events.remove(queued)
+            self.coalesced += 1
+            SSE_COALESCED.inc()
+
+    async def close(self) -> None:
+        async with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    async def get(self) -> dict | None:
+        """The next event, or None once the buffer is closed and drained."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._events or self.closed)
+            if not self._events:
+                return None
+            event, _ = self._events.popleft()
+            SSE_PENDING_EVENTS.observe(len(self._events))
+            self._changed.notify_all()
+            return event
+
+
+async def buffered(source, maxsize: int = DEFAULT_BUFFER_SIZE, clock=time.monotonic):
+    """Yield ``source``'s events, producing them in a separate task through an EventBuffer.
+
+    Closing this generator cancels the producer (and with it the source);
+    an exception raised by the source is re-raised after the events before
+    it have been delivered.
+    """
+    buffer = EventBuffer(maxsize, clock=clock)
+
+    async def produce():
+        try:
+            async with aclosing(source) as events:
+                async for event in events:
+                    await buffer.put(event)
+        finally:
+            await buffer.close()
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (event := await buffer.get()) is not None:
+            yield event
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        if buffer.coalesced or buffer.stalled_s:
+            logger.info("Stream delivery: %d progress events coalesced, producer stalled %.0fms",
+                        buffer.coalesced, buffer.stalled_s * 1000)
@@ -0,0 +1,345 @@
+"""Queue backends for the asynchronous job API.
+
+Every backend stores each job's record (status, request, result events)
+and hands queued jobs to workers one at a time:
+
+    await queue.submit(job_id, request_json)
+    claimed = await queue.claim(worker_id, timeout)   # (job_id, request_json) or None
+    await queue.finish(job_id, status, events, error)
+    record = await queue.get(job_id)
+
+``InProcessJobQueue`` lives and dies with the API process.
+``SQLiteJobQueue`` survives restarts and can be shared by workers on the
+same machine. ``RespJobQueue`` talks the Redis protocol, to Redis or to
+the ``api.resp`` stand-in, so workers can run on other machines. With
+both, a job whose worker died is handed out again once its lease runs
+out, up to ``max_attempts`` claims in all; a job that keeps killing its
+workers is then marked as an error instead of blocking the queue.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+import aiosqlite
+
+from .resp import RespConnection
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+ERROR = "error"
+
+DEFAULT_LEASE_SECONDS = 600.0
+DEFAULT_POLL_INTERVAL = 0.2
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _record(job_id: str, status: str, request: str, created_at: float, started_at: float | None = None,
+            finished_at: float | None = None, worker: str | None = None, error: str | None = None,
+            events: str | None = None, attempts: int = 0) -> dict:
+    return {
+        "job_id": job_id,
+        "status": status,
+        "request": json.loads(request),
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "worker": worker,
+        "attempts": int(attempts),
+        "error": error,
+        "events": json.loads(events) if events else None,
+    }
+
+
+def _abandoned_error(attempts: int) -> str:
+    return f"Job abandoned: its worker stopped responding on all {attempts} attempts"
+
+
+class InProcessJobQueue:
+    backend = "memory"
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._jobs: dict[str, dict] = {}
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+
+    async def submit(self, job_id: str, request_json: str) -> None:
+        self._jobs[job_id] = {"job_id": job_id, "status": QUEUED, "request": request_json,
+                              "created_at": self._clock()}
+        self._queue.put_nowait(job_id)
+
+    async def claim(self, worker_id: str, timeout: float) -> tuple[str, str] | None:
+        try:
+            job_id = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        job = self._jobs[job_id]
+        job.update(status=RUNNING, worker=worker_id, started_at=self._clock(), attempts=job.get("attempts", 0) + 1)
+        return job_id, job["request"]
+
+    async def finish(self, job_id: str, status: str, events: list[dict], error: str | None = None) -> None:
+        self._jobs[job_id].update(status=status, events=json.dumps(events), error=error,
+                                  finished_at=self._clock())
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        return _record(**job) if job else None
+
+    async def stats(self) -> dict:
+        return {"backend": self.backend, "queued": self._queue.qsize(), "jobs": len(self._jobs)}
+
+    async def close(self) -> None:
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    error TEXT,
+    events TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+class SQLiteJobQueue:
+    backend = "sqlite"
+
+    def __init__(self, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 clock=time.time):
+        self.conn: aiosqlite.Connection | None = None
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._clock = clock
+
+    @classmethod
+    async def open(cls, path: str, **kwargs) -> "SQLiteJobQueue":
+        queue = cls(**kwargs)
+        queue.conn = await aiosqlite.connect(path)
+        async with queue.conn.execute("PRAGMA journal_mode=WAL"):
+            pass
+        # Other worker processes write to the same file
+        async with queue.conn.execute("PRAGMA busy_timeout=5000"):
+            pass
+        await queue.conn.executescript(SQLITE_SCHEMA)
+        await queue.conn.commit()
+        return queue
+
+    async def submit(self, job_id: str, request_json: str) -> None:
+        await self.conn.execute(
+            "INSERT INTO jobs (job_id, status, request, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, QUEUED, request_json, self._clock()),
+        )
+        await self.conn.commit()
+
+    async def claim(self, worker_id: str, timeout: float) -> tuple[str, str] | None:
+        give_up = time.monotonic() + timeout
+        while True:
+            now = self._clock()
+            expired = now - self.lease_seconds
+            async with self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE status = ? AND started_at < ? AND attempts >= ? RETURNING job_id, worker",
+                (ERROR, _abandoned_error(self.max_attempts), now, RUNNING, expired, self.max_attempts),
+            ) as cursor:
+                for job_id, worker in await cursor.fetchall():
+                    logger.error("Job %s lease expired on worker %s after %d attempts, giving up",
+                                 job_id, worker, self.max_attempts)
+            # One statement, so two workers can never claim the same job
+            async with self.conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started_at = ?, attempts = attempts + 1 WHERE job_id = ("
+                "  SELECT job_id FROM jobs WHERE status = ? OR (status = ? AND started_at < ? AND attempts < ?)"
+                "  ORDER BY created_at LIMIT 1"
+                ") RETURNING job_id, request",
+                (RUNNING, worker_id, now, QUEUED, RUNNING, expired, self.max_attempts),
+            ) as cursor:
+                row = await cursor.fetchone()
+            await self.conn.commit()
+            if row is not None:
+                return row[0], row[1]
+            if time.monotonic() >= give_up:
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    async def finish(self, job_id: str, status: str, events: list[dict], error: str | None = None) -> None:
+        await self.conn.execute(
+            "UPDATE jobs SET status = ?, events = ?, error = ?, finished_at = ? WHERE job_id = ?",
+            (status, json.dumps(events), error, self._clock(), job_id),
+        )
+        await self.conn.commit()
+
+    async def get(self, job_id: str) -> dict | None:
+        async with self.conn.execute(
+            "SELECT job_id, status, request, created_at, started_at, finished_at, worker, error, events, "
+            "attempts FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ) as cursor:
+            row = await cursor.fetchone()
+        return _record(*row) if row else None
+
+    async def stats(self) -> dict:
+        async with self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)) as cursor:
+            queued = (await cursor.fetchone())[0]
+        return {"backend": self.backend, "queued": queued}
+
+    async def close(self) -> None:
+        if self.conn:
+            await self.conn.close()
+
+
+class RespJobQueue:
+    """Jobs in Redis: a queue list, a hash per job, and a processing list per worker.
+
+    ``claim`` moves a job id atomically from the queue to the worker's
+    processing list (BRPOPLPUSH), so a worker dying at any point leaves
+    it there. Before claiming, workers requeue jobs that have sat in any
+    processing list for longer than the lease, or give up on them once
+    they have been claimed ``max_attempts`` times.
+    """
+
+    backend = "resp"
+    QUEUE_KEY = "toleranceai:jobs:queued"
+    PROCESSING_KEY = "toleranceai:jobs:processing:{}"
+    # Worker id -> time of its last claim, so reapers know which processing lists to check
+    WORKERS_KEY = "toleranceai:jobs:workers"
+    JOB_KEY = "toleranceai:job:{}"
+
+    def __init__(self, conn: RespConnection, host: str = "127.0.0.1", port: int = 6379,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 clock=time.time):
+        self._conn = conn
+        self._host = host
+        self._port = port
+        # BRPOPLPUSH holds its connection until a job arrives, so each worker
+        # slot waits on its own
+        self._blocking: dict[str, RespConnection] = {}
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._clock = clock
+        # job id -> the worker that claimed it through this queue
+        self._claimed: dict[str, str] = {}
+
+    @classmethod
+    async def open(cls, host: str = "127.0.0.1", port: int = 6379, **kwargs) -> "RespJobQueue":
+        conn = await RespConnection.open(host, port)
+        await conn.execute("PING")
+        return cls(conn, host, port, **kwargs)
+
+    async def submit(self, job_id: str, request_json: str) -> None:
+        await self._conn.execute("HSET", self.JOB_KEY.format(job_id), "job_id", job_id, "status", QUEUED,
+                                 "request", request_json, "created_at", self._clock())
+        await self._conn.execute("LPUSH", self.QUEUE_KEY, job_id)
+
+    async def _requeue_expired(self) -> None:
+        now = self._clock()
+        workers = await self._conn.execute("HGETALL", self.WORKERS_KEY)
+        for worker in workers[::2]:
+            processing = self.PROCESSING_KEY.format(worker)
+            for job_id in await self._conn.execute("LRANGE", processing, 0, -1):
+                key = self.JOB_KEY.format(job_id)
+                started_at = await self._conn.execute("HGET", key, "started_at")
+                if started_at is None:
+                    # Its worker died between the move and marking it running: lease from now
+                    await self._conn.execute("HSETNX", key, "started_at", now)
+                    continue
+                if now - float(started_at) < self.lease_seconds:
+                    continue
+                # Only the reaper whose LREM removed it requeues it
+                if not await self._conn.execute("LREM", processing, 1, job_id):
+                    continue
+                attempts = int(await self._conn.execute("HGET", key, "attempts") or 0)
+                if attempts >= self.max_attempts:
+                    logger.error("Job %s lease expired on worker %s after %d attempts, giving up",
+                                 job_id, worker, attempts)
+                    await self._conn.execute("HSET", key, "status", ERROR, "error", _abandoned_error(attempts),
+                                             "finished_at", now)
+                else:
+                    logger.warning("Job %s lease expired on worker %s, requeueing", job_id, worker)
+                    await self._conn.execute("HSET", key, "status", QUEUED)
+                    # The right end is popped next: it goes ahead of newer jobs
+                    await self._conn.execute("RPUSH", self.QUEUE_KEY, job_id)
+
+    async def claim(self, worker_id: str, timeout: float) -> tuple[str, str] | None:
+        await self._requeue_expired()
+        await self._conn.execute("HSET", self.WORKERS_KEY, worker_id, self._clock())
+        blocking = self._blocking.get(worker_id)
+        if blocking is None:
+            blocking = self._blocking[worker_id] = await RespConnection.open(self._host, self._port)
+        try:
+            # Whole seconds: the timeout argument is an integer on older Redis versions
+            job_id = await blocking.execute("BRPOPLPUSH", self.QUEUE_KEY, self.PROCESSING_KEY.format(worker_id),
+                                            max(1, round(timeout)))
+        except BaseException:
+            # Cancelled or failed mid-command: its reply may still arrive, so the
+            # connection cannot be reused
+            del self._blocking[worker_id]
+            await blocking.close()
+            raise
+        if job_id is None:
+            return None
+        self._claimed[job_id] = worker_id
+        key = self.JOB_KEY.format(job_id)
+        await self._conn.execute("HSET", key, "status", RUNNING, "worker", worker_id,
+                                 "started_at", self._clock())
+        await self._conn.execute("HINCRBY", key, "attempts", 1)
+        return job_id, await self._conn.execute("HGET", key, "request")
+
+    async def finish(self, job_id: str, status: str, events: list[dict], error: str | None = None) -> None:
+        fields = ["status", status, "events", json.dumps(events), "finished_at", self._clock()]
+        if error is not None:
+            fields += ["error", error]
+        key = self.JOB_KEY.format(job_id)
+        await self._conn.execute("HSET", key, *fields)
+        worker = self._claimed.pop(job_id, None) or await self._conn.execute("HGET", key, "worker")
+        if worker is not None:
+            await self._conn.execute("LREM", self.PROCESSING_KEY.format(worker), 1, job_id)
+
+    async def get(self, job_id: str) -> dict | None:
+        flat = await self._conn.execute("HGETALL", self.JOB_KEY.format(job_id))
+        if not flat:
+            return None
+        fields = dict(zip(flat[::2], flat[1::2]))
+        for name in ("created_at", "started_at", "finished_at"):
+            if name in fields:
+                fields[name] = float(fields[name])
+        return _record(**fields)
+
+    async def stats(self) -> dict:
+        return {"backend": self.backend, "queued": await self._conn.execute("LLEN", self.QUEUE_KEY)}
+
+    async def close(self) -> None:
+        await self._conn.close()
+        for blocking in self._blocking.values():
+            await blocking.close()
+        self._blocking.clear()
+
+
+async def open_job_queue(url: str | None = None):
+    """Open the backend named by ``url`` (default: the JOB_QUEUE_URL env var, else in-process).
+
+    ``memory://``, ``sqlite:///path/to/jobs.db`` or ``redis://host:port``.
+    """
+    url = url or os.environ.get("JOB_QUEUE_URL", "memory://")
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return InProcessJobQueue()
+    if parsed.scheme == "sqlite":
+        return await SQLiteJobQueue.open(parsed.path)
+    if parsed.scheme in ("redis", "resp"):
+        return await RespJobQueue.open(parsed.hostname or "127.0.0.1", parsed.port or 6379)
+    raise ValueError(f"Unknown job queue backend: {url!r}")
@@ -0,0 +1,97 @@
+"""Workers that run queued analysis jobs through the pipeline.
+
+A job runs exactly what POST /api/analyze would run for the same request;
+its events are collected instead of streamed and stored on the queue as
+the job's result. The job id doubles as the analysis id, so finished jobs
+also appear in the analysis history.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+
+from .job_queues import COMPLETE, ERROR
+from .pipeline import record_result, run_pipeline
+from .result_cache import request_hash
+from .schemas import AnalyzeRequest
+from models.metrics import JOBS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKERS", "1"))
+CLAIM_TIMEOUT = 1.0
+
+
+class JobWorker:
+    """Claims jobs from ``queue`` and runs up to ``concurrency`` of them at a time."""
+
+    def __init__(self, state, queue, concurrency: int = DEFAULT_WORKER_CONCURRENCY, name: str | None = None):
+        self.state = state
+        self.queue = queue
+        self.concurrency = concurrency
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self.failed = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._loop(f"{self.name}/{i}")) for i in range(self.concurrency)
+        ]
+        logger.info("Job worker %s started (%d slots, %s queue)", self.name, self.concurrency, self.queue.backend)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run(self) -> None:
+        """Run until cancelled."""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    async def _loop(self, slot: str) -> None:
+        while True:
+            try:
+                claimed = await self.queue.claim(slot, timeout=CLAIM_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Job claim failed on %s: %s", slot, e)
+                await asyncio.sleep(CLAIM_TIMEOUT)
+                continue
+            if claimed is not None:
+                await self.run_job(*claimed)
+
+    async def run_job(self, job_id: str, request_json: str) -> None:
+        """Run one claimed job and record its outcome on the queue."""
+        logger.info("Job %s started on %s", job_id, self.name)
+        events: list[dict] = []
+        error = None
+        try:
+            body = AnalyzeRequest.model_validate_json(request_json)
+            async for event in record_result(run_pipeline(self.state, body, job_id), self.state, body,
+                                             request_hash(body), job_id):
+                events.append(event)
+            if events and events[-1]["event"] == "error":
+                error = json.loads(events[-1]["data"]).get("error")
+        except Exception as e:
+            logger.error("Job %s failed: %s", job_id, e, exc_info=True)
+            error = f"Job failed: {e}"
+        status = ERROR if error else COMPLETE
+        await self.queue.finish(job_id, status, events, error)
+        JOBS.inc(status=status)
+        if error:
+            self.failed += 1
+        else:
+            self.completed += 1
+        logger.info("Job %s finished: %s", job_id, status)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "slots": self.concurrency, "completed": self.completed, "failed": self.failed}
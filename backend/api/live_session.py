@@ -0,0 +1,212 @@
+"""Live capture: a stream of frames from one client, re-analysed as they change.
+
+A LiveSession remembers the last frame it analysed (by its difference
+hash, as the VLM frame cache compares frames) and the stage values of the
+last run. A new frame goes to the VLM only if its hash differs enough
+from that one. When a frame,
+the description or the CAD context changes, only the stages that depend
+on what changed run again; everything upstream is reused.
+"""
+
+import asyncio
+import base64
+import binascii
+import json
+import logging
+from contextlib import aclosing
+
+from PIL import UnidentifiedImageError
+from pydantic import ValidationError
+
+from .brain_reload import pinned
+from .components import VISION_COMPONENTS
+from .event_buffer import buffered
+from .pipeline import DEFAULT_DEADLINE_MS, build_stages, deadline_at, run_graph
+from .schemas import AnalyzeRequest
+from .stage_graph import StageGraph
+from models.frame_cache import LIVE_MAX_DISTANCE, dhash, hamming
+from models.metrics import LIVE_FRAMES
+
+logger = logging.getLogger(__name__)
+
+# The value each kind of change invalidates; everything computed from it is re-run.
+FRAME_VALUE = "vision_description"
+DESCRIPTION_VALUE = "vision_features"
+CAD_VALUE = "cad_context_raw"
+# Settings that change the shape of the graph itself
+GRAPH_SETTINGS = ("compare", "multi_feature")
+
+
+def _message(event_type: str, data: dict) -> dict:
+    return {"event": event_type, "data": data}
+
+
+class LiveSession:
+    """Per-connection state for /api/live.
+
+    Each client message may carry a new frame (``image_base64``) and any
+    AnalyzeRequest field; fields that are left out keep their last value.
+    """
+
+    def __init__(self, state, max_distance: int = LIVE_MAX_DISTANCE):
+        self.state = state
+        # Hash bits a frame may differ by and still count as unchanged: the
+        # same bound under which the VLM frame cache reuses a description
+        self.max_distance = max_distance
+        self.request: AnalyzeRequest | None = None
+        self.frames = 0
+        self.analyzed = 0
+        self.skipped = 0
+        self.superseded = 0
+        self._frame_hash: int | None = None
+        self._values: dict = {}
+
+    async def serve(self, receive, send) -> None:
+        """Analyse messages from ``receive()`` and push events through ``send(event)``.
+
+        Messages that arrive while an analysis is running are not queued: only
+        the newest is kept and handled next. Returns (or raises) when
+        ``receive`` does, cancelling any analysis still running.
+        """
+        latest: dict | None = None
+        ready = asyncio.Event()
+
+        async def read():
+            nonlocal latest
+            while True:
+                message = await receive()
+                if latest is not None:
+                    self.superseded += 1
+                    LIVE_FRAMES.inc(outcome="superseded")
+                latest = message
+                ready.set()
+
+        reader = asyncio.create_task(read())
+        analysis: asyncio.Task | None = None
+        try:
+            while True:
+                waiter = asyncio.ensure_future(ready.wait())
+                await asyncio.wait({waiter, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if reader.done():
+                    waiter.cancel()
+                    reader.result()
+                    return
+                ready.clear()
+                message, latest = latest, None
+                analysis = asyncio.create_task(self._forward(message, send))
+                await asyncio.wait({analysis, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if not analysis.done():
+                    logger.info("Live session closed mid-analysis, cancelling it")
+                    continue
+                analysis.result()
+        finally:
+            for task in (reader, analysis):
+                if task is not None and not task.done():
+                    task.cancel()
+            await asyncio.gather(*(t for t in (reader, analysis) if t is not None), return_exceptions=True)
+
+    async def _forward(self, message: dict, send) -> None:
+        async with aclosing(buffered(self.process(message))) as events:
+            async for event in events:
+                await send(event)
+
+    async def process(self, message: dict):
+        """Yield the events for one client message.
+
+        Either ``frame_skipped`` (nothing changed enough to re-run), or
+        ``frame_accepted`` followed by the pipeline's events, payloads decoded.
+        """
+        self.frames += 1
+        frame = self.frames
+        fields = self.request.model_dump() if self.request else {}
+        fields.update({k: v for k, v in message.items() if k in AnalyzeRequest.model_fields})
+        try:
+            request = AnalyzeRequest.model_validate(fields)
+            frame_hash = self._frame_hash
+            if request.image_base64 and (self.request is None or request.image_base64 != self.request.image_base64):
+                image_bytes = base64.b64decode(request.image_base64, validate=True)
+                frame_hash = await asyncio.to_thread(dhash, image_bytes)
+        except (ValidationError, binascii.Error, UnidentifiedImageError, OSError) as e:
+            yield _message("error", {"error": f"Invalid frame: {e}", "layer": "live", "frame": frame})
+            return
+        readiness = getattr(self.state, "readiness", None)
+        loading = readiness.loading(*VISION_COMPONENTS) if readiness is not None and request.image else []
+        if loading:
+            yield _message("error", {"error": f"Still loading: {', '.join(loading)}", "layer": "live",
+                                     "frame": frame})
+            return
+
+        changed, distance = self._changes(request, frame_hash)
+        if not changed:
+            self.skipped += 1
+            LIVE_FRAMES.inc(outcome="skipped")
+            yield _message("frame_skipped", {"frame": frame, "distance": distance})
+            return
+        if changed.isdisjoint({"*", FRAME_VALUE}):
+            # The frame did not change enough: keep analysing the last accepted one
+            request = request.model_copy(update={"image_base64": self.request.image_base64})
+        else:
+            self._frame_hash = frame_hash
+
+        # A brain reload mid-analysis leaves this frame on the snapshot it started with
+        async with pinned(self.state):
+            deadline_ms = request.deadline_ms or DEFAULT_DEADLINE_MS
+            graph = StageGraph(build_stages(self.state, request, frame_max_distance=self.max_distance),
+                               deadline=deadline_at(deadline_ms))
+            stale = graph.downstream(changed) if changed != {"*"} else set(self._values)
+            initial = {name: value for name, value in self._values.items() if name not in stale}
+            rerun = [s.name for s in graph.stages if not (s.outputs and all(n in initial for n in s.outputs))]
+            self.request = request
+            self.analyzed += 1
+            LIVE_FRAMES.inc(outcome="analyzed")
+            logger.info("Live frame %d: distance=%s re-running %s", frame, distance, rerun)
+            yield _message("frame_accepted", {
+                "frame": frame,
+                "distance": distance,
+                "rerun": rerun,
+                "reused": sorted(initial),
+            })
+
+            last = None
+            self._values = {}
+            async with aclosing(run_graph(graph, request, initial=initial)) as events:
+                async for event in events:
+                    last = event
+                    yield _message(event["event"], json.loads(event["data"]))
+            if last is not None and last["event"] == "analysis_complete":
+                degraded = {name for d in graph.degradations
+                            for s in graph.stages if s.name == d["stage"] for name in s.outputs}
+                # Fallback outputs only stood in for this run's deadline
+                stale = graph.downstream(degraded)
+                self._values = {name: value for name, value in graph.values.items() if name not in stale}
+
+    def _changes(self, request: AnalyzeRequest, frame_hash: int | None) -> tuple[set[str], int | None]:
+        """The values invalidated by ``request`` ({"*"} for everything), and the frame's hash distance."""
+        previous = self.request
+        distance = None
+        if previous is not None and frame_hash is not None and self._frame_hash is not None:
+            distance = hamming(frame_hash, self._frame_hash)
+        if previous is None or not self._values or any(
+            getattr(request, name) != getattr(previous, name) for name in GRAPH_SETTINGS
+        ):
+            return {"*"}, distance
+
+        changed = set()
+        if frame_hash is not None and (self._frame_hash is None or distance > self.max_distance):
+            changed.add(FRAME_VALUE)
+        if request.description != previous.description:
+            changed.add(DESCRIPTION_VALUE)
+        if request.cad_context != previous.cad_context:
+            changed.add(CAD_VALUE)
+        elif request.cad_context is None and FRAME_VALUE in changed:
+            # Read live from FreeCAD: a new view may mean the part was edited
+            changed.add(CAD_VALUE)
+        return changed, distance
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "analyzed": self.analyzed,
+            "skipped": self.skipped,
+            "superseded": self.superseded,
+        }
@@ -1,89 +1,67 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
 
-PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-DATA_DIR = PROJECT_ROOT / "data"
-
+from .brain_reload import BrainReloader
+from .components import close_components, init_components, load_components
+from .job_queues import open_job_queue
+from .jobs import DEFAULT_WORKER_CONCURRENCY, JobWorker
+from .result_cache import AnalysisResultCache
 from .routes import router
-from models.gemma import OllamaClient
-from models.mlx_vlm_client import MlxVlmClient
-from models.embedder import Embedder
-from models.freecad_client import FreecadClient
-from brain.database import Database
-from brain.lookup import BrainLookup
-from brain.manufacturing import ManufacturingLookup
+from .singleflight import SingleFlight
+from .warmup import WARMUP_ENABLED, ModelWarmer
+
+
+async def _start(app: FastAPI) -> None:
+    """Load the components, start running queued jobs on them and warm the models up."""
+    await load_components(app.state)
+    app.state.brain_reloader = BrainReloader(app.state)
+    app.state.brain_reloader.start()
+    # JOB_WORKERS=0 leaves the jobs to standalone workers (python -m api.worker)
+    if app.state.job_queue is not None and DEFAULT_WORKER_CONCURRENCY > 0:
+        app.state.job_worker = JobWorker(app.state, app.state.job_queue)
+        app.state.job_worker.start()
+    if WARMUP_ENABLED:
+        app.state.model_warmer = ModelWarmer(app.state)
+        await app.state.model_warmer.warm_up()
+        app.state.model_warmer.start()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Startup ---
-    app.state.ollama = OllamaClient()
-
-    app.state.vlm = MlxVlmClient()
-    try:
-        print("Loading mlx-vlm model (paligemma2-3b-mix-224-4bit)...")
-        await asyncio.wait_for(
-            asyncio.to_thread(app.state.vlm.load),
-            timeout=120.0,
-        )
-        print("mlx-vlm loaded: paligemma2-3b-mix-224-4bit")
-    except asyncio.TimeoutError:
-        print("WARNING: mlx-vlm load timed out (120s) -- running without VLM")
-        app.state.vlm = None
-    except Exception as e:
-        print(f"WARNING: mlx-vlm failed to load: {e}")
-        app.state.vlm = None
-
-    app.state.embedder = Embedder()
+    # Components load in the background; see /api/ready
+    init_components(app.state)
+    app.state.result_cache = AnalysisResultCache()
+    app.state.flights = SingleFlight()
+    app.state.job_worker = None
+    app.state.model_warmer = None
+    app.state.brain_reloader = None
     try:
-        app.state.embedder.load(str(DATA_DIR / "embeddings" / "standards_embeddings.npz"))
+        app.state.job_queue = await open_job_queue()
     except Exception as e:
-        print(f"WARNING: Embedder failed to load: {e}")
-        app.state.embedder = None
-
-    try:
-        db = await Database.connect(str(DATA_DIR / "brain.db"))
-        app.state.brain_lookup = BrainLookup(db)
-        app.state.manufacturing_lookup = ManufacturingLookup(db)
-        app.state.db = db
-    except FileNotFoundError as e:
-        print(f"WARNING: {e}")
-        app.state.brain_lookup = None
-        app.state.manufacturing_lookup = None
-        app.state.db = None
-
-    try:
-        await app.state.ollama.health_check()
-        print("Ollama connected, models available")
-    except Exception as e:
-        print(f"WARNING: Ollama not available: {e}")
-
-    app.state.freecad = FreecadClient()
-    try:
-        connected = await app.state.freecad.health_check()
-        if connected:
-            print("FreeCAD RPC: connected")
-        else:
-            app.state.freecad._mock_mode = True
-            print("FreeCAD RPC: using mock data (demo mode)")
-    except Exception:
-        app.state.freecad._mock_mode = True
-        print("FreeCAD RPC: using mock data (demo mode)")
+        print(f"WARNING: Job queue unavailable: {e}")
+        app.state.job_queue = None
+    startup = asyncio.create_task(_start(app))
 
     yield
 
     # --- Shutdown ---
-    await app.state.ollama.close()
-    if getattr(app.state, "freecad", None):
-        await app.state.freecad.close()
-    if getattr(app.state, "db", None):
-        await app.state.db.close()
+    startup.cancel()
+    await asyncio.gather(startup, return_exceptions=True)
+    if app.state.model_warmer is not None:
+        await app.state.model_warmer.stop()
+    if app.state.brain_reloader is not None:
+        await app.state.brain_reloader.stop()
+    if app.state.job_worker is not None:
+        await app.state.job_worker.stop()
+    if app.state.job_queue is not None:
+        await app.state.job_queue.close()
+    await close_components(app.state)
 
 
 app = FastAPI(
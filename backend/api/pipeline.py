@@ -0,0 +1,804 @@
+"""The five-layer analysis pipeline, expressed as a stage graph.
+
+``run_pipeline`` is shared by the /api/analyze route and anything else that
+needs the same SSE event sequence for an AnalyzeRequest.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from uuid import uuid4
+
+from .brain_reload import pinned
+from .schemas import AnalyzeRequest
+from .stage_graph import Stage, StageGraph, StageTimeoutError
+from .streaming import sse_event, sse_error, sse_progress
+from models.gemma import OllamaUnavailableError, OllamaParseError
+from models.mlx_vlm_client import MlxVlmTimeoutError, MlxVlmUnavailableError
+from models.ollama_scheduler import OllamaQueueFullError, PRIORITY_BACKGROUND, request_priority
+from models.freecad_client import FreecadConnectionError
+from models.metrics import ERRORS, LAYER_LATENCY, PIPELINE_LATENCY, PIPELINES_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+CAD_GEOMETRY_KEYS = ("diameter", "radius", "length", "width", "height", "depth", "angle")
+FINETUNED_MODEL = "gemma3:1b"
+BASE_MODEL = "gemma3:1b"
+MULTI_FEATURE_CONCURRENCY = 4
+
+# Unavailability is retried with backoff (and circuit-broken) inside
+# OllamaClient; stages only retry output that failed to parse.
+LLM_RETRY_ON = (OllamaParseError,)
+LLM_ERRORS = (OllamaParseError, OllamaUnavailableError)
+CAD_STAGE_TIMEOUT = 15.0
+LOOKUP_STAGE_TIMEOUT = 10.0
+
+# Server-side deadline for requests that do not set deadline_ms; none unless
+# ANALYZE_DEADLINE_MS is set. Every LLM stage falls back to rules when it runs
+# out, so a cold model load costs result quality rather than the whole run.
+DEFAULT_DEADLINE_MS = int(os.environ["ANALYZE_DEADLINE_MS"]) if os.environ.get("ANALYZE_DEADLINE_MS") else None
+# Fraction of the total budget a stage must leave for the stages after it.
+# Vision and CAD leave room for extraction, classification and the worker;
+# the lookups leave room for the worker.
+STUDENT_RESERVE = 0.5
+LOOKUP_RESERVE = 0.3
+
+FALLBACK_TOLERANCE_MM = {"tight": 0.02, "medium": 0.10, "loose": 0.50}
+MODIFIER_SYMBOLS = {"MMC": "\u24c2", "LMC": "\u24c1"}
+# feature_type -> (control, symbol, datum_required, modifier), after the classifier prompt's examples
+RULE_CONTROLS = {
+    "hole": ("position", "\u2295", True, "MMC"),
+    "pattern": ("position", "\u2295", True, "MMC"),
+    "slot": ("position", "\u2295", True, "MMC"),
+    "groove": ("position", "\u2295", True, None),
+    "boss": ("perpendicularity", "\u22a5", True, None),
+    "shaft": ("perpendicularity", "\u22a5", True, None),
+    "surface": ("flatness", "\u25b1", False, None),
+    "bend": ("angularity", "\u2220", True, None),
+}
+RULE_DEFAULT_CONTROL = ("profile_of_a_surface", "\u2313", True, None)
+CYLINDRICAL_FEATURES = ("hole", "boss", "shaft", "pattern")
+DIAMETER_ZONE_CONTROLS = ("position", "perpendicularity", "concentricity")
+
+
+def _merge_vision_and_cad(vision_features: dict, cad_context: dict | None) -> dict:
+    """Merge vision-inferred features with CAD-extracted data.
+
+    CAD exact values override vision guesses where available.
+    Priority: CAD exact values > vision inferred values > defaults.
+    """
+    if not cad_context or cad_context.get("error"):
+        return vision_features
+
+    merged = dict(vision_features)
+
+    # Override geometry with CAD exact dimensions
+    cad_objects = cad_context.get("objects", [])
+    if cad_objects:
+        # Use the first object with dimensions as primary feature source
+        for obj in cad_objects:
+            dims = obj.get("dimensions", {})
+            if not dims:
+                continue
+            geometry = merged.get("geometry", {})
+            if isinstance(geometry, dict):
+                for key in CAD_GEOMETRY_KEYS:
+                    if key in dims:
+                        geometry[key] = dims[key]
+                merged["geometry"] = geometry
+
+            # CAD feature type provides parent context when vision didn't detect one
+            if obj.get("parent") and not merged.get("parent_surface"):
+                merged["parent_surface"] = obj["parent"]
+            break
+
+    # Override material with CAD material assignment
+    cad_materials = cad_context.get("materials", [])
+    if cad_materials:
+        merged["material"] = cad_materials[0].get("material", merged.get("material", "unspecified"))
+
+    # Add constraint data (vision can't see these)
+    cad_sketches = cad_context.get("sketches", [])
+    if cad_sketches:
+        constraints = []
+        for sketch in cad_sketches:
+            constraints.extend(sketch.get("constraints", []))
+        if constraints:
+            merged["cad_constraints"] = constraints
+
+    return merged
+
+
+def _infer_cad_feature_type(obj: dict, fallback: str | None) -> str:
+    """Map a CAD object onto the feature_type vocabulary of the extraction prompt."""
+    dims = obj.get("dimensions", {})
+    obj_type = obj.get("type", "")
+    if obj.get("shape_type") == "Hole" or obj_type.endswith(("Pocket", "Hole")):
+        return "hole"
+    if "diameter" in dims or "radius" in dims:
+        # A cylinder sitting on another feature is a boss; a free-standing one a shaft
+        parent = obj.get("parent")
+        return "boss" if parent and parent != "Body" else "shaft"
+    if "length" in dims and "width" in dims:
+        return "surface"
+    return fallback or "unspecified"
+
+
+def _build_feature_records(vision_features: dict, cad_context: dict | None) -> list[tuple[str, dict]]:
+    """Build a (name, features) record for every CAD object with dimensions.
+
+    Used by multi-feature mode. Material and sketch constraints come from the
+    whole CAD context; geometry, type and parent come from each object.
+    Without usable CAD data this degrades to the single merged record.
+    """
+    base = dict(vision_features)
+    base["geometry"] = dict(vision_features.get("geometry") or {})
+    if not cad_context or cad_context.get("error"):
+        return [(base.get("feature_type") or "feature", base)]
+
+    # Merge against an object-less context to pick up material + constraints only
+    shared = _merge_vision_and_cad(base, {**cad_context, "objects": []})
+    unit = shared["geometry"].get("unit", "mm")
+
+    records = []
+    for obj in cad_context.get("objects", []):
+        dims = obj.get("dimensions", {})
+        if not dims:
+            continue
+        features = dict(shared)
+        features["feature_type"] = _infer_cad_feature_type(obj, shared.get("feature_type"))
+        features["geometry"] = {key: dims[key] for key in CAD_GEOMETRY_KEYS if key in dims}
+        features["geometry"]["unit"] = unit
+        features["parent_surface"] = obj.get("parent") or shared.get("parent_surface")
+        records.append((obj.get("label") or obj.get("name") or f"feature_{len(records)}", features))
+
+    if not records:
+        return [(base.get("feature_type") or "feature", _merge_vision_and_cad(base, cad_context))]
+    return records
+
+
+def _derive_datum_scheme(classification: dict, features: dict) -> dict:
+    """Derive datum scheme from classification and features.
+
+    Form controls -> no datums. Location/orientation -> need datums.
+    """
+    if not classification.get("datum_required", False):
+        return {"primary": None, "secondary": None, "tertiary": None}
+
+    primary = {
+        "datum": "A",
+        "surface": features.get("parent_surface") or "primary mounting surface",
+        "reasoning": "Largest flat surface, primary assembly contact, maximum stability",
+    }
+    secondary = None
+    feature_type = features.get("feature_type", "")
+    if feature_type in ("hole", "pattern", "boss", "slot"):
+        secondary = {
+            "datum": "B",
+            "surface": "locating feature",
+            "reasoning": "Perpendicular to primary datum, constrains additional degrees of freedom",
+        }
+
+    return {"primary": primary, "secondary": secondary, "tertiary": None}
+
+
+def _rule_classification(features: dict) -> dict:
+    """Classify by feature type alone, for when the deadline leaves no time for the classifier."""
+    control, symbol, datum_required, modifier = RULE_CONTROLS.get(
+        features.get("feature_type"), RULE_DEFAULT_CONTROL,
+    )
+    return {
+        "primary_control": control,
+        "symbol": symbol,
+        "symbol_name": control,
+        "tolerance_class": "medium",
+        "datum_required": datum_required,
+        "modifier": modifier,
+        "reasoning_key": "rule_by_feature_type",
+        "confidence": 0.0,
+    }
+
+
+def _format_tolerance(value: float) -> str:
+    return f"{value:.2f}" if round(value, 2) == round(value, 3) else f"{value:.3f}"
+
+
+def _table_worker_result(features: dict, classification: dict, datum_scheme: dict, tolerances: dict) -> dict:
+    """Build a worker result from the classification and tolerance tables alone.
+
+    Stand-in for the worker LLM when the deadline leaves no time for it: one
+    callout for the classified control, valued from the process capability
+    table (or a per-class default) with the derived datum references.
+    """
+    symbol_name = classification.get("symbol_name") or classification.get("primary_control") or "profile_of_a_surface"
+    tolerance_class = classification.get("tolerance_class", "medium")
+    tol_range = (tolerances or {}).get("tolerance_range") or {}
+    if tol_range.get("min_mm") is not None and tol_range.get("max_mm") is not None:
+        low, high = tol_range["min_mm"], tol_range["max_mm"]
+        value = {"tight": low, "loose": high}.get(tolerance_class, (low + high) / 2)
+        basis = f"{features.get('manufacturing_process', 'process')} capability table ({low}-{high}mm)"
+    else:
+        value = FALLBACK_TOLERANCE_MM.get(tolerance_class, FALLBACK_TOLERANCE_MM["medium"])
+        basis = f"default {tolerance_class} tolerance"
+
+    tolerance_value = _format_tolerance(value)
+    feature_type = features.get("feature_type") or "feature"
+    if symbol_name in DIAMETER_ZONE_CONTROLS and feature_type in CYLINDRICAL_FEATURES:
+        tolerance_value = "\u2300" + tolerance_value
+    modifier = classification.get("modifier")
+    modifier_symbol = MODIFIER_SYMBOLS.get(modifier)
+    datums = [
+        level["datum"] for level in (datum_scheme.get(key) for key in ("primary", "secondary", "tertiary"))
+        if level
+    ]
+    tolerance_value = " ".join(filter(None, [tolerance_value, modifier_symbol]))
+    symbol = classification.get("symbol", "")
+    return {
+        "callouts": [{
+            "feature": feature_type,
+            "symbol": symbol,
+            "symbol_name": symbol_name,
+            "tolerance_value": tolerance_value,
+            "unit": "mm",
+            "modifier": modifier if modifier_symbol else None,
+            "modifier_symbol": modifier_symbol,
+            "datum_references": datums,
+            "feature_control_frame": f"|{symbol}| " + " | ".join([tolerance_value, *datums]) + " |",
+            "reasoning": f"{symbol_name.replace('_', ' ').capitalize()} from the classifier, "
+                         f"valued from the {basis}.",
+        }],
+        "summary": f"Table-driven {symbol_name.replace('_', ' ')} callout for the {feature_type}.",
+        "manufacturing_notes": "",
+        "standards_references": [],
+        "warnings": [
+            "Callouts were generated from lookup tables because the analysis deadline "
+            "left no time for the worker model; review before release."
+        ],
+    }
+
+
+def _build_matcher_query(features: dict, classification: dict) -> str:
+    """Build a natural language query for semantic matching."""
+    parts = []
+    for key in ["feature_type", "mating_condition"]:
+        if features.get(key):
+            parts.append(str(features[key]))
+    for key in ["primary_control", "symbol_name"]:
+        if classification.get(key):
+            parts.append(str(classification[key]))
+    return " ".join(parts) if parts else "geometric dimensioning and tolerancing"
+
+
+async def _safe_match_standards(embedder, query: str, ctx) -> list[dict]:
+    """Match standards with graceful degradation, recorded on the stage ``ctx``."""
+    try:
+        if embedder is None:
+            logger.debug("Standards matching skipped: embedder not loaded")
+            ctx.degrade("unavailable")
+            return []
+        return embedder.match_standards(query, top_k=5)
+    except Exception as e:
+        logger.warning("Standards matching failed (degraded): %s", e)
+        ctx.degrade("failed")
+        return []
+
+
+async def _safe_get_tolerances(manufacturing, features: dict, ctx) -> dict:
+    """Get tolerances with graceful degradation, recorded on the stage ``ctx``."""
+    try:
+        if manufacturing is None:
+            logger.debug("Tolerance lookup skipped: manufacturing DB not loaded")
+            ctx.degrade("unavailable")
+            return {"tolerance_range": None, "material_properties": None}
+        process = features.get("manufacturing_process", "unspecified")
+        material = features.get("material", "unspecified")
+        feature_type = features.get("feature_type", "unspecified")
+
+        tol_range = await manufacturing.get_tolerance_range(process, material, feature_type)
+        mat_props = await manufacturing.get_material_properties(material)
+
+        return {"tolerance_range": tol_range, "material_properties": mat_props}
+    except Exception as e:
+        logger.warning("Tolerance lookup failed (degraded): %s", e)
+        ctx.degrade("failed")
+        return {"tolerance_range": None, "material_properties": None}
+
+
+def _queued_event(ollama, layer: str) -> dict | None:
+    """A `queued` event when the next Ollama call would wait for a slot, else None."""
+    position = ollama.scheduler.queue_position()
+    if not position:
+        return None
+    return sse_event("queued", {
+        "layer": layer,
+        "position": position,
+        "queue_depth": ollama.scheduler.queue_depth(),
+    })
+
+
+def _tag_event(event: dict, index: int, name: str) -> dict:
+    """Copy an event with feature_index/feature_name added to its payload."""
+    data = json.loads(event["data"])
+    return sse_event(event["event"], {"feature_index": index, "feature_name": name, **data})
+
+
+def _student_stages(state, body: AnalyzeRequest, frame_max_distance: int | None = None) -> list[Stage]:
+    """Layer 1: image description, CAD extraction, feature extraction and the merge.
+
+    ``frame_max_distance`` is passed to the VLM's frame cache (None: its default).
+    """
+    ollama = state.ollama
+    vlm = getattr(state, "vlm", None)
+    freecad = getattr(state, "freecad", None)
+
+    async def vision(ctx):
+        if body.image and vlm is not None:
+            description = await vlm.describe_image(body.image, max_distance=frame_max_distance)
+            logger.info("PaliGemma 2 description: %s", description[:120])
+            return {"vision_description": description}
+        if body.image:
+            logger.warning("Image provided but mlx-vlm not loaded, skipping vision")
+            ctx.degrade("unavailable")
+        return {"vision_description": ""}
+
+    async def cad(ctx):
+        if body.cad_context is not None:
+            return {"cad_context_raw": body.cad_context.model_dump()}
+        if freecad is None:
+            return {"cad_context_raw": None}
+        try:
+            return {"cad_context_raw": await freecad.extract_cad_context(description_hint=body.description)}
+        except (FreecadConnectionError, Exception) as e:
+            logger.warning("CAD extraction failed (degraded): %s", e)
+            ctx.degrade("failed")
+            return {"cad_context_raw": None}
+
+    async def extract(ctx):
+        parts = [p for p in [body.description, ctx["vision_description"]] if p]
+        combined_text = "\n".join(parts) if parts else "Analyze the captured CAD feature"
+        if ctx.attempt:
+            combined_text = "Return ONLY valid JSON. " + combined_text
+        queued = _queued_event(ollama, "student")
+        if queued:
+            ctx.emit(queued)
+        return {"vision_features": await ollama.extract_features(combined_text)}
+
+    def no_features(ctx):
+        # Merged with the CAD context, if any; the description is kept for the later layers
+        features = {"geometry": {}}
+        if ctx["vision_description"]:
+            features["description"] = ctx["vision_description"]
+        return {"vision_features": features}
+
+    async def merge(ctx):
+        vision_features, cad_context_raw = ctx["vision_features"], ctx["cad_context_raw"]
+        if body.multi_feature:
+            records = _build_feature_records(vision_features, cad_context_raw)
+            features = records[0][1]
+        else:
+            records = None
+            features = _merge_vision_and_cad(vision_features, cad_context_raw)
+        logger.info("Features extracted: type=%s material=%s process=%s cad_available=%s",
+                    features.get("feature_type"), features.get("material"),
+                    features.get("manufacturing_process"), cad_context_raw is not None)
+
+        feature_extraction = {
+            "features": [r[1] for r in records] if records else [features],
+            "material_detected": features.get("material"),
+            "process_detected": features.get("manufacturing_process"),
+        }
+        if records:
+            feature_extraction["feature_names"] = [r[0] for r in records]
+        ctx.emit(sse_event("feature_extraction", feature_extraction))
+
+        cad_connected = cad_context_raw is not None and not cad_context_raw.get("error")
+        cad_data = cad_context_raw if cad_connected else {}
+        ctx.emit(sse_event("cad_context", {
+            "connected": cad_connected,
+            "document_name": cad_data.get("document_name"),
+            "objects": cad_data.get("objects", []),
+            "sketches": cad_data.get("sketches", []),
+            "materials": cad_data.get("materials", []),
+            "bounding_box": cad_data.get("bounding_box"),
+            "source": "freecad_rpc",
+        }))
+        return {"features": features, "records": records}
+
+    return [
+        Stage("vision", vision, outputs=("vision_description",), layer="student",
+              reserve=STUDENT_RESERVE, fallback=lambda ctx: {"vision_description": ""},
+              start_events=[sse_progress("student", "Extracting features with PaliGemma 2...", 1, 5)]),
+        Stage("cad", cad, outputs=("cad_context_raw",), layer="student", timeout=CAD_STAGE_TIMEOUT,
+              reserve=STUDENT_RESERVE, fallback=lambda ctx: {"cad_context_raw": None}),
+        Stage("extract", extract, inputs=("vision_description",), outputs=("vision_features",),
+              layer="student", retries=1, retry_on=LLM_RETRY_ON, reserve=0.0, fallback=no_features),
+        Stage("merge", merge, inputs=("vision_features", "cad_context_raw"),
+              outputs=("features", "records")),
+    ]
+
+
+def _feature_stages(state, compare: bool = False, per_feature: bool = False) -> list[Stage]:
+    """Layers 2-5 for one features record.
+
+    With ``per_feature`` (multi-feature fan-out) progress events are left to
+    the caller, the worker does not stream, and results are reported as
+    partial per-feature events.
+    """
+    ollama = state.ollama
+    embedder = getattr(state, "embedder", None)
+    manufacturing = getattr(state, "manufacturing_lookup", None)
+
+    def progress(layer: str, message: str, step: int) -> list[dict]:
+        return [] if per_feature else [sse_progress(layer, message, step, 5)]
+
+    async def classify(ctx):
+        queued = _queued_event(ollama, "classifier")
+        if queued:
+            ctx.emit(queued)
+        t0 = time.monotonic()
+        classification = await ollama.classify_gdt(ctx["features"], model=FINETUNED_MODEL)
+        logger.info("Classification: control=%s datum_required=%s confidence=%.2f",
+                    classification.get("primary_control"), classification.get("datum_required"),
+                    classification.get("confidence", 0))
+        return {"classification": classification, "classification_ms": int((time.monotonic() - t0) * 1000)}
+
+    def rule_classify(ctx):
+        return {"classification": _rule_classification(ctx["features"]), "classification_ms": 0}
+
+    def skip_base_classification(ctx):
+        return {"base_classification": {"error": "Base model comparison skipped: deadline reached"}}
+
+    def table_worker(ctx):
+        return {"worker_result": _table_worker_result(
+            ctx["features"], ctx["classification"], ctx["datum_scheme"], ctx["tolerances"],
+        )}
+
+    async def base_classify(ctx):
+        # Speculative: starts alongside the fine-tuned call, in the background
+        # lane so it never delays interactive work for another request. Never
+        # from the LLM cache: with the same tag and prompt as the fine-tuned
+        # call, it would replay that call's answer.
+        t0 = time.monotonic()
+        try:
+            with request_priority(PRIORITY_BACKGROUND):
+                classification = await ollama.classify_gdt(ctx["features"], model=BASE_MODEL, use_cache=False)
+        except Exception as e:
+            return {"base_classification": {"error": f"Base model comparison failed: {e}"}}
+        return {"base_classification": {
+            "classification": classification,
+            "latency_ms": int((time.monotonic() - t0) * 1000),
+        }}
+
+    async def compare_models(ctx):
+        base = ctx["base_classification"]
+        comparison = {"finetuned_model": ctx["classification"]}
+        latency_ms = {"finetuned_model": ctx["classification_ms"]}
+        if "error" in base:
+            comparison["error"] = base["error"]
+        else:
+            comparison["base_model"] = base["classification"]
+            latency_ms["base_model"] = base["latency_ms"]
+        comparison["latency_ms"] = latency_ms
+        ctx.emit(sse_event("classification_comparison", comparison))
+        return {"comparison": comparison}
+
+    async def datum(ctx):
+        datum_scheme = _derive_datum_scheme(ctx["classification"], ctx["features"])
+        payload = {"datum_scheme": datum_scheme}
+        if per_feature:
+            payload["classification"] = ctx["classification"]
+        ctx.emit(sse_event("datum_recommendation", payload))
+        return {"datum_scheme": datum_scheme}
+
+    async def standards(ctx):
+        query = _build_matcher_query(ctx["features"], ctx["classification"])
+        return {"standards": await _safe_match_standards(embedder, query, ctx)}
+
+    async def tolerances(ctx):
+        return {"tolerances": await _safe_get_tolerances(manufacturing, ctx["features"], ctx)}
+
+    async def worker(ctx):
+        queued = _queued_event(ollama, "worker")
+        if queued:
+            ctx.emit(queued)
+        kwargs = {
+            name: ctx[name]
+            for name in ("features", "classification", "datum_scheme", "standards", "tolerances")
+        }
+        if per_feature:
+            return {"worker_result": await ollama.generate_output(**kwargs)}
+
+        # Stream callouts to the client as each one closes in the token stream;
+        # every partial event carries the cumulative list so far.
+        if ctx.attempt:
+            # A retry starts over: clear the callouts the failed attempt streamed
+            ctx.emit(sse_event("gdt_callouts", {"callouts": [], "partial": True, "reset": True}))
+        worker_result = {}
+        streamed_callouts = []
+        async for kind, value in ollama.generate_output_stream(**kwargs):
+            if kind == "callout":
+                streamed_callouts.append(value)
+                ctx.emit(sse_event("gdt_callouts", {
+                    "callouts": list(streamed_callouts),
+                    "index": len(streamed_callouts) - 1,
+                    "partial": True,
+                }))
+            else:
+                worker_result = value
+        return {"worker_result": worker_result}
+
+    async def report(ctx):
+        worker_result = ctx["worker_result"]
+        logger.info("Worker result: callouts=%d warnings=%d",
+                    len(worker_result.get("callouts", [])), len(worker_result.get("warnings", [])))
+        ctx.emit(sse_event("gdt_callouts", {
+            "callouts": worker_result.get("callouts", []),
+            "partial": per_feature,
+        }))
+        ctx.emit(sse_event("reasoning", {
+            "summary": worker_result.get("summary", ""),
+            "manufacturing_notes": worker_result.get("manufacturing_notes", ""),
+            "standards_references": worker_result.get("standards_references", []),
+        }))
+        ctx.emit(sse_event("warnings", {
+            "warnings": worker_result.get("warnings", []),
+        }))
+        return {}
+
+    stages = [
+        Stage("classify", classify, inputs=("features",), outputs=("classification", "classification_ms"),
+              layer="classifier", retries=1, retry_on=LLM_RETRY_ON, reserve=0.0, fallback=rule_classify,
+              start_events=progress("classifier", "Classifying GD&T controls...", 2)),
+        Stage("datum", datum, inputs=("features", "classification"), outputs=("datum_scheme",)),
+        Stage("standards", standards, inputs=("features", "classification"), outputs=("standards",),
+              layer="matcher", timeout=LOOKUP_STAGE_TIMEOUT,
+              reserve=LOOKUP_RESERVE, fallback=lambda ctx: {"standards": []},
+              start_events=progress("matcher", "Matching ASME Y14.5 standards...", 3)),
+        Stage("tolerances", tolerances, inputs=("features",), outputs=("tolerances",),
+              layer="brain", timeout=LOOKUP_STAGE_TIMEOUT, reserve=LOOKUP_RESERVE,
+              fallback=lambda ctx: {"tolerances": {"tolerance_range": None, "material_properties": None}}),
+        Stage("worker", worker,
+              inputs=("features", "classification", "datum_scheme", "standards", "tolerances"),
+              outputs=("worker_result",), layer="worker", retries=1, retry_on=LLM_RETRY_ON,
+              reserve=0.0, fallback=table_worker,
+              start_events=progress("worker", "Generating GD&T callouts...", 4)),
+        Stage("report", report, inputs=("worker_result",),
+              start_events=progress("finalize", "Finalizing results...", 5)),
+    ]
+    if compare and not per_feature:
+        stages += [
+            Stage("base_classify", base_classify, inputs=("features",), outputs=("base_classification",),
+                  layer="comparison", reserve=0.0, fallback=skip_base_classification),
+            Stage("compare", compare_models,
+                  inputs=("classification", "classification_ms", "base_classification"),
+                  outputs=("comparison",)),
+        ]
+    return stages
+
+
+def _fanout_stages(state) -> list[Stage]:
+    """Layers 2-5 of multi-feature mode: one sub-graph per unique feature, then aggregation."""
+
+    async def fanout(ctx):
+        records = ctx["records"]
+        ctx.emit(sse_progress("classifier", f"Analyzing {len(records)} features...", 2, 5))
+
+        # Records with identical features (e.g. four identical holes) are analyzed
+        # once and their events fanned out to every matching feature_index.
+        groups: dict[str, list[int]] = {}
+        for index, (_, features) in enumerate(records):
+            groups.setdefault(json.dumps(features, sort_keys=True, default=str), []).append(index)
+        logger.info("Multi-feature fan-out: features=%d unique=%d concurrency=%d",
+                    len(records), len(groups), MULTI_FEATURE_CONCURRENCY)
+        semaphore = asyncio.Semaphore(MULTI_FEATURE_CONCURRENCY)
+
+        async def run_group(indices: list[int]):
+            graph = StageGraph(_feature_stages(state, per_feature=True), deadline=ctx.deadline)
+            try:
+                async with semaphore:
+                    async for event in graph.run({"features": records[indices[0]][1]}):
+                        for index in indices:
+                            ctx.emit(_tag_event(event, index, records[index][0]))
+            except (*LLM_ERRORS, StageTimeoutError) as e:
+                logger.warning("Feature %s failed: %s", records[indices[0]][0], e)
+                for index in indices:
+                    ctx.emit(sse_event("warnings", {
+                        "feature_index": index,
+                        "feature_name": records[index][0],
+                        "warnings": [f"Analysis failed for this feature: {e}"],
+                    }))
+                return indices, None
+            return indices, graph
+
+        results = {}
+        for indices, graph in await asyncio.gather(*(run_group(ix) for ix in groups.values())):
+            if graph is None:
+                continue
+            for index in indices:
+                results[index] = {
+                    "worker_result": graph.values["worker_result"],
+                    "timings": graph.layer_timings(),
+                    "degradations": graph.degradations,
+                }
+        return {"feature_results": results, "unique_features": len(groups)}
+
+    async def aggregate(ctx):
+        records, results = ctx["records"], ctx["feature_results"]
+        callouts, warnings = [], []
+        for index, (name, _) in enumerate(records):
+            result = results.get(index)
+            if result is None:
+                warnings.append(f"{name}: analysis failed")
+                continue
+            worker_result = result["worker_result"]
+            for callout in worker_result.get("callouts", []):
+                callouts.append({**callout, "feature_index": index, "feature_name": name})
+            warnings.extend(f"{name}: {w}" for w in worker_result.get("warnings", []))
+        ctx.emit(sse_event("gdt_callouts", {"callouts": callouts, "partial": False}))
+        ctx.emit(sse_event("warnings", {"warnings": warnings}))
+        return {}
+
+    return [
+        Stage("fanout", fanout, inputs=("records",), outputs=("feature_results", "unique_features")),
+        Stage("aggregate", aggregate, inputs=("records", "feature_results"),
+              start_events=[sse_progress("finalize", "Finalizing results...", 5, 5)]),
+    ]
+
+
+def build_stages(state, body: AnalyzeRequest, frame_max_distance: int | None = None) -> list[Stage]:
+    """The full stage list for one request.
+
+    Live capture passes ``frame_max_distance`` to let nearly identical frames
+    share a VLM description; one-shot analyses only reuse identical ones.
+    """
+    stages = _student_stages(state, body, frame_max_distance)
+    if body.multi_feature:
+        return stages + _fanout_stages(state)
+    return stages + _feature_stages(state, compare=body.compare)
+
+
+def deadline_at(deadline_ms: int | None) -> float | None:
+    """The time.monotonic() value a run given ``deadline_ms`` must finish by (None: no deadline)."""
+    return time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+
+
+def _analysis_complete(graph: StageGraph, body: AnalyzeRequest, deadline_ms: int | None,
+                       analysis_id: str) -> dict:
+    """The analysis_complete event, with per-layer timings taken from the graph's spans."""
+    layers = graph.layer_timings()
+    degradations = list(graph.degradations)
+    metadata = {
+        "inference_device": "local",
+        "total_latency_ms": graph.wall_ms,
+    }
+    extra = {}
+    if body.multi_feature:
+        # Layer timings of the slowest feature -- the fan-out's critical path
+        results = graph.values["feature_results"]
+        for layer in ("classifier", "matcher", "brain", "worker"):
+            layers[layer] = max((r["timings"].get(layer, 0) for r in results.values()), default=0)
+        for index, result in sorted(results.items()):
+            degradations.extend({**d, "feature_index": index} for d in result["degradations"])
+        extra = {
+            "fanout_latency_ms": graph.spans["fanout"].duration_ms,
+            "features_analyzed": len(results),
+            "unique_features": graph.values["unique_features"],
+        }
+    for layer in ("student", "classifier", "matcher", "brain", "worker"):
+        metadata[f"{layer}_latency_ms"] = layers.get(layer, 0)
+        if layer in layers:
+            LAYER_LATENCY.observe(layers[layer] / 1000, layer=layer)
+    PIPELINE_LATENCY.observe(graph.wall_ms / 1000)
+    metadata.update(extra)
+    metadata.update({
+        "stages": graph.span_summary(),
+        "deadline_ms": deadline_ms,
+        "degraded": bool(degradations),
+        "degradations": degradations,
+        "cloud_calls": 0,
+        "connectivity_required": False,
+        "cache_hit": False,
+    })
+    logger.info("Pipeline complete: total=%dms %s", metadata["total_latency_ms"],
+                " ".join(f"{layer}={ms}ms" for layer, ms in sorted(layers.items())))
+    return sse_event("analysis_complete", {
+        "analysis_id": analysis_id,
+        "metadata": metadata,
+    })
+
+
+async def run_pipeline(state, body: AnalyzeRequest, analysis_id: str | None = None):
+    """Run the five-layer pipeline for one request, yielding SSE event dicts.
+
+    ``analysis_id`` is reported in analysis_complete; callers that store or
+    index the run pass their own, otherwise a fresh one is generated.
+    """
+    deadline_ms = body.deadline_ms or DEFAULT_DEADLINE_MS
+    # A brain reload mid-run leaves this run on the snapshot it started with
+    async with pinned(state):
+        graph = StageGraph(build_stages(state, body), deadline=deadline_at(deadline_ms))
+        async for event in run_graph(graph, body, analysis_id):
+            yield event
+
+
+async def run_graph(graph: StageGraph, body: AnalyzeRequest, analysis_id: str | None = None,
+                    initial: dict | None = None):
+    """Run a graph built by ``build_stages`` for ``body``, ending in analysis_complete or error.
+
+    ``initial`` values are passed to ``StageGraph.run``, so stages whose
+    outputs are already known are not run again.
+    """
+    analysis_id = analysis_id or str(uuid4())
+    deadline_ms = body.deadline_ms or DEFAULT_DEADLINE_MS
+    logger.info("Pipeline starting: description=%r has_image=%s has_cad=%s compare=%s multi_feature=%s "
+                "deadline_ms=%s reused=%s",
+                body.description[:80] if body.description else "(none)",
+                body.image is not None, body.cad_context is not None,
+                body.compare, body.multi_feature, deadline_ms, sorted(initial or ()))
+    PIPELINES_IN_FLIGHT.inc()
+    try:
+        async for event in graph.run(initial):
+            yield event
+        yield _analysis_complete(graph, body, deadline_ms, analysis_id)
+    except MlxVlmTimeoutError as e:
+        logger.error("Pipeline timeout: %s", e)
+        yield _pipeline_error(str(e), layer="vlm")
+    except MlxVlmUnavailableError as e:
+        logger.error("VLM unavailable: %s", e)
+        yield _pipeline_error(str(e), layer="vlm")
+    except StageTimeoutError as e:
+        logger.error("Pipeline timeout: %s", e)
+        yield _pipeline_error(str(e), layer=e.layer or e.stage)
+    except OllamaUnavailableError as e:
+        yield _pipeline_error(str(e), layer="ollama")
+    except OllamaQueueFullError as e:
+        logger.warning("Pipeline rejected by admission control: %s", e)
+        yield _pipeline_error(str(e), layer="queue")
+    except Exception as e:
+        logger.error("Pipeline error: %s", e, exc_info=True)
+        yield _pipeline_error(f"Pipeline error: {e}", layer="unknown")
+    finally:
+        PIPELINES_IN_FLIGHT.dec()
+
+
+def uses_live_cad(state, body: AnalyzeRequest) -> bool:
+    """Whether a run of ``body`` reads the CAD context from a connected FreeCAD.
+
+    In mock mode the context comes from fixed demo data, which the request
+    key covers as well as the request's own cad_context would.
+    """
+    freecad = getattr(state, "freecad", None)
+    return body.cad_context is None and freecad is not None and not freecad._mock_mode
+
+
+async def record_result(events, state, body: AnalyzeRequest, cache_key: str, analysis_id: str):
+    """Pass pipeline events through, storing the full sequence once it finishes.
+
+    Finished runs (completed or failed) go to the analysis store; completed,
+    non-degraded ones also go to the result cache, unless they read live
+    FreeCAD state that ``cache_key`` does not cover.
+    """
+    result_cache = getattr(state, "result_cache", None)
+    if uses_live_cad(state, body):
+        result_cache = None
+    store = getattr(state, "analysis_store", None)
+    recorded = []
+    async for event in events:
+        recorded.append(event)
+        # Store before the final yield -- the consumer may stop right after it.
+        if event["event"] in ("analysis_complete", "error"):
+            if store is not None:
+                store.save(analysis_id, cache_key, recorded, body.description)
+            # Degraded results reflect one request's deadline or a failed
+            # lookup, so they are not reused
+            if (result_cache is not None and event["event"] == "analysis_complete"
+                    and not json.loads(event["data"])["metadata"].get("degraded")):
+                result_cache.put(cache_key, recorded)
+        yield event
+
+
+def _pipeline_error(message: str, layer: str) -> dict:
+    ERRORS.inc(layer=layer)
+    return sse_error(message, layer=layer)
@@ -0,0 +1,242 @@
+"""Minimal Redis-protocol (RESP2) client, plus a local stand-in server.
+
+The job queue only needs a handful of list and hash commands. The client
+speaks to a real Redis or to ``RespServer``, an in-memory stand-in for
+single-workstation setups:
+
+    python -m api.resp --port 6380
+"""
+
+import argparse
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+def encode_command(*args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Read one RESP2 value. Bulk strings are decoded as UTF-8; error replies raise RespError."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("RESP connection closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        count = int(payload)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise RespError(f"Unexpected RESP reply: {line!r}")
+
+
+class RespConnection:
+    """One connection; commands are serialised so replies pair up with their requests."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, host: str = "127.0.0.1", port: int = 6379) -> "RespConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def execute(self, *args):
+        async with self._lock:
+            self._writer.write(encode_command(*args))
+            await self._writer.drain()
+            return await read_reply(self._reader)
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def _encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_reply(v) for v in value)
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RespServer:
+    """In-memory stand-in for the Redis commands the job queue uses.
+
+    Supports PING, LPUSH, RPUSH, BRPOP, BRPOPLPUSH, LLEN, LRANGE, LREM,
+    HSET, HSETNX, HINCRBY, HGET, HGETALL, DEL and EXISTS. Nothing is
+    persisted.
+    """
+
+    def __init__(self):
+        self._lists: dict[str, deque] = {}
+        self._hashes: dict[str, dict[str, str]] = {}
+        self._pushed = asyncio.Condition()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening; returns the bound port (useful with ``port=0``)."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    command = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    return
+                if not isinstance(command, list) or not command:
+                    reply = RespError("ERR expected a command array")
+                else:
+                    try:
+                        reply = await self._dispatch(command[0].upper(), command[1:])
+                    except (TypeError, ValueError, IndexError) as e:
+                        reply = RespError(f"ERR wrong arguments for '{command[0]}': {e}")
+                writer.write(_encode_reply(reply))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, name: str, args: list[str]):
+        if name == "PING":
+            return "PONG"
+        if name in ("LPUSH", "RPUSH"):
+            items = self._lists.setdefault(args[0], deque())
+            for value in args[1:]:
+                if name == "LPUSH":
+                    items.appendleft(value)
+                else:
+                    items.append(value)
+            async with self._pushed:
+                self._pushed.notify_all()
+            return len(items)
+        if name == "BRPOP":
+            *keys, timeout = args
+            return await self._brpop(keys, float(timeout))
+        if name == "BRPOPLPUSH":
+            source, destination, timeout = args
+            popped = await self._brpop([source], float(timeout), destination)
+            return popped[1] if popped else None
+        if name == "LLEN":
+            return len(self._lists.get(args[0], ()))
+        if name == "LRANGE":
+            items = list(self._lists.get(args[0], ()))
+            start, stop = int(args[1]), int(args[2])
+            # Redis ranges are inclusive, and negative indexes count from the end
+            if stop < 0:
+                stop += len(items)
+            return items[start:stop + 1]
+        if name == "LREM":
+            items = self._lists.get(args[0], deque())
+            count, value = int(args[1]), args[2]
+            removed = 0
+            # Positive counts remove from the head, which is all the job queue uses
+            while value in items and (count <= 0 or removed < abs(count)):
+                items.remove(value)
+                removed += 1
+            return removed
+        if name == "HSET":
+            fields = self._hashes.setdefault(args[0], {})
+            pairs = list(zip(args[1::2], args[2::2]))
+            added = sum(1 for field, _ in pairs if field not in fields)
+            fields.update(pairs)
+            return added
+        if name == "HSETNX":
+            fields = self._hashes.setdefault(args[0], {})
+            if args[1] in fields:
+                return 0
+            fields[args[1]] = args[2]
+            return 1
+        if name == "HINCRBY":
+            fields = self._hashes.setdefault(args[0], {})
+            value = int(fields.get(args[1], 0)) + int(args[2])
+            fields[args[1]] = str(value)
+            return value
+        if name == "HGET":
+            return self._hashes.get(args[0], {}).get(args[1])
+        if name == "HGETALL":
+            return [item for pair in self._hashes.get(args[0], {}).items() for item in pair]
+        if name == "DEL":
+            return sum(
+                1 for key in args
+                if self._lists.pop(key, None) is not None or self._hashes.pop(key, None) is not None
+            )
+        if name == "EXISTS":
+            return sum(1 for key in args if key in self._lists or key in self._hashes)
+        return RespError(f"ERR unknown command '{name}'")
+
+    async def _brpop(self, keys: list[str], timeout: float, destination: str | None = None):
+        """Pop from the right of the first non-empty list, pushing onto the left of ``destination``."""
+        def pop():
+            for key in keys:
+                if self._lists.get(key):
+                    value = self._lists[key].pop()
+                    if destination is not None:
+                        self._lists.setdefault(destination, deque()).appendleft(value)
+                    return [key, value]
+            return None
+
+        async with self._pushed:
+            try:
+                # Redis treats a timeout of 0 as "block forever"
+                return await asyncio.wait_for(self._pushed.wait_for(pop), timeout=timeout or None)
+            except asyncio.TimeoutError:
+                return None
+
+
+async def _serve(host: str, port: int) -> None:
+    server = RespServer()
+    bound = await server.start(host, port)
+    logger.info("RESP stand-in listening on %s:%d", host, bound)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="In-memory Redis-protocol stand-in for the job queue")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
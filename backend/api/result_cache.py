@@ -0,0 +1,127 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def request_hash(body) -> str:
+    """Canonical SHA-256 of the AnalyzeRequest fields that affect the pipeline output.
+
+    The image is hashed by its decoded bytes so equivalent base64 encodings,
+    and a binary upload of the same image, share a key; dict ordering in
+    cad_context does not matter. deadline_ms is left out: only results that
+    finished without degrading are cached, and those are valid under any
+    deadline. Only the request's own cad_context is covered, so runs that
+    read it live from FreeCAD are not cached at all.
+    """
+    image_digest = None
+    if isinstance(body.image, (bytes, bytearray)):
+        image_digest = hashlib.sha256(body.image).hexdigest()
+    elif body.image_base64:
+        try:
+            image_bytes = base64.b64decode(body.image_base64)
+        except (binascii.Error, ValueError):
+            image_bytes = body.image_base64.encode()
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+
+    canonical = {
+        "description": body.description,
+        "image_sha256": image_digest,
+        "cad_context": body.cad_context.model_dump() if body.cad_context else None,
+        "compare": body.compare,
+        "multi_feature": body.multi_feature,
+        "manufacturing_process": body.manufacturing_process,
+        "material": body.material,
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("events", "size", "expires_at")
+
+    def __init__(self, events: list[dict], size: int, expires_at: float):
+        self.events = events
+        self.size = size
+        self.expires_at = expires_at
+
+
+class AnalysisResultCache:
+    """LRU + TTL cache of completed SSE event sequences, bounded by entry count and bytes."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> list[dict] | None:
+        """Return a copy of the cached event sequence, or None on miss/expiry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return [dict(event) for event in entry.events]
+
+    def put(self, key: str, events: list[dict]) -> None:
+        """Store an event sequence, evicting least-recently-used entries to stay in bounds."""
+        size = sum(len(event.get("data", "")) for event in events)
+        if size > self.max_bytes:
+            logger.debug("Result cache: skipping %d-byte entry (limit %d)", size, self.max_bytes)
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(
+            [dict(event) for event in events], size, self._clock() + self.ttl_seconds
+        )
+        self._total_bytes += size
+        while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._total_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
@@ -1,353 +1,361 @@
 import asyncio
+import hmac
+import ipaddress
+import json
 import logging
-import time
+import os
 from uuid import uuid4
-from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi import APIRouter, Header, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
 from sse_starlette.sse import EventSourceResponse
 
+from .brain_reload import BrainSnapshotInvalidError, pinned
+from .components import PIPELINE_COMPONENTS, VISION_COMPONENTS
+from .event_buffer import buffered
+from .job_queues import COMPLETE, ERROR
+from .live_session import LiveSession
+from .pipeline import record_result, run_pipeline
+from .result_cache import request_hash
 from .schemas import AnalyzeRequest, CreateDrawingRequest
-from .streaming import sse_event, sse_error, sse_progress
-from models.gemma import OllamaUnavailableError, OllamaParseError
-from models.mlx_vlm_client import MlxVlmTimeoutError
-from models.freecad_client import FreecadConnectionError
+from .streaming import SSE_SEP, encode_events, sse_event, with_event_ids
+from .uploads import read_multipart
+from models.cancellation import cancellations
+from models.gemma import OllamaUnavailableError
+from models.metrics import OLLAMA_QUEUE_DEPTH, REGISTRY, STREAMS_IN_FLIGHT
+from models.ollama_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
 from models.techdraw_generator import generate_techdraw_script
 
 logger = logging.getLogger(__name__)
 
+DISCONNECT_POLL_INTERVAL = 0.5
+ANALYSIS_ID_HEADER = "X-Analysis-Id"
+LOADING_RETRY_AFTER = "5"
+# Required in X-Admin-Token by /api/admin/*; unset, only loopback clients may call them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+
 router = APIRouter()
 
 
-def _merge_vision_and_cad(vision_features: dict, cad_context: dict | None) -> dict:
-    """Merge vision-inferred features with CAD-extracted data.
+def _still_loading(state, components) -> list[str]:
+    readiness = getattr(state, "readiness", None)
+    return readiness.loading(*components) if readiness is not None else []
+
+
+def _require_loaded(request: Request, *components: str) -> None:
+    """503 while any of ``components`` is still loading at startup."""
+    loading = _still_loading(request.app.state, components)
+    if loading:
+        raise HTTPException(503, f"Still loading: {', '.join(loading)}",
+                            headers={"Retry-After": LOADING_RETRY_AFTER})
+
+
+def _require_admin(request: Request, token: str | None) -> None:
+    """403 unless the caller sent ADMIN_TOKEN or, with none configured, connects from loopback."""
+    if ADMIN_TOKEN is not None:
+        if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            raise HTTPException(403, "Admin token required")
+        return
+    host = request.client.host if request.client else None
+    try:
+        local = host is not None and ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        local = False
+    if not local:
+        raise HTTPException(403, "Admin endpoints are loopback-only unless ADMIN_TOKEN is set")
+
+
+def _mark_cache_hit(events: list[dict]) -> list[dict]:
+    """Rewrite the analysis_complete event of a cached sequence to flag the replay."""
+    replayed = []
+    for event in events:
+        if event["event"] == "analysis_complete":
+            data = json.loads(event["data"])
+            data["metadata"]["cache_hit"] = True
+            event = sse_event("analysis_complete", data)
+        replayed.append(event)
+    return replayed
+
+
+def _sse_response(events, headers: dict | None = None) -> EventSourceResponse:
+    """Stream event dicts as pre-encoded SSE frames."""
+    return EventSourceResponse(encode_events(events), sep=SSE_SEP, headers=headers)
+
+
+async def _numbered(events):
+    """Give a live event stream the same SSE ids a Flight would."""
+    index = 0
+    try:
+        async for event in events:
+            yield {**event, "id": str(index)}
+            index += 1
+    finally:
+        await events.aclose()
+
+
+async def _replay(events: list[dict]):
+    for event in events:
+        yield event
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def _until_disconnected(request: Request, events):
+    """Pass events through until the client goes away, then close the source.
+
+    Disconnects are polled while waiting on the next event, so a stage that
+    emits nothing for a long time (the VLM, FreeCAD) is still abandoned
+    promptly. Closing the source cancels the pipeline's in-flight calls, or
+    for a shared flight, drops this subscriber.
+    """
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+    next_event = None
+    STREAMS_IN_FLIGHT.inc()
+    try:
+        while True:
+            next_event = asyncio.ensure_future(anext(events))
+            await asyncio.wait({next_event, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                logger.info("Client disconnected, abandoning analysis stream")
+                return
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        STREAMS_IN_FLIGHT.dec()
+        watcher.cancel()
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        await events.aclose()
+
+
+@router.post("/analyze")
+async def analyze(request: Request, body: AnalyzeRequest):
+    """Main analysis pipeline. Returns an SSE stream.
+
+    Identical requests are served from the result cache when possible, and
+    concurrent identical requests share a single pipeline run. Events carry
+    sequential SSE ids and the response names the run in an X-Analysis-Id
+    header, so a dropped client can resume from
+    ``GET /api/analysis/{id}/events`` instead of starting a new run.
+    """
+    return await _analyze(request, body)
+
+
+@router.post("/analyze/upload")
+async def analyze_upload(request: Request):
+    """/api/analyze with the image sent as raw bytes instead of base64.
 
-    CAD exact values override vision guesses where available.
-    Priority: CAD exact values > vision inferred values > defaults.
+    Takes multipart/form-data: an ``image`` file part and an optional
+    ``request`` part holding the other AnalyzeRequest fields as JSON. The
+    image is held in memory once and handed to the VLM without a temp file.
     """
-    if not cad_context or cad_context.get("error"):
-        return vision_features
-
-    merged = dict(vision_features)
-
-    # Override geometry with CAD exact dimensions
-    cad_objects = cad_context.get("objects", [])
-    if cad_objects:
-        # Use the first object with dimensions as primary feature source
-        for obj in cad_objects:
-            dims = obj.get("dimensions", {})
-            if not dims:
-                continue
-            geometry = merged.get("geometry", {})
-            if isinstance(geometry, dict):
-                for key in ("diameter", "radius", "length", "width", "height", "depth", "angle"):
-                    if key in dims:
-                        geometry[key] = dims[key]
-                merged["geometry"] = geometry
-
-            # CAD feature type provides parent context when vision didn't detect one
-            if obj.get("parent") and not merged.get("parent_surface"):
-                merged["parent_surface"] = obj["parent"]
-            break
-
-    # Override material with CAD material assignment
-    cad_materials = cad_context.get("materials", [])
-    if cad_materials:
-        merged["material"] = cad_materials[0].get("material", merged.get("material", "unspecified"))
-
-    # Add constraint data (vision can't see these)
-    cad_sketches = cad_context.get("sketches", [])
-    if cad_sketches:
-        constraints = []
-        for sketch in cad_sketches:
-            constraints.extend(sketch.get("constraints", []))
-        if constraints:
-            merged["cad_constraints"] = constraints
-
-    return merged
-
-
-def _derive_datum_scheme(classification: dict, features: dict) -> dict:
-    """Derive datum scheme from classification and features.
-
-    Form controls -> no datums. Location/orientation -> need datums.
+    parts = await read_multipart(request)
+    try:
+        body = AnalyzeRequest.model_validate_json(parts.get("request") or b"{}")
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+    if parts.get("image"):
+        body.with_image_bytes(parts["image"])
+    return await _analyze(request, body)
+
+
+async def _analyze(request: Request, body: AnalyzeRequest):
+    _require_loaded(request, *PIPELINE_COMPONENTS, *(VISION_COMPONENTS if body.image else ()))
+    state = request.app.state
+    result_cache = getattr(state, "result_cache", None)
+    flights = getattr(state, "flights", None)
+    request_key = request_hash(body)
+
+    if result_cache is not None:
+        cached_events = result_cache.get(request_key)
+        if cached_events is not None:
+            logger.info("Pipeline cache hit: key=%s events=%d", request_key[:12], len(cached_events))
+            analysis_id = json.loads(cached_events[-1]["data"])["analysis_id"]
+            return _sse_response(_replay(with_event_ids(_mark_cache_hit(cached_events))),
+                                 headers={ANALYSIS_ID_HEADER: analysis_id})
+
+    scheduler = state.ollama.scheduler
+    if scheduler.is_saturated() and not (flights and flights.is_running(request_key)):
+        logger.warning("Rejecting analyze request: Ollama queue saturated (%d waiting)",
+                       scheduler.queue_depth())
+        raise HTTPException(429, "Inference queue is full, retry shortly",
+                            headers={"Retry-After": "2"})
+
+    analysis_id = str(uuid4())
+
+    def start_pipeline():
+        return record_result(run_pipeline(state, body, analysis_id), state, body, request_key, analysis_id)
+
+    if flights is None:
+        events = _numbered(start_pipeline())
+    else:
+        flight, is_leader = flights.join(request_key, start_pipeline, analysis_id)
+        if not is_leader:
+            logger.info("Pipeline coalesced onto in-flight run: key=%s subscribers=%d",
+                        request_key[:12], flight.subscribers + 1)
+        analysis_id = flight.analysis_id
+        events = flight.subscribe()
+    return _sse_response(_until_disconnected(request, buffered(events)),
+                         headers={ANALYSIS_ID_HEADER: analysis_id})
+
+
+@router.post("/jobs/analyze", status_code=202)
+async def submit_analysis_job(request: Request, body: AnalyzeRequest):
+    """Queue an analysis and return its job id straight away.
+
+    The job runs the same pipeline as /api/analyze on a worker; poll
+    ``status_url`` and fetch the events from ``result_url`` when it is done.
     """
-    if not classification.get("datum_required", False):
-        return {"primary": None, "secondary": None, "tertiary": None}
+    queue = _job_queue(request)
+    job_id = str(uuid4())
+    await queue.submit(job_id, body.model_dump_json())
+    logger.info("Job %s queued (%s backend)", job_id, queue.backend)
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }
 
-    primary = {
-        "datum": "A",
-        "surface": features.get("parent_surface") or "primary mounting surface",
-        "reasoning": "Largest flat surface, primary assembly contact, maximum stability",
+
+@router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """Job status and timings, without the result events."""
+    job = await _get_job(request, job_id)
+    job.pop("events")
+    job["analysis_id"] = job_id
+    return job
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(request: Request, job_id: str):
+    """The job's event sequence once it has finished; 202 with its status until then."""
+    job = await _get_job(request, job_id)
+    if job["status"] not in (COMPLETE, ERROR):
+        return JSONResponse({"job_id": job_id, "status": job["status"]}, status_code=202)
+    return {
+        "job_id": job_id,
+        "analysis_id": job_id,
+        "status": job["status"],
+        "error": job["error"],
+        "events": [{"event": e["event"], "data": json.loads(e["data"])} for e in job["events"]],
     }
-    secondary = None
-    feature_type = features.get("feature_type", "")
-    if feature_type in ("hole", "pattern", "boss", "slot"):
-        secondary = {
-            "datum": "B",
-            "surface": "locating feature",
-            "reasoning": "Perpendicular to primary datum, constrains additional degrees of freedom",
-        }
 
-    return {"primary": primary, "secondary": secondary, "tertiary": None}
 
+def _job_queue(request: Request):
+    queue = getattr(request.app.state, "job_queue", None)
+    if queue is None:
+        raise HTTPException(503, "Job queue not available")
+    return queue
 
-def _build_matcher_query(features: dict, classification: dict) -> str:
-    """Build a natural language query for semantic matching."""
-    parts = []
-    for key in ["feature_type", "mating_condition"]:
-        if features.get(key):
-            parts.append(str(features[key]))
-    for key in ["primary_control", "symbol_name"]:
-        if classification.get(key):
-            parts.append(str(classification[key]))
-    return " ".join(parts) if parts else "geometric dimensioning and tolerancing"
 
+async def _get_job(request: Request, job_id: str) -> dict:
+    job = await _job_queue(request).get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found")
+    return job
 
-async def _safe_match_standards(embedder, query: str) -> list[dict]:
-    """Match standards with graceful degradation."""
-    try:
-        if embedder is None:
-            logger.debug("Standards matching skipped: embedder not loaded")
-            return []
-        return embedder.match_standards(query, top_k=5)
-    except Exception as e:
-        logger.warning("Standards matching failed (degraded): %s", e)
-        return []
 
+@router.websocket("/live")
+async def live_capture(websocket: WebSocket):
+    """Continuous analysis of capture frames sent over a WebSocket.
 
-async def _safe_get_tolerances(manufacturing, classification: dict, features: dict) -> dict:
-    """Get tolerances with graceful degradation."""
+    Each JSON message carries a frame and/or AnalyzeRequest fields. Frames
+    that barely differ from the last analysed one are skipped before the
+    VLM; otherwise only the stages affected by the change re-run, and their
+    events are pushed back as ``{"event", "data"}`` messages. Frames sent
+    while the VLM is still loading are answered with an error event.
+    """
+    await websocket.accept()
+    loading = _still_loading(websocket.app.state, PIPELINE_COMPONENTS)
+    if loading:
+        # 1013: try again later
+        await websocket.close(code=1013, reason=f"Still loading: {', '.join(loading)}")
+        return
+    session = LiveSession(websocket.app.state)
     try:
-        if manufacturing is None:
-            logger.debug("Tolerance lookup skipped: manufacturing DB not loaded")
-            return {"tolerance_range": None, "material_properties": None}
-        process = features.get("manufacturing_process", "unspecified")
-        material = features.get("material", "unspecified")
-        feature_type = features.get("feature_type", "unspecified")
+        await session.serve(websocket.receive_json, websocket.send_json)
+    except WebSocketDisconnect:
+        pass
+    logger.info("Live session ended: %s", session.stats())
 
-        tol_range = await manufacturing.get_tolerance_range(process, material, feature_type)
-        mat_props = await manufacturing.get_material_properties(material)
 
-        return {"tolerance_range": tol_range, "material_properties": mat_props}
-    except Exception as e:
-        logger.warning("Tolerance lookup failed (degraded): %s", e)
-        return {"tolerance_range": None, "material_properties": None}
+@router.get("/analysis")
+async def list_analyses(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Stored analyses, newest first, without their event payloads."""
+    store = _analysis_store(request)
+    items, total = await store.list(limit=limit, offset=offset)
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
 
 
-@router.post("/analyze")
-async def analyze(request: Request, body: AnalyzeRequest):
-    """Main analysis pipeline. Returns an SSE stream."""
+@router.get("/analysis/{analysis_id}")
+async def get_analysis(request: Request, analysis_id: str):
+    """A stored analysis: its full event sequence, per-stage timings and request hash."""
+    store = _analysis_store(request)
+    record = await store.get(analysis_id)
+    if record is None:
+        raise HTTPException(404, f"Analysis '{analysis_id}' not found")
+    return record
 
-    async def event_generator():
-        ollama = request.app.state.ollama
-        vlm = getattr(request.app.state, "vlm", None)
-        embedder = getattr(request.app.state, "embedder", None)
-        manufacturing = getattr(request.app.state, "manufacturing_lookup", None)
-        freecad = getattr(request.app.state, "freecad", None)
 
-        logger.info("Pipeline starting: description=%r has_image=%s has_cad=%s compare=%s",
-                     body.description[:80] if body.description else "(none)",
-                     body.image_base64 is not None, body.cad_context is not None, body.compare)
-        timings = {}
+@router.get("/analysis/{analysis_id}/events")
+async def analysis_events(
+    request: Request,
+    analysis_id: str,
+    last_event_id: str | None = Header(None),
+):
+    """SSE stream of an analysis, live if it is still running, resumable via Last-Event-ID.
 
+    Attaching to a running analysis adds a subscriber to it rather than
+    starting a new run; a finished one is replayed from the analysis store.
+    """
+    after = -1
+    if last_event_id:
         try:
-            # Step 1/5: Feature extraction
-            yield sse_progress("student", "Extracting features with PaliGemma 2...", 1, 5)
-            logger.info("Layer 1 (student): starting feature extraction")
-            t0 = time.monotonic()
-
-            # Describe image with PaliGemma 2 if available
-            vision_description = ""
-            if body.image_base64 and vlm is not None:
-                vision_description = await vlm.describe_image(body.image_base64)
-                logger.info("PaliGemma 2 description: %s", vision_description[:120])
-            elif body.image_base64 and vlm is None:
-                logger.warning("Image provided but mlx-vlm not loaded, skipping vision")
-
-            # Combine user description + PaliGemma description
-            parts = [p for p in [body.description, vision_description] if p]
-            combined_text = "\n".join(parts) if parts else "Analyze the captured CAD feature"
-
-            async def _extract_cad():
-                if freecad is None:
-                    return None
-                try:
-                    return await freecad.extract_cad_context(
-                        description_hint=body.description,
-                    )
-                except (FreecadConnectionError, Exception):
-                    return None
-
-            # Extract structured features via Ollama + fetch CAD context
-            if body.cad_context is not None:
-                cad_context_raw = body.cad_context.model_dump()
-                try:
-                    vision_features = await ollama.extract_features(combined_text)
-                except (OllamaParseError, OllamaUnavailableError) as e:
-                    logger.warning("Layer 1: %s, retrying extraction", type(e).__name__)
-                    vision_features = await ollama.extract_features(
-                        "Return ONLY valid JSON. " + combined_text
-                    )
-            else:
-                async def _extract_features():
-                    try:
-                        return await ollama.extract_features(combined_text)
-                    except (OllamaParseError, OllamaUnavailableError) as e:
-                        logger.warning("Layer 1: %s, retrying extraction", type(e).__name__)
-                        return await ollama.extract_features(
-                            "Return ONLY valid JSON. " + combined_text
-                        )
-
-                vision_features, cad_context_raw = await asyncio.gather(
-                    _extract_features(), _extract_cad()
-                )
-
-            timings["student_ms"] = int((time.monotonic() - t0) * 1000)
-            logger.info("Layer 1 (student): completed in %dms", timings["student_ms"])
-
-            # Merge vision + CAD
-            features = _merge_vision_and_cad(vision_features, cad_context_raw)
-            logger.info("Features extracted: type=%s material=%s process=%s cad_available=%s",
-                        features.get("feature_type"), features.get("material"),
-                        features.get("manufacturing_process"), cad_context_raw is not None)
-
-            yield sse_event("feature_extraction", {
-                "features": [features],
-                "material_detected": features.get("material"),
-                "process_detected": features.get("manufacturing_process"),
-            })
-
-            # Emit CAD context event
-            cad_connected = cad_context_raw is not None and not (cad_context_raw or {}).get("error")
-            cad_data = cad_context_raw if cad_connected and cad_context_raw else {}
-            yield sse_event("cad_context", {
-                "connected": cad_connected,
-                "document_name": cad_data.get("document_name"),
-                "objects": cad_data.get("objects", []),
-                "sketches": cad_data.get("sketches", []),
-                "materials": cad_data.get("materials", []),
-                "bounding_box": cad_data.get("bounding_box"),
-                "source": "freecad_rpc",
-            })
-
-            # Step 2/5: Classification
-            yield sse_progress("classifier", "Classifying GD&T controls...", 2, 5)
-            logger.info("Layer 2 (classifier): starting GD&T classification")
-            t0 = time.monotonic()
-            finetuned_model = "gemma3:1b"
-            try:
-                classification = await ollama.classify_gdt(features, model=finetuned_model)
-            except (OllamaParseError, OllamaUnavailableError) as e:
-                logger.warning("Layer 2: %s, retrying classification", type(e).__name__)
-                classification = await ollama.classify_gdt(features, model=finetuned_model)
-            timings["classifier_ms"] = int((time.monotonic() - t0) * 1000)
-            logger.info("Layer 2 (classifier): completed in %dms control=%s datum_required=%s confidence=%.2f",
-                        timings["classifier_ms"], classification.get("primary_control"),
-                        classification.get("datum_required"), classification.get("confidence", 0))
-
-            # Fine-tuning comparison mode
-            if body.compare:
-                try:
-                    base_classification = await ollama.classify_gdt(features, model="gemma3:1b")
-                    yield sse_event("classification_comparison", {
-                        "base_model": base_classification,
-                        "finetuned_model": classification,
-                    })
-                except Exception as e:
-                    yield sse_event("classification_comparison", {
-                        "error": f"Base model comparison failed: {e}",
-                        "finetuned_model": classification,
-                    })
-
-            # Derive datum scheme
-            datum_scheme = _derive_datum_scheme(classification, features)
-            yield sse_event("datum_recommendation", {"datum_scheme": datum_scheme})
-
-            # Step 3/5: Standards matching
-            yield sse_progress("matcher", "Matching ASME Y14.5 standards...", 3, 5)
-            logger.info("Layers 3+4 (matcher+brain): starting standards matching")
-            t0 = time.monotonic()
-            matcher_query = _build_matcher_query(features, classification)
-            standards, tolerances = await asyncio.gather(
-                _safe_match_standards(embedder, matcher_query),
-                _safe_get_tolerances(manufacturing, classification, features),
-            )
-            timings["matcher_ms"] = int((time.monotonic() - t0) * 1000)
-            logger.info("Layers 3+4 (matcher+brain): completed in %dms", timings["matcher_ms"])
-
-            # Step 4/5: Output generation
-            yield sse_progress("worker", "Generating GD&T callouts...", 4, 5)
-            logger.info("Layer 5 (worker): starting output generation")
-            t0 = time.monotonic()
-            try:
-                worker_result = await ollama.generate_output(
-                    features=features,
-                    classification=classification,
-                    datum_scheme=datum_scheme,
-                    standards=standards,
-                    tolerances=tolerances,
-                )
-            except (OllamaParseError, OllamaUnavailableError) as e:
-                logger.warning("Layer 5: %s, retrying output generation", type(e).__name__)
-                worker_result = await ollama.generate_output(
-                    features=features,
-                    classification=classification,
-                    datum_scheme=datum_scheme,
-                    standards=standards,
-                    tolerances=tolerances,
-                )
-            timings["worker_ms"] = int((time.monotonic() - t0) * 1000)
-            num_callouts = len(worker_result.get("callouts", []))
-            num_warnings = len(worker_result.get("warnings", []))
-            logger.info("Layer 5 (worker): completed in %dms callouts=%d warnings=%d", timings["worker_ms"], num_callouts, num_warnings)
-
-            # Step 5/5: Finalizing
-            yield sse_progress("finalize", "Finalizing results...", 5, 5)
-            yield sse_event("gdt_callouts", {
-                "callouts": worker_result.get("callouts", []),
-            })
-            yield sse_event("reasoning", {
-                "summary": worker_result.get("summary", ""),
-                "manufacturing_notes": worker_result.get("manufacturing_notes", ""),
-                "standards_references": worker_result.get("standards_references", []),
-            })
-            yield sse_event("warnings", {
-                "warnings": worker_result.get("warnings", []),
-            })
-
-            total_ms = sum(timings.values())
-            logger.info("Pipeline complete: total=%dms student=%dms classifier=%dms matcher=%dms worker=%dms",
-                        total_ms, timings.get("student_ms", 0), timings.get("classifier_ms", 0),
-                        timings.get("matcher_ms", 0), timings.get("worker_ms", 0))
-            yield sse_event("analysis_complete", {
-                "analysis_id": str(uuid4()),
-                "metadata": {
-                    "inference_device": "local",
-                    "total_latency_ms": total_ms,
-                    "student_latency_ms": timings.get("student_ms", 0),
-                    "classifier_latency_ms": timings.get("classifier_ms", 0),
-                    "matcher_latency_ms": timings.get("matcher_ms", 0),
-                    "brain_latency_ms": timings.get("matcher_ms", 0),
-                    "worker_latency_ms": timings.get("worker_ms", 0),
-                    "cloud_calls": 0,
-                    "connectivity_required": False,
-                },
-            })
-
-        except MlxVlmTimeoutError as e:
-            logger.error("Pipeline timeout: %s", e)
-            yield sse_error(str(e), layer="vlm")
-        except OllamaUnavailableError as e:
-            yield sse_error(str(e), layer="ollama")
-        except Exception as e:
-            logger.error("Pipeline error: %s", e, exc_info=True)
-            yield sse_error(f"Pipeline error: {e}", layer="unknown")
-
-    return EventSourceResponse(event_generator(), sep="\n")
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(400, f"Invalid Last-Event-ID: {last_event_id!r}")
+
+    flights = getattr(request.app.state, "flights", None)
+    flight = flights.attach(analysis_id) if flights is not None else None
+    if flight is not None:
+        logger.info("Attached to running analysis %s after event %d (subscribers=%d)",
+                    analysis_id, after, flight.subscribers + 1)
+        return _sse_response(_until_disconnected(request, buffered(flight.subscribe(after))))
+
+    _require_loaded(request, "analysis_store")
+    store = getattr(request.app.state, "analysis_store", None)
+    record = await store.get(analysis_id) if store is not None else None
+    if record is None:
+        raise HTTPException(404, f"Analysis '{analysis_id}' not found")
+    events = [sse_event(e["event"], e["data"]) for e in record["events"]]
+    return _sse_response(_replay(with_event_ids(events, after)))
+
+
+def _analysis_store(request: Request):
+    _require_loaded(request, "analysis_store")
+    store = getattr(request.app.state, "analysis_store", None)
+    if store is None:
+        raise HTTPException(503, "Analysis history not available")
+    return store
 
 
 @router.get("/standards/search")
 async def search_standards(request: Request, q: str = Query(...)):
     """Semantic search across standards database."""
+    _require_loaded(request, "embedder")
     embedder = getattr(request.app.state, "embedder", None)
     if embedder is None:
         return {"results": []}
@@ -358,10 +366,12 @@ async def search_standards(request: Request, q: str = Query(...)):
 @router.get("/standards/{code}")
 async def get_standard(code: str, request: Request):
     """Lookup specific ASME Y14.5 section by code."""
-    brain = getattr(request.app.state, "brain_lookup", None)
-    if brain is None:
-        raise HTTPException(503, "Brain database not available")
-    result = await brain.lookup_standard(code)
+    _require_loaded(request, "brain")
+    async with pinned(request.app.state):
+        brain = getattr(request.app.state, "brain_lookup", None)
+        if brain is None:
+            raise HTTPException(503, "Brain database not available")
+        result = await brain.lookup_standard(code)
     if not result:
         raise HTTPException(404, f"Standard '{code}' not found")
     return result
@@ -374,13 +384,57 @@ async def get_tolerances(
     material: str = Query(...),
 ):
     """Lookup tolerance capability data."""
-    mfg = getattr(request.app.state, "manufacturing_lookup", None)
-    if mfg is None:
-        return {"tolerances": []}
-    results = await mfg.get_process_capability(process)
+    _require_loaded(request, "brain")
+    async with pinned(request.app.state):
+        mfg = getattr(request.app.state, "manufacturing_lookup", None)
+        if mfg is None:
+            return {"tolerances": []}
+        results = await mfg.get_process_capability(process)
     return {"tolerances": results}
 
 
+@router.post("/admin/reload")
+async def reload_brain(request: Request, x_admin_token: str | None = Header(None)):
+    """Reload brain.db and the standards embeddings without a restart.
+
+    The new database and embeddings are validated before they replace the
+    current ones; requests already running finish on the old ones. 422 if
+    validation fails, in which case nothing changes. With several workers
+    (api.serve) this reloads only the worker that answers; the file
+    watcher reloads every worker.
+
+    403 without the ``X-Admin-Token`` header matching ADMIN_TOKEN; with no
+    token configured, only clients on loopback may call it.
+    """
+    _require_admin(request, x_admin_token)
+    _require_loaded(request, "brain", "embedder")
+    reloader = getattr(request.app.state, "brain_reloader", None)
+    if reloader is None:
+        raise HTTPException(503, "Brain reload not available")
+    try:
+        return await reloader.reload()
+    except BrainSnapshotInvalidError as e:
+        raise HTTPException(422, f"Reload rejected, keeping the current brain: {e}")
+
+
+@router.get("/ready")
+async def ready(request: Request):
+    """Startup readiness of each component and model warm-up durations.
+
+    503 until every component has finished loading and every model has
+    finished warming up. A component that failed to load counts as
+    finished (``unavailable``), as does a model left ``cold`` by a failed
+    warm-up: the server runs without them, as /health reports.
+    """
+    readiness = getattr(request.app.state, "readiness", None)
+    if readiness is None:
+        return {"ready": True, "components": {}}
+    report = readiness.report()
+    if not report["ready"]:
+        return JSONResponse(report, status_code=503, headers={"Retry-After": LOADING_RETRY_AFTER})
+    return report
+
+
 @router.get("/health")
 async def health(request: Request):
     """Liveness check -- confirms Ollama + models are loaded."""
@@ -398,11 +452,52 @@ async def health(request: Request):
             result["freecad"] = "connected" if await freecad.health_check() else "not available"
         else:
             result["freecad"] = "not configured"
+        result["ollama_queue"] = ollama.scheduler.stats()
+        result["ollama_circuits"] = {model: b.stats() for model, b in ollama.breakers.items()}
+        if any(c["state"] != "closed" for c in result["ollama_circuits"].values()):
+            result["status"] = "degraded"
+        result["cancellations"] = cancellations.stats()
+        readiness = getattr(request.app.state, "readiness", None)
+        if readiness is not None:
+            result["components"] = readiness.report()["components"]
+        model_warmer = getattr(request.app.state, "model_warmer", None)
+        if model_warmer is not None:
+            result["model_residency"] = model_warmer.stats()
+        brain_reloader = getattr(request.app.state, "brain_reloader", None)
+        if brain_reloader is not None:
+            result["brain_snapshot"] = brain_reloader.stats()
+        flights = getattr(request.app.state, "flights", None)
+        if flights is not None:
+            result["flights"] = flights.stats()
+        frame_cache = getattr(getattr(request.app.state, "vlm", None), "frame_cache", None)
+        if frame_cache is not None:
+            result["vlm_frame_cache"] = frame_cache.stats()
+        llm_cache = getattr(request.app.state, "llm_cache", None)
+        if llm_cache is not None:
+            result["llm_cache"] = llm_cache.stats()
+        analysis_store = getattr(request.app.state, "analysis_store", None)
+        if analysis_store is not None:
+            result["analysis_store"] = analysis_store.stats()
+        job_queue = getattr(request.app.state, "job_queue", None)
+        if job_queue is not None:
+            result["jobs"] = await job_queue.stats()
+            job_worker = getattr(request.app.state, "job_worker", None)
+            if job_worker is not None:
+                result["jobs"]["worker"] = job_worker.stats()
         return result
     except OllamaUnavailableError as e:
         return {"status": "degraded", "ollama": str(e), "models_loaded": []}
 
 
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus text exposition of latency histograms, counters and gauges."""
+    scheduler = request.app.state.ollama.scheduler
+    OLLAMA_QUEUE_DEPTH.set(scheduler.queue_depth(PRIORITY_INTERACTIVE), lane="interactive")
+    OLLAMA_QUEUE_DEPTH.set(scheduler.queue_depth(PRIORITY_BACKGROUND), lane="background")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @router.get("/freecad/status")
 async def freecad_status(request: Request):
     """Check FreeCAD RPC server connectivity."""
@@ -416,6 +511,7 @@ async def freecad_status(request: Request):
 @router.post("/freecad/create-drawing")
 async def create_drawing(request: Request, body: CreateDrawingRequest):
     """Create a TechDraw page with GD&T annotations in FreeCAD."""
+    _require_loaded(request, "freecad")
     freecad = getattr(request.app.state, "freecad", None)
     if freecad is None or freecad._mock_mode:
         raise HTTPException(503, "Drawing creation requires live FreeCAD connection")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class CADContext(BaseModel):
@@ -16,7 +16,20 @@ class AnalyzeRequest(BaseModel):
     manufacturing_process: str | None = None
     material: str | None = None
     compare: bool = False
+    multi_feature: bool = False
     cad_context: CADContext | None = None
+    deadline_ms: int | None = Field(default=None, gt=0)
+    # Raw image from POST /api/analyze/upload; never read from or written to JSON
+    _image_bytes: bytes | bytearray | None = PrivateAttr(default=None)
+
+    def with_image_bytes(self, image_bytes: bytes | bytearray) -> "AnalyzeRequest":
+        self._image_bytes = image_bytes
+        return self
+
+    @property
+    def image(self) -> str | bytes | bytearray | None:
+        """The uploaded image bytes, else ``image_base64``."""
+        return self._image_bytes or self.image_base64
 
 
 class Geometry(BaseModel):
@@ -86,6 +99,10 @@ class AnalysisMetadata(BaseModel):
     worker_latency_ms: int
     cloud_calls: int = 0
     connectivity_required: bool = False
+    cache_hit: bool = False
+    deadline_ms: int | None = None
+    degraded: bool = False
+    degradations: list[dict] = []
 
 
 class WorkerResult(BaseModel):
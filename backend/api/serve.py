@@ -0,0 +1,167 @@
+"""Production launch: several API workers sharing one copy of the read-only models.
+
+    python -m api.serve --workers 4 --port 8000
+
+``uvicorn --workers N`` starts each worker as a fresh interpreter, so every
+worker loads its own sentence-transformer, embedding matrix and PaliGemma.
+Here the parent process instead:
+
+1. starts the VLM inference process (api.vlm_server), the only one that
+   loads PaliGemma; workers call it over a Unix socket;
+2. loads the sentence-transformer (on the CPU: a forked child cannot use
+   an MPS/CUDA context created by its parent), extracts the embedding
+   matrix to an .npy once and memory-maps it;
+3. binds the listening socket and forks the workers, which share the
+   parent's model memory copy-on-write and accept on the same socket.
+
+Jobs default to a SQLite queue (JOB_QUEUE_URL) that all workers share.
+Workers that exit unexpectedly are forked again. SIGINT/SIGTERM stops the
+workers, then the VLM process. POSIX only (uses os.fork).
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from .components import DATA_DIR, PRELOADED, VLM_SERVER_SOCKET_ENV
+from models.embedder import Embedder, write_matrix
+
+logger = logging.getLogger(__name__)
+
+RESTART_BACKOFF_S = 1.0
+
+
+def start_vlm_server(socket_path: str) -> subprocess.Popen:
+    """Run api.vlm_server as a separate (spawned, not forked) process."""
+    return subprocess.Popen([sys.executable, "-m", "api.vlm_server", "--socket", socket_path])
+
+
+def preload_shared() -> None:
+    """Load the read-only components into this process before the workers are forked."""
+    t0 = time.monotonic()
+    embeddings_path = DATA_DIR / "embeddings" / "standards_embeddings.npz"
+    if embeddings_path.exists():
+        try:
+            write_matrix(embeddings_path)
+        except OSError as e:
+            # Read-only data directory: every worker reads the matrix into memory
+            logger.warning("Embedding matrix not extracted, workers will not share it: %s", e)
+    embedder = Embedder(device="cpu")
+    try:
+        embedder.load(str(embeddings_path))
+    except Exception as e:
+        # The workers start without it, as a single process would
+        logger.warning("Embedder not preloaded: %s", e)
+    else:
+        PRELOADED["embedder"] = embedder
+        logger.info("Preloaded embedder in %.1fs", time.monotonic() - t0)
+    # Later collections then leave the preloaded objects' pages alone instead of
+    # dirtying them (and un-sharing them) in every worker
+    gc.freeze()
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    from .main import app
+
+    # The parent's handlers stay until uvicorn installs its own
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def fork_worker(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, log_level)
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info("Started worker %d", pid)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, vlm_socket: str | None, log_level: str) -> None:
+    # An in-process job queue would only be visible to the worker a job was submitted to
+    os.environ.setdefault("JOB_QUEUE_URL", f"sqlite:///{DATA_DIR / 'jobs.db'}")
+    vlm_process = None
+    if vlm_socket:
+        if os.path.exists(vlm_socket):
+            os.unlink(vlm_socket)
+        vlm_process = start_vlm_server(vlm_socket)
+        # Inherited by the workers; api.components picks it up
+        os.environ[VLM_SERVER_SOCKET_ENV] = vlm_socket
+
+    # Import the app before forking so its code is shared too
+    from . import main  # noqa: F401
+
+    preload_shared()
+    sock = bind_socket(host, port)
+    children: set[int] = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    logger.info("Serving on http://%s:%d with %d workers", host, port, workers)
+    try:
+        children.update(fork_worker(sock, log_level) for _ in range(workers))
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            if pid not in children:
+                continue
+            children.discard(pid)
+            if not stopping:
+                logger.warning("Worker %d exited (status %d), restarting", pid, status)
+                time.sleep(RESTART_BACKOFF_S)
+                children.add(fork_worker(sock, log_level))
+    finally:
+        sock.close()
+        if vlm_process is not None:
+            vlm_process.terminate()
+            vlm_process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Run ToleranceAI with pre-fork workers sharing read-only models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--vlm-socket", default="/tmp/toleranceai-vlm.sock",
+                        help="Unix socket of the shared VLM process ('' to load PaliGemma in every worker)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, max(1, args.workers), args.vlm_socket or None, args.log_level)
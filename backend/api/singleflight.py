@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from bisect import bisect_left
+
+from .streaming import sse_error
+
+logger = logging.getLogger(__name__)
+
+# Events kept per flight for late joiners and resuming clients. A pipeline
+# run emits a few dozen; the bound only matters for runaway producers.
+DEFAULT_MAX_EVENTS = 1024
+
+
+class Flight:
+    """One pipeline run whose events are fanned out to every subscriber.
+
+    The run executes in its own task and appends to ``events``; each
+    subscriber replays the log and then follows it live, so late joiners
+    still receive the full sequence. Events are numbered from 0 in the
+    order they were published and carry that number as their SSE ``id``,
+    which lets a reconnecting client resume after the last one it saw.
+    At most ``max_events`` are kept: past that the oldest progress event is
+    dropped, and only when there is none the oldest event of any kind. A
+    subscriber that had not read such an event yet gets an error telling
+    it to fetch the stored result instead. The run never waits for its
+    subscribers; each response drains its subscription through its own
+    EventBuffer (api.event_buffer), which is where a slow client's stale
+    progress is coalesced. When the last subscriber leaves before the run
+    finishes, the run is cancelled.
+    """
+
+    def __init__(self, key: str, analysis_id: str | None = None, max_events: int = DEFAULT_MAX_EVENTS):
+        self.key = key
+        self.analysis_id = analysis_id
+        self.max_events = max_events
+        self.events: list[dict] = []
+        # Number of each kept event, ascending (dropped progress leaves gaps)
+        self._ids: list[int] = []
+        self._next_id = 0
+        # Highest number of a dropped non-progress event
+        self.lost_through = -1
+        self.done = False
+        self.cancelled = False
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+        # Joins whose subscriber has not attached yet; they keep the run alive
+        self._pending_joins = 0
+
+    def _publish(self, event: dict) -> None:
+        index = self._next_id
+        self._next_id += 1
+        self.events.append({**event, "id": str(index)})
+        self._ids.append(index)
+        if len(self.events) > self.max_events:
+            self._evict()
+        self._notify()
+
+    def _evict(self) -> None:
+        pos = next((i for i, e in enumerate(self.events) if e["event"] == "progress"), None)
+        if pos is None:
+            pos = 0
+            self.lost_through = self._ids[0]
+            logger.warning("Flight %s dropped %s event %d: over %d events",
+                           self.key[:12], self.events[0]["event"], self.lost_through, self.max_events)
+        del self.events[pos]
+        del self._ids[pos]
+
+    def _lost(self) -> dict:
+        where = f"/api/analysis/{self.analysis_id}" if self.analysis_id else "the analysis again"
+        return sse_error(f"Events of this analysis were dropped before they were sent; fetch {where}",
+                         layer="stream")
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, source) -> None:
+        try:
+            async for event in source:
+                self._publish(event)
+        except asyncio.CancelledError:
+            logger.info("Flight %s cancelled: no subscribers left", self.key[:12])
+        except Exception as e:
+            logger.error("Flight %s failed: %s", self.key[:12], e, exc_info=True)
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self, after: int = -1):
+        """Yield the events of this run numbered above ``after`` until it finishes.
+
+        Dropped progress events are skipped. If a dropped event of another
+        kind was not yet read, the stream ends with an error instead.
+        """
+        self.subscribers += 1
+        if self._pending_joins:
+            self._pending_joins -= 1
+        index = after + 1
+        try:
+            while True:
+                changed = self._changed
+                if index <= self.lost_through:
+                    yield self._lost()
+                    return
+                pos = bisect_left(self._ids, index)
+                if pos < len(self.events):
+                    index = self._ids[pos] + 1
+                    yield self.events[pos]
+                    continue
+                if self.done:
+                    return
+                if changed is self._changed:
+                    await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self._pending_joins:
+                self._abandon()
+
+    def _abandon(self) -> None:
+        if self.done or self.task is None or self.task.done():
+            return
+        self.cancelled = True
+        self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent pipeline runs onto a single Flight per key."""
+
+    def __init__(self):
+        self._flights: dict[str, Flight] = {}
+        self._by_analysis_id: dict[str, Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.attached = 0
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def is_running(self, key: str) -> bool:
+        flight = self._flights.get(key)
+        return flight is not None and not flight.done
+
+    def join(self, key: str, start, analysis_id: str | None = None) -> tuple[Flight, bool]:
+        """Return the in-flight run for ``key``, starting one via ``start()`` if needed.
+
+        ``start`` must return an async iterator of events. A run started here
+        is registered under ``analysis_id`` for ``attach``. The boolean is True
+        when this call started the run.
+        """
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            self.coalesced += 1
+            flight._pending_joins += 1
+            return flight, False
+
+        flight = Flight(key, analysis_id)
+        flight._pending_joins = 1
+        self._flights[key] = flight
+        if analysis_id is not None:
+            self._by_analysis_id[analysis_id] = flight
+        self.started += 1
+        flight.task = asyncio.create_task(flight._run(start()))
+        flight.task.add_done_callback(lambda _: self._forget(flight))
+        return flight, True
+
+    def attach(self, analysis_id: str) -> Flight | None:
+        """The still-running flight for ``analysis_id``, reserved for one more subscriber."""
+        flight = self._by_analysis_id.get(analysis_id)
+        if flight is None or flight.done:
+            return None
+        self.attached += 1
+        flight._pending_joins += 1
+        return flight
+
+    def _forget(self, flight: Flight) -> None:
+        if flight.cancelled:
+            self.cancelled += 1
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if self._by_analysis_id.get(flight.analysis_id) is flight:
+            del self._by_analysis_id[flight.analysis_id]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "attached": self.attached,
+            "cancelled": self.cancelled,
+        }
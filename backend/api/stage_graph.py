@@ -0,0 +1,315 @@
+"""Small dependency-graph executor for the analysis pipeline.
+
+Stages declare the named values they consume and produce. A stage starts
+as soon as all of its inputs exist, so independent stages run
+concurrently; events a stage emits are yielded in the order they occur.
+
+A graph may be given an absolute deadline. Stages that opt into it are
+cut short when it runs out, and degrade to their fallback when they have
+one instead of failing the whole run.
+"""
+
+import asyncio
+import logging
+import time
+
+from models.metrics import STAGE_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimeoutError(Exception):
+    """Raised when a stage exceeds its timeout on the final attempt."""
+
+    def __init__(self, stage: str, layer: str | None, timeout: float):
+        super().__init__(f"Stage '{stage}' timed out after {timeout:.1f}s")
+        self.stage = stage
+        self.layer = layer
+        self.timeout = timeout
+
+
+class DeadlineExceededError(StageTimeoutError):
+    """Raised when the graph deadline runs out in a stage that has no fallback."""
+
+    def __init__(self, stage: str, layer: str | None, timeout: float):
+        super().__init__(stage, layer, timeout)
+        self.args = (f"Deadline exceeded in stage '{stage}'",)
+
+
+class StageGraphError(Exception):
+    """Raised when the graph is malformed (missing inputs, duplicate outputs, cycles)."""
+
+
+class Stage:
+    """One unit of pipeline work.
+
+    ``fn(ctx)`` is awaited with a StageContext and returns a dict holding
+    every name in ``outputs``. ``retries`` extra attempts are made when the
+    stage raises one of ``retry_on``; ``timeout`` bounds each attempt.
+    ``start_events`` are emitted when the stage starts.
+
+    ``reserve`` opts the stage into the graph deadline: each attempt may run
+    until only that fraction of the graph's total budget is left, so later
+    stages keep their share. ``fallback(ctx)`` returns substitute outputs
+    when that budget is already gone or runs out mid-attempt.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn,
+        inputs: tuple[str, ...] = (),
+        outputs: tuple[str, ...] = (),
+        layer: str | None = None,
+        timeout: float | None = None,
+        retries: int = 0,
+        retry_on: tuple[type[BaseException], ...] = (),
+        start_events: list[dict] | None = None,
+        reserve: float | None = None,
+        fallback=None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.layer = layer
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_on = retry_on
+        self.start_events = start_events or []
+        self.reserve = reserve
+        self.fallback = fallback
+
+
+class StageSpan:
+    __slots__ = ("stage", "layer", "start", "end", "attempts", "status")
+
+    def __init__(self, stage: str, layer: str | None, start: float):
+        self.stage = stage
+        self.layer = layer
+        self.start = start
+        self.end: float | None = None
+        self.attempts = 0
+        self.status = "running"
+
+    @property
+    def duration_ms(self) -> int:
+        return int(((self.end or time.monotonic()) - self.start) * 1000)
+
+
+class StageContext:
+    def __init__(self, stage: Stage, values: dict, queue: asyncio.Queue, deadline: float | None,
+                 degradations: list[dict] | None = None):
+        self.stage = stage
+        self.inputs = {name: values[name] for name in stage.inputs}
+        self.attempt = 0
+        self.deadline = deadline
+        self.degraded = False
+        self._queue = queue
+        self._degradations = degradations if degradations is not None else []
+
+    def __getitem__(self, name: str):
+        return self.inputs[name]
+
+    def emit(self, event: dict) -> None:
+        """Send an SSE event to the graph's consumer immediately."""
+        self._queue.put_nowait(("event", event))
+
+    def degrade(self, reason: str) -> None:
+        """Record that the stage fell back to a partial result on its own (e.g. a lookup failed)."""
+        self.degraded = True
+        self._degradations.append({"stage": self.stage.name, "layer": self.stage.layer, "reason": reason})
+
+
+class StageGraph:
+    def __init__(self, stages: list[Stage], deadline: float | None = None):
+        """``deadline`` is an absolute ``time.monotonic()`` value, or None for no deadline."""
+        self.stages = stages
+        self.deadline = deadline
+        self.budget: float | None = None
+        self.values: dict = {}
+        self.spans: dict[str, StageSpan] = {}
+        self.degradations: list[dict] = []
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def _validate(self, provided: set[str]) -> None:
+        produced = set(provided)
+        for stage in self.stages:
+            duplicate = produced.intersection(stage.outputs) - provided
+            if duplicate:
+                raise StageGraphError(f"Outputs {sorted(duplicate)} produced by more than one stage")
+            produced.update(stage.outputs)
+        for stage in self.stages:
+            missing = set(stage.inputs) - produced
+            if missing:
+                raise StageGraphError(f"Stage '{stage.name}' needs {sorted(missing)}, which nothing produces")
+
+    def downstream(self, changed: set[str]) -> set[str]:
+        """``changed`` plus every value computed, directly or not, from one of them."""
+        stale = set(changed)
+        grew = True
+        while grew:
+            grew = False
+            for stage in self.stages:
+                if stale.intersection(stage.inputs) and not stale.issuperset(stage.outputs):
+                    stale.update(stage.outputs)
+                    grew = True
+        return stale
+
+    async def run(self, initial: dict | None = None):
+        """Execute the graph, yielding emitted events; results end up in ``self.values``.
+
+        Stages whose outputs are all present in ``initial`` are skipped (stages
+        with no outputs always run), which
+        lets callers re-run only the part of the graph downstream of a change.
+        """
+        self.values = dict(initial or {})
+        self._validate(set(self.values))
+        self.started_at = time.monotonic()
+        if self.deadline is not None:
+            self.budget = max(self.deadline - self.started_at, 0.0)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        pending = [
+            s for s in self.stages
+            if not (s.outputs and all(name in self.values for name in s.outputs))
+        ]
+        running: dict[str, asyncio.Task] = {}
+
+        def start_ready():
+            for stage in list(pending):
+                if all(name in self.values for name in stage.inputs):
+                    pending.remove(stage)
+                    for event in stage.start_events:
+                        queue.put_nowait(("event", event))
+                    self.spans[stage.name] = StageSpan(stage.name, stage.layer, time.monotonic())
+                    running[stage.name] = asyncio.create_task(self._run_stage(stage, queue))
+
+        try:
+            start_ready()
+            while running or not queue.empty():
+                kind, payload = await queue.get()
+                if kind == "event":
+                    yield payload
+                elif kind == "done":
+                    stage, outputs = payload
+                    running.pop(stage.name)
+                    self.values.update({name: outputs[name] for name in stage.outputs})
+                    start_ready()
+                elif kind == "failed":
+                    stage, exc = payload
+                    running.pop(stage.name)
+                    raise exc
+            if pending:
+                raise StageGraphError(
+                    f"Stages {[s.name for s in pending]} can never run (dependency cycle)"
+                )
+        finally:
+            for task in running.values():
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.values(), return_exceptions=True)
+            self.finished_at = time.monotonic()
+
+    def _attempt_timeout(self, stage: Stage) -> tuple[float | None, bool]:
+        """Timeout for the next attempt, and whether the deadline (not ``stage.timeout``) set it."""
+        if self.deadline is None or stage.reserve is None:
+            return stage.timeout, False
+        available = self.deadline - stage.reserve * self.budget - time.monotonic()
+        if stage.timeout is not None and stage.timeout <= available:
+            return stage.timeout, False
+        return available, True
+
+    def _degrade(self, stage: Stage, ctx: StageContext, reason: str, budget: float) -> dict:
+        if stage.fallback is None:
+            raise DeadlineExceededError(stage.name, stage.layer, budget)
+        logger.warning("Stage %s: %s by the deadline, using fallback", stage.name, reason.replace("_", " "))
+        self.degradations.append({"stage": stage.name, "layer": stage.layer, "reason": reason})
+        return stage.fallback(ctx)
+
+    async def _run_stage(self, stage: Stage, queue: asyncio.Queue) -> None:
+        span = self.spans[stage.name]
+        ctx = StageContext(stage, self.values, queue, self.deadline, self.degradations)
+        degraded = False
+        try:
+            for attempt in range(stage.retries + 1):
+                ctx.attempt = attempt
+                timeout, deadline_bound = self._attempt_timeout(stage)
+                if deadline_bound and timeout <= 0:
+                    degraded = True
+                    outputs = self._degrade(stage, ctx, "skipped", 0.0)
+                    break
+                span.attempts = attempt + 1
+                try:
+                    if timeout is not None:
+                        outputs = await asyncio.wait_for(stage.fn(ctx), timeout=timeout)
+                    else:
+                        outputs = await stage.fn(ctx)
+                    break
+                except asyncio.TimeoutError as e:
+                    if deadline_bound:
+                        degraded = True
+                        try:
+                            outputs = self._degrade(stage, ctx, "timed_out", timeout)
+                        except DeadlineExceededError as exc:
+                            raise exc from e
+                        break
+                    if attempt >= stage.retries:
+                        raise StageTimeoutError(stage.name, stage.layer, stage.timeout) from e
+                    logger.warning("Stage %s: timed out, retrying", stage.name)
+                    STAGE_RETRIES.inc(layer=stage.layer or stage.name)
+                except stage.retry_on as e:
+                    if attempt >= stage.retries:
+                        raise
+                    logger.warning("Stage %s: %s, retrying", stage.name, type(e).__name__)
+                    STAGE_RETRIES.inc(layer=stage.layer or stage.name)
+            outputs = outputs or {}
+            missing = set(stage.outputs) - set(outputs)
+            if missing:
+                raise StageGraphError(f"Stage '{stage.name}' did not produce {sorted(missing)}")
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            span.end = time.monotonic()
+            raise
+        except Exception as e:
+            span.status = "failed"
+            span.end = time.monotonic()
+            queue.put_nowait(("failed", (stage, e)))
+            return
+        degraded = degraded or ctx.degraded
+        span.status = "degraded" if degraded else "ok"
+        span.end = time.monotonic()
+        logger.info("Stage %s (%s): %s in %dms", stage.name, stage.layer or "-",
+                    "degraded" if degraded else "completed", span.duration_ms)
+        queue.put_nowait(("done", (stage, outputs)))
+
+    @property
+    def wall_ms(self) -> int:
+        if self.started_at is None:
+            return 0
+        return int(((self.finished_at or time.monotonic()) - self.started_at) * 1000)
+
+    def layer_timings(self) -> dict[str, int]:
+        """Wall-clock ms per layer, from the first stage start to the last stage end."""
+        bounds: dict[str, list[float]] = {}
+        for span in self.spans.values():
+            if span.layer is None or span.end is None:
+                continue
+            start_end = bounds.setdefault(span.layer, [span.start, span.end])
+            start_end[0] = min(start_end[0], span.start)
+            start_end[1] = max(start_end[1], span.end)
+        return {layer: int((end - start) * 1000) for layer, (start, end) in bounds.items()}
+
+    def span_summary(self) -> dict[str, dict]:
+        origin = self.started_at or 0.0
+        return {
+            name: {
+                "layer": span.layer,
+                "start_ms": int((span.start - origin) * 1000),
+                "duration_ms": span.duration_ms,
+                "attempts": span.attempts,
+                "status": span.status,
+            }
+            for name, span in self.spans.items()
+        }
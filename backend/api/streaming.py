@@ -1,4 +1,20 @@
+"""SSE event construction and wire encoding.
+
+Events travel through the pipeline, caches and stores as ``{"event",
+"data"[, "id"]}`` dicts with ``data`` already serialised to JSON. At the
+response boundary ``encode_event`` turns each into the bytes of an SSE
+frame itself, so sse-starlette passes them through untouched.
+"""
+
 import json
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+SSE_SEP = "\n"
 
 SSE_EVENT_TYPES = [
     "feature_extraction",
@@ -10,29 +26,86 @@ SSE_EVENT_TYPES = [
     "warnings",
     "analysis_complete",
     "progress",
+    "queued",
     "error",
 ]
 
+_EVENT_LINES = {event_type: f"event: {event_type}{SSE_SEP}".encode() for event_type in SSE_EVENT_TYPES}
+
+
+def dumps(data) -> str:
+    """Serialise an event payload, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data)
+
+
+def _event_line(event_type: str) -> bytes:
+    line = _EVENT_LINES.get(event_type)
+    if line is None:
+        line = f"event: {event_type}{SSE_SEP}".encode()
+    return line
+
+
+def _data_lines(data: str) -> bytes:
+    if "\n" not in data and "\r" not in data:
+        return b"data: " + data.encode() + SSE_SEP.encode()
+    return "".join(f"data: {chunk}{SSE_SEP}" for chunk in data.splitlines()).encode()
+
+
+@lru_cache(maxsize=256)
+def _encoded_progress(data: str) -> bytes:
+    # Progress frames come from a small fixed set (the stage start_events)
+    return _EVENT_LINES["progress"] + _data_lines(data) + SSE_SEP.encode()
+
+
+def encode_event(event: dict) -> bytes:
+    """The SSE frame for an event dict, byte-for-byte what sse-starlette writes with ``sep="\\n"``."""
+    if event["event"] == "progress":
+        body = _encoded_progress(event["data"])
+    else:
+        body = _event_line(event["event"]) + _data_lines(event["data"]) + SSE_SEP.encode()
+    event_id = event.get("id")
+    if event_id is None:
+        return body
+    return b"id: " + event_id.encode() + SSE_SEP.encode() + body
+
+
+async def encode_events(events):
+    """Encode an event stream to SSE frames, closing the source when the response ends."""
+    try:
+        async for event in events:
+            yield encode_event(event)
+    finally:
+        await events.aclose()
+
 
 def sse_event(event_type: str, data: dict) -> dict:
     """Create a typed SSE event dict for EventSourceResponse."""
     return {
         "event": event_type,
-        "data": json.dumps(data),
+        "data": dumps(data),
     }
 
 
+def with_event_ids(events: list[dict], after: int = -1) -> list[dict]:
+    """Number a finished event sequence from 0 as SSE ids, keeping those above ``after``."""
+    return [{**event, "id": str(index)} for index, event in enumerate(events) if index > after]
+
+
+@lru_cache(maxsize=256)
+def _progress_data(layer: str, message: str, step: int, total_steps: int) -> str:
+    return dumps({
+        "layer": layer,
+        "message": message,
+        "step": step,
+        "total_steps": total_steps,
+    })
+
+
 def sse_progress(layer: str, message: str, step: int, total_steps: int) -> dict:
     """Create a progress SSE event for pipeline feedback."""
-    return {
-        "event": "progress",
-        "data": json.dumps({
-            "layer": layer,
-            "message": message,
-            "step": step,
-            "total_steps": total_steps,
-        }),
-    }
+    return {"event": "progress", "data": _progress_data(layer, message, step, total_steps)}
 
 
 def sse_error(message: str, layer: str | None = None) -> dict:
@@ -42,5 +115,5 @@ def sse_error(message: str, layer: str | None = None) -> dict:
         payload["layer"] = layer
     return {
         "event": "error",
-        "data": json.dumps(payload),
+        "data": dumps(payload),
     }
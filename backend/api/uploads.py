@@ -0,0 +1,81 @@
+"""Reading a multipart analysis upload straight into memory.
+
+``POST /api/analyze/upload`` takes the screenshot as raw bytes instead of
+base64 inside JSON, saving a third of the upload. Starlette's form parser
+would spool file parts over 1 MB to a temporary file; here each part is
+accumulated in one in-memory buffer as the body streams in, capped at
+MAX_UPLOAD_BYTES.
+"""
+
+import os
+
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+
+async def read_multipart(request: Request, max_bytes: int = MAX_UPLOAD_BYTES) -> dict[str, bytearray]:
+    """Read a multipart/form-data body into ``{part name: contents}``.
+
+    Raises HTTPException 415 for any other content type, 400 for a
+    malformed body and 413 once the body exceeds ``max_bytes``.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(415, "Expected a multipart/form-data body")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(413, f"Upload exceeds {max_bytes} bytes")
+
+    parts: dict[str, bytearray] = {}
+    headers: dict[bytes, bytes] = {}
+    field = bytearray()
+    value = bytearray()
+    current: bytearray | None = None
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(field).lower()] = bytes(value)
+        field.clear()
+        value.clear()
+
+    def on_headers_finished():
+        nonlocal current
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        current = parts.setdefault(name, bytearray())
+
+    def on_part_data(data, start, end):
+        current.extend(data[start:end])
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise HTTPException(413, f"Upload exceeds {max_bytes} bytes")
+            parser.write(chunk)
+        parser.finalize()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(400, f"Malformed multipart body: {e}") from e
+    return parts
@@ -0,0 +1,106 @@
+"""The shared VLM inference process: one PaliGemma copy for every API worker.
+
+Started by api.serve before it forks the workers, or by hand:
+
+    python -m api.vlm_server --socket /tmp/toleranceai-vlm.sock
+    VLM_SERVER_SOCKET=/tmp/toleranceai-vlm.sock uvicorn api.main:app --workers 4
+
+Workers reach it through models.remote_vlm_client. Generations run one at
+a time (VLM_SERVER_CONCURRENCY): concurrent requests would only share the
+same GPU, and its frame cache serves all workers.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from PIL import UnidentifiedImageError
+
+from .components import VLM_LOAD_TIMEOUT
+from models.mlx_vlm_client import MlxVlmClient, MlxVlmTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.environ.get("VLM_SERVER_SOCKET", "/tmp/toleranceai-vlm.sock")
+CONCURRENCY = int(os.environ.get("VLM_SERVER_CONCURRENCY", "1"))
+
+
+async def _load(app: FastAPI) -> None:
+    vlm = app.state.client_factory()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(vlm.load), timeout=VLM_LOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        app.state.load_error = f"mlx-vlm load timed out ({VLM_LOAD_TIMEOUT:.0f}s)"
+    except Exception as e:
+        app.state.load_error = str(e)
+    else:
+        app.state.vlm = vlm
+        logger.info("VLM server: %s loaded", vlm.MODEL_ID)
+        return
+    logger.error("VLM server: model failed to load: %s", app.state.load_error)
+
+
+def create_app(client_factory=MlxVlmClient) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.client_factory = client_factory
+        app.state.vlm = None
+        app.state.load_error = None
+        app.state.slots = asyncio.Semaphore(CONCURRENCY)
+        loading = asyncio.create_task(_load(app))
+        yield
+        loading.cancel()
+        await asyncio.gather(loading, return_exceptions=True)
+
+    app = FastAPI(title="ToleranceAI VLM server", lifespan=lifespan)
+
+    def loaded_vlm(request: Request) -> MlxVlmClient:
+        vlm = request.app.state.vlm
+        if vlm is None:
+            raise HTTPException(503, request.app.state.load_error or "Model still loading")
+        return vlm
+
+    @app.post("/describe")
+    async def describe(request: Request, max_distance: int | None = None):
+        vlm = loaded_vlm(request)
+        image = await request.body()
+        if not image:
+            raise HTTPException(400, "Empty image")
+        try:
+            async with request.app.state.slots:
+                return {"description": await vlm.describe_image(image, max_distance)}
+        except MlxVlmTimeoutError as e:
+            raise HTTPException(504, str(e))
+        except (UnidentifiedImageError, OSError) as e:
+            raise HTTPException(400, f"Invalid image: {e}")
+
+    @app.post("/warm-up")
+    async def warm_up(request: Request):
+        vlm = loaded_vlm(request)
+        async with request.app.state.slots:
+            return {"seconds": await vlm.warm_up()}
+
+    @app.get("/health")
+    async def health(request: Request):
+        vlm = request.app.state.vlm
+        result = {"loaded": vlm is not None, "error": request.app.state.load_error, "pid": os.getpid()}
+        if vlm is not None and vlm.frame_cache is not None:
+            result["frame_cache"] = vlm.frame_cache.stats()
+        return result
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Serve the ToleranceAI VLM to local API workers")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    args = parser.parse_args()
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    uvicorn.run(create_app(), uds=args.socket, log_level="warning")
@@ -0,0 +1,104 @@
+"""Warming the models up after startup and keeping them loaded.
+
+Without this, the first analysis after boot pays for Ollama loading
+gemma3:1b and for PaliGemma compiling its kernels, a 10+ second hang.
+ModelWarmer runs a one-token generation on every Ollama model the
+pipeline uses and one blank frame through the VLM, all at once, and
+records how long each took on ``state.readiness``.
+
+Ollama unloads a model ``keep_alive`` (OLLAMA_KEEP_ALIVE, default 30m)
+after its last request. Pinning with ``keep_alive=-1`` would keep it
+loaded after the server stops, so instead a background refresher resets
+the timer every MODEL_KEEP_ALIVE_INTERVAL seconds while the server runs.
+The VLM lives in this process and needs no refreshing.
+"""
+
+import asyncio
+import logging
+import os
+
+from .pipeline import BASE_MODEL, FINETUNED_MODEL
+from models.gemma import OllamaUnavailableError
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("MODEL_WARMUP", "1") != "0"
+KEEP_ALIVE_INTERVAL = float(os.environ.get("MODEL_KEEP_ALIVE_INTERVAL", "300"))
+
+# The Ollama models the pipeline calls, in order, without duplicates
+PIPELINE_MODELS = tuple(dict.fromkeys((FINETUNED_MODEL, BASE_MODEL)))
+
+
+class ModelWarmer:
+    """Warms ``models`` and the VLM once, then keeps the Ollama models resident."""
+
+    def __init__(self, state, models: tuple[str, ...] = PIPELINE_MODELS,
+                 interval: float = KEEP_ALIVE_INTERVAL):
+        self.state = state
+        self.models = models
+        self.interval = interval
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._task: asyncio.Task | None = None
+
+    def _warm_ups(self) -> dict:
+        ollama = self.state.ollama
+        warm_ups = {f"ollama:{model}": (lambda model=model: ollama.warm_up(model)) for model in self.models}
+        vlm = getattr(self.state, "vlm", None)
+        if vlm is not None:
+            warm_ups["vlm"] = vlm.warm_up
+        return warm_ups
+
+    async def warm_up(self) -> None:
+        warm_ups = self._warm_ups()
+        readiness = self.state.readiness
+        readiness.begin_warmup(warm_ups)
+
+        async def run(name, warm_up):
+            try:
+                readiness.mark_warm(name, await warm_up())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("%s stays cold: %s", name, e)
+                readiness.mark_warm(name, None, str(e))
+
+        await asyncio.gather(*(run(name, warm_up) for name, warm_up in warm_ups.items()))
+
+    def start(self) -> None:
+        if self.models and self.interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self) -> None:
+        ollama = self.state.ollama
+        for model in self.models:
+            try:
+                await ollama.keep_resident(model)
+                self.refreshes += 1
+            except OllamaUnavailableError as e:
+                self.refresh_failures += 1
+                logger.warning("Could not keep %s loaded: %s", model, e)
+        try:
+            await ollama.refresh_residency()
+        except OllamaUnavailableError as e:
+            logger.warning("Could not refresh Ollama residency: %s", e)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    def stats(self) -> dict:
+        return {
+            "models": list(self.models),
+            "keep_alive": self.state.ollama.keep_alive,
+            "refresh_interval_s": self.interval,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
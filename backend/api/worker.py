@@ -0,0 +1,60 @@
+"""Standalone job worker: loads the pipeline components and runs queued jobs.
+
+Lets inference run on different processes or machines from the API:
+
+    JOB_QUEUE_URL=sqlite:///path/to/jobs.db JOB_WORKERS=0 uvicorn api.main:app
+    JOB_QUEUE_URL=sqlite:///path/to/jobs.db python -m api.worker --concurrency 2
+
+The in-process queue (``memory://``) cannot be shared, so a standalone
+worker needs the SQLite or Redis-protocol backend.
+"""
+
+import argparse
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from .brain_reload import BrainReloader
+from .components import close_components, load_components
+from .job_queues import open_job_queue
+from .jobs import DEFAULT_WORKER_CONCURRENCY, JobWorker
+from .warmup import WARMUP_ENABLED, ModelWarmer
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(queue_url: str | None, concurrency: int) -> None:
+    queue = await open_job_queue(queue_url)
+    if queue.backend == "memory":
+        await queue.close()
+        raise SystemExit("A standalone worker needs a shared queue: set JOB_QUEUE_URL to sqlite:// or redis://")
+    state = SimpleNamespace()
+    await load_components(state)
+    reloader = BrainReloader(state)
+    reloader.start()
+    warmer = ModelWarmer(state) if WARMUP_ENABLED else None
+    if warmer is not None:
+        await warmer.warm_up()
+        warmer.start()
+    worker = JobWorker(state, queue, concurrency=max(1, concurrency))
+    try:
+        await worker.run()
+    finally:
+        logger.info("Job worker stopping: %s", worker.stats())
+        if warmer is not None:
+            await warmer.stop()
+        await reloader.stop()
+        await queue.close()
+        await close_components(state)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Run queued ToleranceAI analysis jobs")
+    parser.add_argument("--queue", default=None, help="Queue URL (default: JOB_QUEUE_URL)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_worker(args.queue, args.concurrency))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiosqlite
+
+from models.metrics import SQLITE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_FLUSH_INTERVAL = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    analysis_id TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    description TEXT,
+    total_latency_ms INTEGER,
+    stages TEXT,
+    events TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at DESC);
+"""
+
+
+class AnalysisStore:
+    """SQLite history of finished analyses, keyed by analysis_id.
+
+    ``save`` only queues the record: a background writer commits queued
+    records in batches (every ``flush_interval`` seconds or ``batch_size``
+    records), so the SSE stream never waits on disk. Reads see queued
+    records before they are committed.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        clock=time.time,
+    ):
+        self.conn: aiosqlite.Connection | None = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._pending: dict[str, tuple] = {}
+        self._wake = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.saved = 0
+        self.batches = 0
+
+    @classmethod
+    async def open(cls, path: str, **kwargs) -> "AnalysisStore":
+        store = cls(**kwargs)
+        store.conn = await aiosqlite.connect(path)
+        async with store.conn.execute("PRAGMA journal_mode=WAL"):
+            pass
+        # Other worker processes write to the same file
+        async with store.conn.execute("PRAGMA busy_timeout=5000"):
+            pass
+        await store.conn.executescript(SCHEMA)
+        await store.conn.commit()
+        store._writer = asyncio.create_task(store._write_loop())
+        return store
+
+    def save(self, analysis_id: str, request_hash: str, events: list[dict], description: str = "") -> None:
+        """Queue a finished analysis (its full SSE event sequence) for writing."""
+        status = "complete"
+        total_latency_ms = None
+        stages = None
+        last = events[-1] if events else {}
+        if last.get("event") == "analysis_complete":
+            metadata = json.loads(last["data"]).get("metadata", {})
+            total_latency_ms = metadata.get("total_latency_ms")
+            stages = json.dumps(metadata.get("stages", {}))
+        else:
+            status = "error"
+        self._pending[analysis_id] = (
+            analysis_id, request_hash, status, description[:500], total_latency_ms, stages,
+            json.dumps([{"event": e["event"], "data": e["data"]} for e in events]),
+            self._clock(),
+        )
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    async def _write_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except aiosqlite.Error as e:
+                logger.warning("Analysis store write failed, will retry: %s", e)
+
+    async def flush(self) -> int:
+        """Commit every queued record in one transaction. Returns the number written."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            with SQLITE_LATENCY.time(operation="analysis_store_write"):
+                await self.conn.executemany(
+                    "INSERT OR REPLACE INTO analyses (analysis_id, request_hash, status, description, "
+                    "total_latency_ms, stages, events, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+                await self.conn.commit()
+            # Only drop what was written; records queued meanwhile stay pending
+            for row in batch:
+                if self._pending.get(row[0]) is row:
+                    del self._pending[row[0]]
+            self.saved += len(batch)
+            self.batches += 1
+        logger.debug("Analysis store committed %d records", len(batch))
+        return len(batch)
+
+    @staticmethod
+    def _record(row: tuple, with_events: bool) -> dict:
+        analysis_id, request_hash, status, description, total_latency_ms, stages, events, created_at = row
+        record = {
+            "analysis_id": analysis_id,
+            "request_hash": request_hash,
+            "status": status,
+            "description": description,
+            "total_latency_ms": total_latency_ms,
+            "created_at": created_at,
+        }
+        if with_events:
+            record["stages"] = json.loads(stages) if stages else {}
+            record["events"] = [
+                {"event": e["event"], "data": json.loads(e["data"])} for e in json.loads(events)
+            ]
+        return record
+
+    async def get(self, analysis_id: str) -> dict | None:
+        """The stored analysis with its parsed event payloads, or None."""
+        row = self._pending.get(analysis_id)
+        if row is None:
+            with SQLITE_LATENCY.time(operation="analysis_store_read"):
+                async with self.conn.execute(
+                    "SELECT analysis_id, request_hash, status, description, total_latency_ms, "
+                    "stages, events, created_at FROM analyses WHERE analysis_id = ?",
+                    (analysis_id,),
+                ) as cursor:
+                    row = await cursor.fetchone()
+        if row is None:
+            return None
+        return self._record(tuple(row), with_events=True)
+
+    async def list(self, limit: int = 20, offset: int = 0) -> tuple[list[dict], int]:
+        """Newest-first summaries (without events), and the total count."""
+        await self.flush()
+        with SQLITE_LATENCY.time(operation="analysis_store_read"):
+            async with self.conn.execute(
+                "SELECT analysis_id, request_hash, status, description, total_latency_ms, "
+                "NULL, NULL, created_at FROM analyses ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ) as cursor:
+                rows = await cursor.fetchall()
+            async with self.conn.execute("SELECT COUNT(*) FROM analyses") as cursor:
+                total = (await cursor.fetchone())[0]
+        return [self._record(tuple(row), with_events=False) for row in rows], total
+
+    def stats(self) -> dict:
+        return {"saved": self.saved, "batches": self.batches, "pending": len(self._pending)}
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        if self.conn:
+            try:
+                await self.flush()
+            finally:
+                await self.conn.close()
@@ -1,6 +1,8 @@
 import aiosqlite
 from pathlib import Path
 
+from models.metrics import SQLITE_LATENCY
+
 
 class Database:
     def __init__(self):
@@ -15,22 +17,28 @@ class Database:
                 f"Run 'python scripts/seed_database.py' first."
             )
         db = cls()
-        db.conn = await aiosqlite.connect(str(db_path))
+        # mode=rw: if the file disappears after the check above, fail rather than create an empty one
+        db.conn = await aiosqlite.connect(f"{db_path.resolve().as_uri()}?mode=rw", uri=True)
         db.conn.row_factory = aiosqlite.Row
-        await db.conn.execute("PRAGMA journal_mode=WAL")
+        # Closed straight away: left open, the statement keeps a lock that
+        # makes seed_database.py fail with "database is locked"
+        async with db.conn.execute("PRAGMA journal_mode=WAL"):
+            pass
         return db
 
     async def fetchone(self, query: str, params: tuple = ()) -> dict | None:
-        async with self.conn.execute(query, params) as cursor:
-            row = await cursor.fetchone()
-            if row is None:
-                return None
-            return dict(row)
+        with SQLITE_LATENCY.time(operation="fetchone"):
+            async with self.conn.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return dict(row)
 
     async def fetchall(self, query: str, params: tuple = ()) -> list[dict]:
-        async with self.conn.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        with SQLITE_LATENCY.time(operation="fetchall"):
+            async with self.conn.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
 
     async def close(self):
         if self.conn:
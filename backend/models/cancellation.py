@@ -0,0 +1,39 @@
+"""Accounting for model work abandoned because nobody was waiting for it."""
+
+import logging
+
+from .metrics import CANCELLED_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationStats:
+    """Per-component count of cancelled calls and the work they gave back.
+
+    ``elapsed_ms`` is time the call had already run when it was abandoned;
+    ``tokens_skipped`` counts generation steps that were never run, where a
+    component can tell (the VLM knows its token limit, Ollama does not).
+    """
+
+    def __init__(self):
+        self._components: dict[str, dict] = {}
+
+    def record(self, component: str, elapsed_s: float, tokens_skipped: int = 0) -> None:
+        entry = self._components.setdefault(
+            component, {"calls": 0, "elapsed_ms": 0, "tokens_skipped": 0}
+        )
+        entry["calls"] += 1
+        entry["elapsed_ms"] += int(elapsed_s * 1000)
+        entry["tokens_skipped"] += tokens_skipped
+        CANCELLED_CALLS.inc(component=component)
+        logger.info("%s call cancelled after %.0fms (%d tokens skipped)",
+                    component, elapsed_s * 1000, tokens_skipped)
+
+    def stats(self) -> dict:
+        return {component: dict(entry) for component, entry in self._components.items()}
+
+    def reset(self) -> None:
+        self._components.clear()
+
+
+cancellations = CancellationStats()
@@ -1,14 +1,53 @@
+import hashlib
+import io
 import logging
+import os
 import time
 
 import numpy as np
 from pathlib import Path
 
+from .metrics import EMBEDDER_LATENCY
+
 logger = logging.getLogger(__name__)
 
 
+def _matrix_path(emb_path: Path, raw: bytes) -> Path:
+    """The .npy extracted from the .npz whose bytes are ``raw``.
+
+    Named after a hash of the content, so a rewritten, copied or restored
+    .npz never picks up a matrix extracted from another version.
+    """
+    return emb_path.with_name(f"{emb_path.stem}.{hashlib.sha256(raw).hexdigest()[:16]}.npy")
+
+
+def write_matrix(embeddings_path: str | Path) -> Path:
+    """Extract the embedding matrix of an .npz to the .npy that load_embeddings maps.
+
+    Run once per .npz, by scripts/embed_standards.py or the api.serve parent
+    before it forks; matrices extracted from earlier versions are removed.
+    """
+    emb_path = Path(embeddings_path)
+    raw = emb_path.read_bytes()
+    matrix_path = _matrix_path(emb_path, raw)
+    if not matrix_path.exists():
+        with np.load(io.BytesIO(raw)) as data:
+            matrix = np.ascontiguousarray(data["embeddings"], dtype=np.float32)
+        # Written under a temporary name: workers may be starting up
+        partial = matrix_path.with_name(f"{matrix_path.name}.{os.getpid()}.tmp")
+        with open(partial, "wb") as f:
+            np.save(f, matrix)
+        os.replace(partial, matrix_path)
+    for stale in emb_path.parent.glob(f"{emb_path.stem}.*.npy"):
+        if stale != matrix_path:
+            stale.unlink(missing_ok=True)
+    return matrix_path
+
+
 class Embedder:
-    def __init__(self):
+    def __init__(self, device: str | None = None):
+        # None lets sentence-transformers pick (MPS/CUDA when available)
+        self.device = device
         self.model = None
         self.standard_embeddings: np.ndarray | None = None
         self.standard_keys: list[str] = []
@@ -21,18 +60,46 @@ class Embedder:
         from sentence_transformers import SentenceTransformer
 
         t0 = time.monotonic()
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
         logger.info("Sentence-transformer loaded in %.1fs", time.monotonic() - t0)
+        self.load_embeddings(embeddings_path)
 
+    def load_embeddings(self, embeddings_path: str) -> None:
+        """Load the pre-computed embedding matrix and its keys.
+
+        Arrays in an .npz are read into private memory by every process. When
+        ``write_matrix`` has extracted the matrix to a sibling .npy for this
+        exact .npz, that file is memory-mapped read-only instead, so all
+        workers on the machine share one copy in the page cache. Nothing is
+        written here: the data directory may be read-only.
+        """
         emb_path = Path(embeddings_path)
-        if emb_path.exists():
-            data = np.load(str(emb_path))
-            self.standard_embeddings = data["embeddings"]
+        if not emb_path.exists():
+            logger.warning("Embeddings file not found: %s", embeddings_path)
+            return
+        raw = emb_path.read_bytes()
+        matrix_path = _matrix_path(emb_path, raw)
+        with np.load(io.BytesIO(raw)) as data:
             keys_field = "keys" if "keys" in data else "ids"
             self.standard_keys = data[keys_field].tolist()
-            logger.info("Loaded %d standard embeddings from %s", len(self.standard_keys), emb_path.name)
-        else:
-            logger.warning("Embeddings file not found: %s", embeddings_path)
+            if not matrix_path.exists():
+                self.standard_embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+                logger.info("Loaded %d standard embeddings into memory (no %s)",
+                            len(self.standard_keys), matrix_path.name)
+                return
+        self.standard_embeddings = np.load(str(matrix_path), mmap_mode="r")
+        logger.info("Mapped %d standard embeddings from %s", len(self.standard_keys), matrix_path.name)
+
+    def reloaded(self, embeddings_path: str) -> "Embedder":
+        """A new Embedder with the embeddings at ``embeddings_path`` and this one's model.
+
+        Leaves this instance untouched, so queries already running on it finish
+        against the old embeddings.
+        """
+        embedder = Embedder(device=self.device)
+        embedder.model = self.model
+        embedder.load_embeddings(embeddings_path)
+        return embedder
 
     def match_standards(self, query: str, top_k: int = 5) -> list[dict]:
         """Find top-K ASME Y14.5 sections most relevant to the query."""
@@ -41,7 +108,8 @@ class Embedder:
             return []
 
         t0 = time.monotonic()
-        query_embedding = self.model.encode(query, normalize_embeddings=True)
+        with EMBEDDER_LATENCY.time():
+            query_embedding = self.model.encode(query, normalize_embeddings=True)
         similarities = np.dot(self.standard_embeddings, query_embedding)
         top_k = min(top_k, len(self.standard_keys))
         top_indices = np.argsort(similarities)[::-1][:top_k]
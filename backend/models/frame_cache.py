@@ -0,0 +1,113 @@
+"""Reuse of VLM descriptions for frames that look the same.
+
+Screen captures of an unchanged CAD view differ only by cursor position or
+antialiasing, so their exact bytes (and the result cache key) change while
+the description would not. Frames are compared by a 64-bit difference hash
+instead: two frames whose hashes are within ``max_distance`` bits of each
+other share a description.
+
+The hash is taken over the whole screenshot, where the CAD window's UI
+chrome dominates a 9x8 thumbnail, so two different parts or views can land
+a few bits apart. One-shot analyses therefore only reuse a description for
+an identical hash. Live capture, where consecutive frames of one session
+are mostly the same view, accepts up to ``LIVE_MAX_DISTANCE`` bits.
+"""
+
+import io
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .metrics import VLM_FRAME_CACHE, VLM_FRAME_DISTANCE
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DEFAULT_MAX_ENTRIES = int(os.environ.get("VLM_FRAME_CACHE_ENTRIES", "64"))
+# Bits (of 64) two frame hashes may differ by and still share a description
+DEFAULT_MAX_DISTANCE = 0
+LIVE_MAX_DISTANCE = int(os.environ.get("VLM_FRAME_MAX_DISTANCE", "4"))
+
+
+def dhash(image_bytes: bytes) -> int:
+    """64-bit difference hash: sign of the horizontal gradient of a 9x8 grayscale thumbnail."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))
+        pixels = np.asarray(
+            image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS),
+            dtype=np.int16,
+        )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class FrameDescriptionCache:
+    """LRU cache of recent descriptions, looked up by nearest frame hash.
+
+    Every lookup records the distance to the nearest cached frame (a miss
+    included), so the distribution shows where ``max_distance`` should sit.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries: OrderedDict[int, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.distances = [0] * (HASH_BITS + 1)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, frame_hash: int, max_distance: int | None = None) -> str | None:
+        """The description of the nearest cached frame within ``max_distance``, or None.
+
+        ``max_distance`` defaults to the cache's own.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        nearest, distance = None, None
+        for cached_hash in self._entries:
+            d = hamming(frame_hash, cached_hash)
+            if distance is None or d < distance:
+                nearest, distance = cached_hash, d
+        if distance is not None:
+            self.distances[distance] += 1
+            VLM_FRAME_DISTANCE.observe(distance)
+        if distance is None or distance > max_distance:
+            self.misses += 1
+            VLM_FRAME_CACHE.inc(result="miss")
+            return None
+        self.hits += 1
+        VLM_FRAME_CACHE.inc(result="hit")
+        self._entries.move_to_end(nearest)
+        logger.info("Frame description reused (hash distance %d)", distance)
+        return self._entries[nearest]
+
+    def put(self, frame_hash: int, description: str) -> None:
+        self._entries[frame_hash] = description
+        self._entries.move_to_end(frame_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "max_distance": self.max_distance,
+            "distance_histogram": {d: n for d, n in enumerate(self.distances) if n},
+        }
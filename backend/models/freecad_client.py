@@ -1,9 +1,13 @@
+import asyncio
 import json
 import logging
+import time
 
 import httpx
 
+from .cancellation import cancellations
 from .freecad_extraction import EXTRACTION_SCRIPT
+from .metrics import FREECAD_LATENCY
 from .mock_cad_contexts import get_desk_mock
 
 logger = logging.getLogger(__name__)
@@ -61,9 +65,16 @@ class FreecadClient:
             "params": {"code": code},
             "id": 1,
         }
+        t0 = time.monotonic()
         try:
-            resp = await self._client.post(self.base_url, json=payload)
+            with FREECAD_LATENCY.time():
+                resp = await self._client.post(self.base_url, json=payload)
             resp.raise_for_status()
+        except asyncio.CancelledError:
+            # Closing the request frees our side; a script already running
+            # inside FreeCAD finishes there regardless.
+            cancellations.record("freecad", time.monotonic() - t0)
+            raise
         except httpx.ConnectError as e:
             logger.error("FreeCAD RPC connection failed: %s", e)
             raise FreecadConnectionError(
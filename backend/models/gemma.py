@@ -1,25 +1,79 @@
+import asyncio
 import json
 import logging
+import os
 import time
+from contextlib import aclosing
 
+import aiosqlite
 import httpx
 
+from .cancellation import cancellations
+from .json_stream import StreamingArrayParser
+from .llm_cache import LLMResponseCache
+from .metrics import OLLAMA_IN_FLIGHT, OLLAMA_LATENCY, STAGE_RETRIES
+from .ollama_scheduler import PRIORITY_BACKGROUND, OllamaScheduler
+from .resilience import CircuitBreaker, RetryPolicy
+
 logger = logging.getLogger(__name__)
 
+# How long Ollama keeps a model loaded after each request (its default is 5m)
+DEFAULT_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
 
 class OllamaUnavailableError(Exception):
     """Raised when Ollama server is not reachable."""
     pass
 
 
+class OllamaCircuitOpenError(OllamaUnavailableError):
+    """Raised without contacting Ollama while a model's circuit breaker is open."""
+    pass
+
+
+class OllamaRequestError(OllamaUnavailableError):
+    """Raised when Ollama rejects the request itself (4xx, e.g. an unknown model).
+
+    Retrying would get the same answer, so it is neither retried nor
+    counted against the model's circuit breaker.
+    """
+    pass
+
+
 class OllamaParseError(Exception):
     """Raised when Ollama returns non-JSON or unparseable output."""
     pass
 
 
+def _status_error(e: httpx.HTTPStatusError, model: str, breaker: CircuitBreaker) -> OllamaUnavailableError:
+    """The error to raise for an HTTP error status, recording the outcome on ``breaker``."""
+    status = e.response.status_code
+    logger.error("Ollama HTTP %d for model=%s", status, model)
+    message = f"Ollama returned {status} for model {model}"
+    if status < 500:
+        # Ollama is up and answered; only the request was wrong
+        breaker.record_abandoned()
+        return OllamaRequestError(message)
+    breaker.record_failure()
+    return OllamaUnavailableError(message)
+
+
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        cache: LLMResponseCache | None = None,
+        scheduler: OllamaScheduler | None = None,
+        retry_policy: RetryPolicy | None = None,
+        keep_alive: str | None = DEFAULT_KEEP_ALIVE,
+    ):
         self.base_url = base_url
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.scheduler = scheduler or OllamaScheduler()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._residency_refresh: asyncio.Task | None = None
         self.client = httpx.AsyncClient(
             base_url=base_url,
             timeout=httpx.Timeout(90.0, connect=5.0),
@@ -36,12 +90,75 @@ class OllamaClient:
                 f"Ollama not reachable at {self.base_url}: {e}"
             ) from e
 
+    async def refresh_residency(self) -> list[str]:
+        """GET /api/ps -- tell the scheduler which models Ollama has loaded right now."""
+        try:
+            resp = await self.client.get("/api/ps")
+            resp.raise_for_status()
+        except (httpx.ConnectError, httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            raise OllamaUnavailableError(f"Ollama /api/ps failed: {e}") from e
+        models = [m.get("model") or m["name"] for m in resp.json().get("models", [])]
+        self.scheduler.set_resident(models)
+        return models
+
+    def _record_load(self, model: str, body: dict) -> None:
+        """Pass a response's load_duration to the scheduler; re-check /api/ps after a load."""
+        load_ns = body.get("load_duration")
+        if load_ns is None or not self.scheduler.record_load(model, load_ns / 1e9):
+            return
+        # Loading this model may have evicted another one
+        if self._residency_refresh is None or self._residency_refresh.done():
+            self._residency_refresh = asyncio.create_task(self._refresh_residency_quietly())
+
+    async def _refresh_residency_quietly(self) -> None:
+        try:
+            await self.refresh_residency()
+        except OllamaUnavailableError as e:
+            logger.warning("Could not refresh Ollama residency: %s", e)
+
+    async def warm_up(self, model: str) -> float:
+        """Load ``model`` and generate one token, so the first real request skips both.
+
+        Runs in a background scheduler slot. Returns the seconds it took.
+        """
+        payload = {"model": model, "prompt": "ok", "stream": False, "options": {"num_predict": 1}}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        t0 = time.monotonic()
+        try:
+            async with self.scheduler.slot(PRIORITY_BACKGROUND, model=model):
+                resp = await self.client.post("/api/generate", json=payload)
+            resp.raise_for_status()
+        except (httpx.ConnectError, httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            raise OllamaUnavailableError(f"Warm-up of {model} failed: {e}") from e
+        self._record_load(model, resp.json())
+        elapsed = time.monotonic() - t0
+        logger.info("Ollama model=%s warmed up in %.1fs", model, elapsed)
+        return elapsed
+
+    async def keep_resident(self, model: str) -> None:
+        """Restart ``model``'s keep_alive timer, loading it again if Ollama evicted it.
+
+        A request without a prompt generates nothing, so no scheduler slot is taken.
+        With ``keep_alive`` unset Ollama applies its own default, as for other requests.
+        """
+        payload = {"model": model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        try:
+            resp = await self.client.post("/api/generate", json=payload)
+            resp.raise_for_status()
+        except (httpx.ConnectError, httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            raise OllamaUnavailableError(f"Keep-alive of {model} failed: {e}") from e
+        self._record_load(model, resp.json())
+
     async def chat(
         self,
         model: str,
         messages: list[dict],
         format: str = "json",
         images: list[str] | None = None,
+        options: dict | None = None,
     ) -> dict:
         """Send a chat completion request to Ollama /api/chat."""
         if images:
@@ -53,42 +170,277 @@ class OllamaClient:
             "format": format,
             "stream": False,
         }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+
+        started = time.monotonic()
+        for attempt in range(self.retry_policy.max_attempts):
+            try:
+                return await self._chat_once(model, payload)
+            except (OllamaCircuitOpenError, OllamaRequestError):
+                raise
+            except OllamaUnavailableError as e:
+                delay = self.retry_policy.next_delay(attempt, time.monotonic() - started)
+                if delay is None:
+                    raise
+                logger.warning("Ollama model=%s unavailable (%s), retrying in %.2fs", model, e, delay)
+                STAGE_RETRIES.inc(layer="ollama")
+                await asyncio.sleep(delay)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """The circuit breaker guarding calls to ``model``."""
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(name=f"ollama:{model}")
+        return breaker
 
+    def _admit(self, model: str) -> CircuitBreaker:
+        breaker = self.breaker(model)
+        if not breaker.allow():
+            raise OllamaCircuitOpenError(
+                f"Ollama circuit open for model {model}, retry in {breaker.retry_after():.0f}s"
+            )
+        return breaker
+
+    async def _chat_once(self, model: str, payload: dict) -> dict:
+        breaker = self._admit(model)
         t0 = time.monotonic()
         logger.info("Ollama /api/chat request to model=%s", model)
         try:
-            resp = await self.client.post("/api/chat", json=payload)
+            async with self.scheduler.slot(model=model):
+                with OLLAMA_IN_FLIGHT.track_inprogress(), OLLAMA_LATENCY.time(model=model, mode="chat"):
+                    resp = await self.client.post("/api/chat", json=payload)
             resp.raise_for_status()
+        except asyncio.CancelledError:
+            # httpx closes the connection on cancellation, which stops Ollama generating
+            breaker.record_abandoned()
+            cancellations.record("ollama", time.monotonic() - t0)
+            raise
         except httpx.ConnectError as e:
+            breaker.record_failure()
             logger.error("Ollama connection failed: %s", e)
             raise OllamaUnavailableError(str(e)) from e
         except httpx.TimeoutException as e:
+            breaker.record_failure()
             logger.error("Ollama timed out after %.1fs for model=%s", time.monotonic() - t0, model)
             raise OllamaUnavailableError(
                 f"Ollama timed out on model {model}"
             ) from e
         except httpx.HTTPStatusError as e:
-            logger.error("Ollama HTTP %d for model=%s", e.response.status_code, model)
-            raise OllamaUnavailableError(
-                f"Ollama returned {e.response.status_code} for model {model}"
-            ) from e
+            raise _status_error(e, model, breaker) from e
+        except BaseException:
+            breaker.record_abandoned()
+            raise
+        breaker.record_success()
 
         elapsed = time.monotonic() - t0
         logger.info("Ollama /api/chat completed in %.1fs for model=%s", elapsed, model)
-        return resp.json()
+        body = resp.json()
+        self._record_load(model, body)
+        return body
 
-    async def chat_json(self, model: str, messages: list[dict], **kwargs) -> dict:
-        """Chat and parse the response content as JSON."""
-        result = await self.chat(model, messages, format="json", **kwargs)
+    async def chat_stream(
+        self,
+        model: str,
+        messages: list[dict],
+        format: str = "json",
+        options: dict | None = None,
+    ):
+        """Stream a chat completion from Ollama /api/chat, yielding content tokens.
+
+        Consumes Ollama's NDJSON stream (one JSON object per line, ``done`` on
+        the last) so callers can act on the response while it is generated.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "format": format,
+            "stream": True,
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+
+        started = time.monotonic()
+        for attempt in range(self.retry_policy.max_attempts):
+            received = False
+            try:
+                async with aclosing(self._chat_stream_once(model, payload)) as stream:
+                    async for content in stream:
+                        received = True
+                        yield content
+                return
+            except (OllamaCircuitOpenError, OllamaRequestError):
+                raise
+            except OllamaUnavailableError as e:
+                # Only retry before anything was yielded; a caller can't un-see tokens
+                delay = None if received else self.retry_policy.next_delay(attempt, time.monotonic() - started)
+                if delay is None:
+                    raise
+                logger.warning("Ollama model=%s unavailable (%s), retrying stream in %.2fs", model, e, delay)
+                STAGE_RETRIES.inc(layer="ollama")
+                await asyncio.sleep(delay)
+
+    async def _chat_stream_once(self, model: str, payload: dict):
+        breaker = self._admit(model)
+        t0 = time.monotonic()
+        first_token_at = None
+        logger.info("Ollama /api/chat stream request to model=%s", model)
+        try:
+            async with self.scheduler.slot(model=model):
+                with OLLAMA_IN_FLIGHT.track_inprogress(), OLLAMA_LATENCY.time(model=model, mode="stream"):
+                    async with self.client.stream("POST", "/api/chat", json=payload) as resp:
+                        resp.raise_for_status()
+                        async for line in resp.aiter_lines():
+                            if not line.strip():
+                                continue
+                            try:
+                                chunk = json.loads(line)
+                            except json.JSONDecodeError as e:
+                                raise OllamaParseError(
+                                    f"Model {model} sent a malformed stream chunk: {line[:200]}"
+                                ) from e
+                            if chunk.get("error"):
+                                raise OllamaUnavailableError(
+                                    f"Ollama stream error for model {model}: {chunk['error']}"
+                                )
+                            content = chunk.get("message", {}).get("content", "")
+                            if content:
+                                if first_token_at is None:
+                                    first_token_at = time.monotonic()
+                                    logger.info("Ollama first token after %.0fms for model=%s",
+                                                (first_token_at - t0) * 1000, model)
+                                yield content
+                            if chunk.get("done"):
+                                self._record_load(model, chunk)
+                                break
+        except (asyncio.CancelledError, GeneratorExit):
+            # Leaving the stream block closes the response, so Ollama stops generating
+            breaker.record_abandoned()
+            cancellations.record("ollama", time.monotonic() - t0)
+            raise
+        except OllamaUnavailableError:
+            breaker.record_failure()
+            raise
+        except OllamaParseError:
+            # The server answered; a malformed stream is not an availability failure
+            breaker.record_success()
+            raise
+        except httpx.ConnectError as e:
+            breaker.record_failure()
+            logger.error("Ollama connection failed: %s", e)
+            raise OllamaUnavailableError(str(e)) from e
+        except httpx.TimeoutException as e:
+            breaker.record_failure()
+            logger.error("Ollama stream timed out after %.1fs for model=%s", time.monotonic() - t0, model)
+            raise OllamaUnavailableError(
+                f"Ollama timed out on model {model}"
+            ) from e
+        except httpx.HTTPStatusError as e:
+            raise _status_error(e, model, breaker) from e
+        except BaseException:
+            breaker.record_abandoned()
+            raise
+        breaker.record_success()
+
+        logger.info("Ollama /api/chat stream completed in %.1fs for model=%s", time.monotonic() - t0, model)
+
+    async def chat_json_stream(
+        self,
+        model: str,
+        messages: list[dict],
+        array_key: str,
+        options: dict | None = None,
+        use_cache: bool = True,
+    ):
+        """Stream a JSON response, yielding ("item", obj) per closed ``array_key`` element
+        and finally ("result", document).
+
+        Shares the LLM cache with chat_json; a hit replays the cached items.
+        """
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = LLMResponseCache.make_key(model, messages, "json", options)
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                logger.info("LLM cache hit for model=%s", model)
+                document = json.loads(cached)
+                for item in document.get(array_key, []) if isinstance(document, dict) else []:
+                    yield "item", item
+                yield "result", document
+                return
+
+        parser = StreamingArrayParser(array_key)
+        async for token in self.chat_stream(model, messages, format="json", options=options):
+            for item in parser.feed(token):
+                yield "item", item
+
+        content = parser.text
+        try:
+            document = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.warning("Ollama model=%s returned invalid JSON: %s", model, content[:200])
+            raise OllamaParseError(
+                f"Model {model} returned invalid JSON: {content[:200]}"
+            ) from e
+
+        if cache_key is not None:
+            await self._cache_put(cache_key, model, content)
+        yield "result", document
+
+    async def chat_json(
+        self,
+        model: str,
+        messages: list[dict],
+        options: dict | None = None,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> dict:
+        """Chat and parse the response content as JSON.
+
+        Responses are served from the LLM cache when one is configured and an
+        identical (model, messages, format, options) request has parsed before.
+        """
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = LLMResponseCache.make_key(
+                model, messages, "json", options, kwargs.get("images")
+            )
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                logger.info("LLM cache hit for model=%s", model)
+                return json.loads(cached)
+
+        result = await self.chat(model, messages, format="json", options=options, **kwargs)
         content = result["message"]["content"]
         try:
-            return json.loads(content)
+            parsed = json.loads(content)
         except json.JSONDecodeError as e:
             logger.warning("Ollama model=%s returned invalid JSON: %s", model, content[:200])
             raise OllamaParseError(
                 f"Model {model} returned invalid JSON: {content[:200]}"
             ) from e
 
+        if cache_key is not None:
+            await self._cache_put(cache_key, model, content)
+        return parsed
+
+    async def _cache_get(self, key: str) -> str | None:
+        try:
+            return await self.cache.get(key)
+        except aiosqlite.Error as e:
+            logger.warning("LLM cache read failed (bypassing): %s", e)
+            return None
+
+    async def _cache_put(self, key: str, model: str, content: str) -> None:
+        try:
+            await self.cache.put(key, model, content)
+        except aiosqlite.Error as e:
+            logger.warning("LLM cache write failed (ignored): %s", e)
+
     async def generate_output(
         self,
         features: dict,
@@ -110,6 +462,28 @@ class OllamaClient:
         ]
         return await self.chat_json(model, messages)
 
+    async def generate_output_stream(
+        self,
+        features: dict,
+        classification: dict,
+        datum_scheme: dict,
+        standards: list[dict],
+        tolerances: dict,
+        model: str = "gemma3:1b",
+    ):
+        """Layer 5 (streaming): yield ("callout", obj) as each callout closes, then ("result", doc)."""
+        from .prompts import WORKER_SYSTEM, build_worker_user_prompt
+
+        user_content = build_worker_user_prompt(
+            features, classification, datum_scheme, standards, tolerances
+        )
+        messages = [
+            {"role": "system", "content": WORKER_SYSTEM},
+            {"role": "user", "content": user_content},
+        ]
+        async for kind, value in self.chat_json_stream(model, messages, "callouts"):
+            yield ("callout" if kind == "item" else kind), value
+
     async def extract_features(
         self, description: str, model: str = "gemma3:1b"
     ) -> dict:
@@ -123,16 +497,23 @@ class OllamaClient:
         return await self.chat_json(model, messages)
 
     async def classify_gdt(
-        self, features: dict, model: str = "gemma3:1b"
+        self, features: dict, model: str = "gemma3:1b", use_cache: bool = True
     ) -> dict:
-        """Layer 2: Classifier -- Gemma GD&T classification."""
+        """Layer 2: Classifier -- Gemma GD&T classification.
+
+        ``use_cache=False`` always asks the model, e.g. to compare two models
+        whose requests are otherwise identical.
+        """
         from .prompts import CLASSIFICATION_SYSTEM
 
         messages = [
             {"role": "system", "content": CLASSIFICATION_SYSTEM},
-            {"role": "user", "content": json.dumps(features)},
+            {"role": "user", "content": json.dumps(features, sort_keys=True)},
         ]
-        return await self.chat_json(model, messages)
+        return await self.chat_json(model, messages, use_cache=use_cache)
 
     async def close(self):
+        if self._residency_refresh is not None:
+            self._residency_refresh.cancel()
+            await asyncio.gather(self._residency_refresh, return_exceptions=True)
         await self.client.aclose()
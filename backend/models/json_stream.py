@@ -0,0 +1,63 @@
+"""Incremental parsing of JSON documents streamed token-by-token from an LLM."""
+
+import json
+
+
+class StreamingArrayParser:
+    """Yield elements of a top-level array field as soon as each element closes.
+
+    Feed raw text chunks as they arrive; ``feed`` returns the objects of
+    ``document[key]`` that completed within that chunk. The full text is
+    kept so the caller can parse the finished document with ``json.loads``.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: str | None = None
+        self._in_target = False
+        self._element_start: int | None = None
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch in "{[":
+                if self._in_target and self._depth == 2 and self._element_start is None:
+                    self._element_start = i
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_key == self.key:
+                    self._in_target = True
+            elif ch in "}]":
+                self._depth -= 1
+                if self._in_target and self._depth == 2 and self._element_start is not None:
+                    try:
+                        completed.append(json.loads(text[self._element_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._element_start = None
+                elif self._in_target and self._depth == 1:
+                    self._in_target = False
+        self._pos = len(text)
+        return completed
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import time
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+PRUNE_EVERY_N_PUTS = 50
+# A hit only records its use when the recorded one is older than this, so
+# hits are plain reads; LRU eviction does not need finer resolution
+TOUCH_INTERVAL_SECONDS = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+)
+"""
+
+
+class LLMResponseCache:
+    """Content-addressed, SQLite-backed cache of Ollama chat responses.
+
+    Keys are SHA-256 digests of (model, messages, format, options), so any
+    byte-level change to the prompt is a miss. Entries are evicted by age
+    and, least-recently-used first, by total content size.
+    """
+
+    def __init__(
+        self,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock=time.time,
+    ):
+        self.conn: aiosqlite.Connection | None = None
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._puts_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    async def open(cls, path: str, **kwargs) -> "LLMResponseCache":
+        cache = cls(**kwargs)
+        cache.conn = await aiosqlite.connect(path)
+        async with cache.conn.execute("PRAGMA journal_mode=WAL"):
+            pass
+        # Other worker processes write to the same file
+        async with cache.conn.execute("PRAGMA busy_timeout=5000"):
+            pass
+        await cache.conn.execute(SCHEMA)
+        await cache.conn.commit()
+        await cache.prune()
+        return cache
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: list[dict],
+        format: str | None,
+        options: dict | None = None,
+        images: list[str] | None = None,
+    ) -> str:
+        canonical = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "format": format,
+                "options": options or {},
+                "images": images or [],
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    async def get(self, key: str) -> str | None:
+        """Return cached response content, or None on miss/expiry."""
+        now = self._clock()
+        async with self.conn.execute(
+            "SELECT content, created_at, last_used_at FROM llm_cache WHERE key = ?", (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        content, created_at, last_used_at = row
+        if created_at < now - self.max_age_seconds:
+            await self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            await self.conn.commit()
+            self.misses += 1
+            return None
+        if now - last_used_at >= TOUCH_INTERVAL_SECONDS:
+            await self.conn.execute(
+                "UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key)
+            )
+            await self.conn.commit()
+        self.hits += 1
+        return content
+
+    async def put(self, key: str, model: str, content: str) -> None:
+        now = self._clock()
+        await self.conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, model, content, size, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, content, len(content.encode()), now, now),
+        )
+        await self.conn.commit()
+        self._puts_since_prune += 1
+        if self._puts_since_prune >= PRUNE_EVERY_N_PUTS:
+            await self.prune()
+
+    async def prune(self) -> int:
+        """Drop expired entries, then LRU entries until under the size bound."""
+        self._puts_since_prune = 0
+        cursor = await self.conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?",
+            (self._clock() - self.max_age_seconds,),
+        )
+        removed = cursor.rowcount
+        async with self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache") as cur:
+            total = (await cur.fetchone())[0]
+        if total > self.max_bytes:
+            async with self.conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_used_at ASC"
+            ) as cur:
+                rows = await cur.fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            await self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+            removed += len(stale)
+        await self.conn.commit()
+        if removed:
+            logger.info("LLM cache pruned %d entries", removed)
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    async def close(self):
+        if self.conn:
+            await self.conn.close()
@@ -0,0 +1,296 @@
+"""Process-wide metrics rendered in the Prometheus text exposition format.
+
+A deliberately small subset of the prometheus_client API (counters, gauges
+and histograms with labels) so the backend does not take on a dependency
+for one endpoint. Instruments are module-level and shared by every layer;
+``REGISTRY.render()`` produces the /api/metrics body.
+"""
+
+import math
+import time
+from contextlib import contextmanager
+
+# Seconds. Spans the sub-10ms lookups (SQLite, cosine match) up to the
+# multi-second VLM and worker calls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self) -> None:
+        self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for key in sorted(self._series):
+            lines.extend(self._render_series(key, self._series[key]))
+        return lines
+
+    def _render_series(self, key, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series.counts[i] += 1
+                break
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block, even if it raises."""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def _render_series(self, key, series) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+# -- Pipeline ---------------------------------------------------------------
+LAYER_LATENCY = Histogram(
+    "toleranceai_layer_latency_seconds",
+    "Per-request wall-clock time spent in each pipeline layer.",
+    ("layer",),
+)
+PIPELINE_LATENCY = Histogram(
+    "toleranceai_pipeline_latency_seconds",
+    "End-to-end pipeline time per completed analysis.",
+)
+STAGE_RETRIES = Counter(
+    "toleranceai_retries_total",
+    "Retried attempts, by pipeline layer (or 'ollama' for client-level backoff).",
+    ("layer",),
+)
+ERRORS = Counter(
+    "toleranceai_errors_total",
+    "Failed pipeline runs, by the layer reported in the SSE error event.",
+    ("layer",),
+)
+PIPELINES_IN_FLIGHT = Gauge(
+    "toleranceai_pipelines_in_flight",
+    "Pipeline runs currently executing.",
+)
+SSE_PENDING_EVENTS = Histogram(
+    "toleranceai_sse_pending_events",
+    "Events produced but not yet delivered to the client, sampled at each delivery.",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+SSE_PRODUCER_STALL = Counter(
+    "toleranceai_sse_producer_stalled_seconds_total",
+    "Time stream producers (one client's feed; the shared run never waits) spent waiting for a full buffer to drain.",
+)
+SSE_COALESCED = Counter(
+    "toleranceai_sse_progress_coalesced_total",
+    "Progress events superseded by a newer one before a lagging client read them.",
+)
+STREAMS_IN_FLIGHT = Gauge(
+    "toleranceai_analyze_streams_in_flight",
+    "Open /api/analyze SSE streams (coalesced subscribers included).",
+)
+JOBS = Counter(
+    "toleranceai_jobs_total",
+    "Finished /api/jobs analyses, by status (complete or error).",
+    ("status",),
+)
+LIVE_FRAMES = Counter(
+    "toleranceai_live_frames_total",
+    "Live-capture frames, by outcome (analyzed, skipped as unchanged, superseded by a newer frame).",
+    ("outcome",),
+)
+
+# -- Model and storage backends ---------------------------------------------
+OLLAMA_LATENCY = Histogram(
+    "toleranceai_ollama_request_seconds",
+    "Ollama /api/chat request duration, by model and mode.",
+    ("model", "mode"),
+)
+OLLAMA_IN_FLIGHT = Gauge(
+    "toleranceai_ollama_requests_in_flight",
+    "Ollama HTTP requests currently open.",
+)
+OLLAMA_QUEUE_DEPTH = Gauge(
+    "toleranceai_ollama_queue_depth",
+    "Requests waiting for an Ollama slot, by priority lane (sampled at scrape).",
+    ("lane",),
+)
+OLLAMA_MODEL_LOADS = Counter(
+    "toleranceai_ollama_model_loads_total",
+    "Requests for which Ollama had to load the model first, by model.",
+    ("model",),
+)
+OLLAMA_MODEL_SWAPS = Counter(
+    "toleranceai_ollama_model_swaps_total",
+    "Reloads of a model Ollama had evicted since it was last loaded, by model.",
+    ("model",),
+)
+OLLAMA_LOAD_SECONDS = Histogram(
+    "toleranceai_ollama_model_load_seconds",
+    "Ollama model load time (load_duration) when a request had to load the model, by model.",
+    ("model",),
+)
+VLM_LATENCY = Histogram(
+    "toleranceai_vlm_inference_seconds",
+    "mlx-vlm image description time.",
+)
+VLM_FRAME_CACHE = Counter(
+    "toleranceai_vlm_frame_cache_total",
+    "Perceptual-hash description cache lookups, by result (hit or miss).",
+    ("result",),
+)
+VLM_FRAME_DISTANCE = Histogram(
+    "toleranceai_vlm_frame_hash_distance_bits",
+    "Hamming distance from each looked-up frame to the nearest cached frame.",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64),
+)
+FREECAD_LATENCY = Histogram(
+    "toleranceai_freecad_rpc_seconds",
+    "FreeCAD JSON-RPC execute_python round-trip time.",
+)
+SQLITE_LATENCY = Histogram(
+    "toleranceai_sqlite_query_seconds",
+    "Brain database query time.",
+    ("operation",),
+)
+EMBEDDER_LATENCY = Histogram(
+    "toleranceai_embedder_encode_seconds",
+    "Sentence-transformer query encoding time.",
+)
+CANCELLED_CALLS = Counter(
+    "toleranceai_cancelled_calls_total",
+    "Model and RPC calls abandoned because their client went away.",
+    ("component",),
+)
+BRAIN_RELOADS = Counter(
+    "toleranceai_brain_reloads_total",
+    "Hot reloads of brain.db and the standards embeddings, by outcome (swapped or rejected).",
+    ("outcome",),
+)
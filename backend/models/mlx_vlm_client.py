@@ -1,32 +1,40 @@
 import asyncio
 import base64
+import binascii
+import io
 import logging
-import os
-import tempfile
+import threading
 import time
 
+from PIL import Image, ImageOps
+
+from .cancellation import cancellations
+from .frame_cache import FrameDescriptionCache, dhash
+from .metrics import VLM_LATENCY
+
 logger = logging.getLogger(__name__)
 
 INFERENCE_TIMEOUT = 120
 DESCRIBE_MAX_TOKENS = 256
+WARMUP_MAX_TOKENS = 4
 
 # Lazy sentinel -- actual imports happen in _ensure_imports().
 # Module-level names exist so tests can patch them at "models.mlx_vlm_client.<name>".
 mlx_load = None
-mlx_generate = None
+mlx_stream_generate = None
 apply_chat_template = None
 load_config = None
 
 
 def _ensure_imports():
-    global mlx_load, mlx_generate, apply_chat_template, load_config
+    global mlx_load, mlx_stream_generate, apply_chat_template, load_config
     if mlx_load is not None:
         return
-    from mlx_vlm import load as _load, generate as _generate
+    from mlx_vlm import load as _load, stream_generate as _stream_generate
     from mlx_vlm.prompt_utils import apply_chat_template as _apply
     from mlx_vlm.utils import load_config as _cfg
     mlx_load = _load
-    mlx_generate = _generate
+    mlx_stream_generate = _stream_generate
     apply_chat_template = _apply
     load_config = _cfg
 
@@ -41,13 +49,27 @@ class MlxVlmTimeoutError(Exception):
     pass
 
 
+class MlxVlmUnavailableError(Exception):
+    """Raised when the VLM inference process (api.vlm_server) cannot serve a request."""
+    pass
+
+
+class _GenerationCancelled(Exception):
+    """Raised inside the inference thread when the awaiting caller has gone."""
+
+    def __init__(self, tokens: int):
+        super().__init__(f"cancelled after {tokens} tokens")
+        self.tokens = tokens
+
+
 class MlxVlmClient:
     MODEL_ID = "mlx-community/paligemma2-3b-mix-224-4bit"
 
-    def __init__(self):
+    def __init__(self, frame_cache: FrameDescriptionCache | None = None):
         self.model = None
         self.processor = None
         self.config = None
+        self.frame_cache = frame_cache if frame_cache is not None else FrameDescriptionCache()
 
     def load(self):
         """Load model into memory. Call once on startup."""
@@ -58,63 +80,121 @@ class MlxVlmClient:
         except Exception as e:
             raise MlxVlmLoadError(f"Failed to load {self.MODEL_ID}: {e}") from e
 
-    async def describe_image(self, image_base64: str) -> str:
-        """Describe a CAD screenshot using PaliGemma 2. Returns plain text."""
+    async def describe_image(self, image: str | bytes | bytearray, max_distance: int | None = None) -> str:
+        """Describe a CAD screenshot using PaliGemma 2. Returns plain text.
+
+        ``image`` is the encoded image itself or its base64 text. A frame
+        whose hash is within ``max_distance`` bits of a recently described
+        one (default: identical, see frame_cache) reuses that description
+        without running the model.
+        """
+        from .prompts import PALIGEMMA_DESCRIBE_PROMPT
+
+        image_bytes = base64.b64decode(image) if isinstance(image, str) else image
+        frame_hash = await self._frame_hash(image_bytes)
+        if frame_hash is not None:
+            cached = self.frame_cache.get(frame_hash, max_distance)
+            if cached is not None:
+                return cached
+
+        images = await asyncio.to_thread(self._prepare_image, image_bytes)
+        raw = await self._generate(
+            PALIGEMMA_DESCRIBE_PROMPT, images, max_tokens=DESCRIBE_MAX_TOKENS
+        )
+        description = raw.strip()
+        if frame_hash is not None:
+            self.frame_cache.put(frame_hash, description)
+        return description
+
+    async def warm_up(self) -> float:
+        """Run a blank frame through the model so the first real image skips kernel compilation.
+
+        Bypasses the frame cache. Returns the seconds it took.
+        """
         from .prompts import PALIGEMMA_DESCRIBE_PROMPT
 
-        image_paths, temp_path = self._prepare_image(image_base64)
+        t0 = time.monotonic()
+        blank = Image.new("RGB", (224, 224), "white")
+        await self._generate(PALIGEMMA_DESCRIBE_PROMPT, [blank], max_tokens=WARMUP_MAX_TOKENS)
+        elapsed = time.monotonic() - t0
+        logger.info("mlx-vlm warmed up in %.1fs", elapsed)
+        return elapsed
+
+    async def _frame_hash(self, image_bytes: bytes | bytearray) -> int | None:
+        """Perceptual hash of the frame, or None when caching is off or the image won't decode."""
+        if self.frame_cache is None or self.frame_cache.max_entries <= 0:
+            return None
         try:
-            raw = await self._generate(
-                PALIGEMMA_DESCRIBE_PROMPT, image_paths, max_tokens=DESCRIBE_MAX_TOKENS
-            )
-        finally:
-            if temp_path:
-                os.unlink(temp_path)
-        return raw.strip()
+            return await asyncio.to_thread(dhash, image_bytes)
+        except (binascii.Error, ValueError, OSError) as e:
+            logger.debug("Frame hash unavailable, not caching: %s", e)
+            return None
 
     async def _generate(
-        self, prompt: str, image_paths: list[str] | None, max_tokens: int = 256
+        self, prompt: str, images: list[Image.Image] | None, max_tokens: int = 256
     ) -> str:
-        """Run mlx_vlm.generate in a thread to avoid blocking the event loop."""
-        num_images = len(image_paths) if image_paths else 0
+        """Run mlx-vlm generation in a thread to avoid blocking the event loop.
+
+        Tokens are streamed inside the thread so that a timeout or a
+        cancelled caller stops generation at the next token, instead of
+        leaving the thread running to ``max_tokens``.
+        """
+        num_images = len(images) if images else 0
         formatted = apply_chat_template(
             self.processor, self.config, prompt, num_images=num_images
         )
+        stop = threading.Event()
         t0 = time.monotonic()
         logger.info("mlx-vlm inference starting (max_tokens=%d)", max_tokens)
+        worker = asyncio.ensure_future(asyncio.to_thread(
+            self._generate_until_stopped, formatted, images, max_tokens, stop
+        ))
         try:
-            result = await asyncio.wait_for(
-                asyncio.to_thread(
-                    mlx_generate,
-                    self.model,
-                    self.processor,
-                    formatted,
-                    image_paths,
-                    verbose=False,
-                    max_tokens=max_tokens,
-                ),
-                timeout=INFERENCE_TIMEOUT,
-            )
+            text = await asyncio.wait_for(asyncio.shield(worker), timeout=INFERENCE_TIMEOUT)
         except asyncio.TimeoutError:
+            self._stop(worker, stop, max_tokens, t0)
             elapsed = time.monotonic() - t0
             logger.error("mlx-vlm inference timed out after %.1fs", elapsed)
             raise MlxVlmTimeoutError(
                 f"Inference timed out after {INFERENCE_TIMEOUT}s"
             )
+        except asyncio.CancelledError:
+            self._stop(worker, stop, max_tokens, t0)
+            raise
         elapsed = time.monotonic() - t0
+        VLM_LATENCY.observe(elapsed)
         logger.info("mlx-vlm inference completed in %.1fs", elapsed)
-        return result.text
-
-    def _prepare_image(
-        self, image_base64: str | None
-    ) -> tuple[list[str] | None, str | None]:
-        """Convert base64 image to temp file. Returns (paths_list, temp_path_for_cleanup)."""
-        if not image_base64:
-            return None, None
-        image_bytes = base64.b64decode(image_base64)
-        fd, temp_path = tempfile.mkstemp(suffix=".png")
-        try:
-            os.write(fd, image_bytes)
-        finally:
-            os.close(fd)
-        return [temp_path], temp_path
+        return text
+
+    def _generate_until_stopped(
+        self, formatted: str, images: list[Image.Image] | None, max_tokens: int, stop: threading.Event
+    ) -> str:
+        """Thread body: accumulate streamed text, checking ``stop`` between tokens."""
+        pieces = []
+        for tokens, chunk in enumerate(mlx_stream_generate(
+            self.model, self.processor, formatted, images, max_tokens=max_tokens
+        )):
+            if stop.is_set():
+                raise _GenerationCancelled(tokens)
+            pieces.append(chunk.text)
+        return "".join(pieces)
+
+    @staticmethod
+    def _stop(worker: asyncio.Future, stop: threading.Event, max_tokens: int, t0: float) -> None:
+        """Ask the inference thread to stop and account for the tokens it skips once it does."""
+        stop.set()
+
+        def record(done: asyncio.Future) -> None:
+            exc = None if done.cancelled() else done.exception()
+            if isinstance(exc, _GenerationCancelled):
+                cancellations.record("vlm", time.monotonic() - t0, tokens_skipped=max_tokens - exc.tokens)
+
+        worker.add_done_callback(record)
+
+    @staticmethod
+    def _prepare_image(image_bytes: bytes | bytearray | None) -> list[Image.Image] | None:
+        """Decode the image in memory, the way mlx_vlm.utils.load_image would from a file."""
+        if not image_bytes:
+            return None
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return [ImageOps.exif_transpose(image).convert("RGB")]
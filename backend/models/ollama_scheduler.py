@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from .metrics import OLLAMA_LOAD_SECONDS, OLLAMA_MODEL_LOADS, OLLAMA_MODEL_SWAPS
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Ollama's own default is 4 parallel slots when memory allows; honour an explicit override.
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+DEFAULT_MAX_QUEUE_DEPTH = 32
+# A waiter can be passed over this many times for requests to warm models
+DEFAULT_MAX_BYPASS = 4
+# A load_duration above this means Ollama loaded the model for the request
+LOAD_THRESHOLD_S = 0.25
+
+_current_priority: ContextVar[int] = ContextVar("ollama_priority", default=PRIORITY_INTERACTIVE)
+
+
+class OllamaQueueFullError(Exception):
+    """Raised when the Ollama admission queue is saturated."""
+    pass
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Run the enclosed Ollama calls in the given priority lane."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "model", "bypassed")
+
+    def __init__(self, future: asyncio.Future, model: str | None):
+        self.future = future
+        self.model = model
+        self.bypassed = 0
+
+
+class OllamaScheduler:
+    """Client-side admission control for Ollama requests.
+
+    At most ``max_concurrency`` requests run at once, matching the server's
+    parallel slots; the rest wait in per-priority lanes, interactive before
+    background. When ``max_queue_depth`` requests are already waiting, new
+    ones fail fast with OllamaQueueFullError.
+
+    Within a lane, a freed slot goes to the first request for a model that
+    is resident in Ollama (or running) rather than strictly first come, so
+    requests for the same tag run back to back instead of making Ollama
+    swap models between them. A request is passed over at most
+    ``max_bypass`` times. Residency comes from /api/ps (``set_resident``)
+    and from each response's load_duration (``record_load``).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH,
+        max_bypass: int = DEFAULT_MAX_BYPASS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_depth = max_queue_depth
+        self.max_bypass = max_bypass
+        self._active = 0
+        self._lanes: dict[int, deque[_Waiter]] = {p: deque() for p in PRIORITIES}
+        self.admitted = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self.resident: set[str] = set()
+        self._running: dict[str, int] = {}
+        # Every model Ollama has loaded for us, to tell a reload after eviction from a first load
+        self._ever_loaded: set[str] = set()
+        self.loads = 0
+        self.swaps = 0
+        self.load_seconds = 0.0
+        self.affinity_picks = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def queue_depth(self, priority: int | None = None) -> int:
+        if priority is not None:
+            return len(self._lanes[priority])
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def queue_position(self, priority: int | None = None) -> int:
+        """Position a new request in ``priority`` would take (0 = admitted immediately)."""
+        priority = _current_priority.get() if priority is None else priority
+        if self._active < self.max_concurrency and self.queue_depth() == 0:
+            return 0
+        ahead = sum(len(self._lanes[p]) for p in PRIORITIES if p <= priority)
+        return ahead + 1
+
+    def is_saturated(self) -> bool:
+        return self.queue_depth() >= self.max_queue_depth
+
+    @asynccontextmanager
+    async def slot(self, priority: int | None = None, model: str | None = None):
+        """Hold one Ollama slot for the duration of the block."""
+        await self.acquire(priority, model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    async def acquire(self, priority: int | None = None, model: str | None = None) -> None:
+        priority = _current_priority.get() if priority is None else priority
+        if self._active < self.max_concurrency and self.queue_depth() == 0:
+            self._active += 1
+            self._record_admission(0.0, model)
+            return
+        if self.is_saturated():
+            self.rejected += 1
+            raise OllamaQueueFullError(
+                f"Ollama queue is full ({self.queue_depth()} waiting, "
+                f"{self._active}/{self.max_concurrency} running)"
+            )
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), model)
+        lane = self._lanes[priority]
+        lane.append(waiter)
+        t0 = time.monotonic()
+        logger.info("Ollama request queued: lane=%d position=%d model=%s", priority, len(lane), model)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in lane:
+                lane.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # The slot was handed to us just as we were cancelled -- pass it on.
+                self._running_done(model)
+                self.release()
+            raise
+        self._record_admission(time.monotonic() - t0)
+
+    def release(self, model: str | None = None) -> None:
+        """Hand the slot to the next waiter in priority order, or free it."""
+        self._running_done(model)
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            while lane:
+                waiter = self._next_waiter(lane)
+                if not waiter.future.done():
+                    self._running_start(waiter.model)
+                    waiter.future.set_result(None)
+                    return
+        self._active -= 1
+
+    def _next_waiter(self, lane: deque[_Waiter]) -> _Waiter:
+        """The first waiter for a warm model, unless the head of the lane has waited long enough."""
+        head = lane[0]
+        if head.future.done() or head.model is None or head.bypassed >= self.max_bypass or self._is_warm(head.model):
+            return lane.popleft()
+        for position, waiter in enumerate(lane):
+            if not waiter.future.done() and waiter.model is not None and self._is_warm(waiter.model):
+                for skipped in list(lane)[:position]:
+                    skipped.bypassed += 1
+                del lane[position]
+                self.affinity_picks += 1
+                return waiter
+        return lane.popleft()
+
+    def _is_warm(self, model: str) -> bool:
+        return model in self.resident or self._running.get(model, 0) > 0
+
+    def _running_start(self, model: str | None) -> None:
+        if model is not None:
+            self._running[model] = self._running.get(model, 0) + 1
+
+    def _running_done(self, model: str | None) -> None:
+        if model is not None and self._running.get(model):
+            self._running[model] -= 1
+
+    def _record_admission(self, waited: float, model: str | None = None) -> None:
+        # Queued waiters are marked running when their slot is handed over
+        self._running_start(model)
+        self.admitted += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def set_resident(self, models) -> None:
+        """Replace the set of models Ollama has loaded (from /api/ps)."""
+        self.resident = set(models)
+        self._ever_loaded |= self.resident
+
+    def record_load(self, model: str, load_seconds: float) -> bool:
+        """Account for a response's load_duration; True when Ollama had to load ``model`` for it."""
+        loaded_before = model in self._ever_loaded
+        self.resident.add(model)
+        self._ever_loaded.add(model)
+        if load_seconds < LOAD_THRESHOLD_S:
+            return False
+        self.loads += 1
+        self.load_seconds += load_seconds
+        OLLAMA_MODEL_LOADS.inc(model=model)
+        OLLAMA_LOAD_SECONDS.observe(load_seconds, model=model)
+        if loaded_before:
+            # It was loaded before and got evicted: a swap
+            self.swaps += 1
+            OLLAMA_MODEL_SWAPS.inc(model=model)
+            logger.warning("Ollama reloaded model=%s (%.1fs) after evicting it", model, load_seconds)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {
+                "interactive": self.queue_depth(PRIORITY_INTERACTIVE),
+                "background": self.queue_depth(PRIORITY_BACKGROUND),
+            },
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 1),
+            "resident_models": sorted(self.resident),
+            "model_loads": self.loads,
+            "model_swaps": self.swaps,
+            "load_seconds": round(self.load_seconds, 3),
+            "affinity_picks": self.affinity_picks,
+        }
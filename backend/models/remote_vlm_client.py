@@ -0,0 +1,79 @@
+"""MlxVlmClient's interface, served by the shared VLM inference process.
+
+With several API workers (api.serve), PaliGemma is loaded once, in the
+api.vlm_server process, instead of once per worker. Each worker talks to
+it over a Unix socket with this client; images go over as raw bytes.
+"""
+
+import asyncio
+import base64
+import logging
+import time
+
+import httpx
+
+from .mlx_vlm_client import INFERENCE_TIMEOUT, MlxVlmLoadError, MlxVlmTimeoutError, MlxVlmUnavailableError
+
+logger = logging.getLogger(__name__)
+
+HEALTH_POLL_INTERVAL = 0.5
+
+
+class RemoteVlmClient:
+    # The frame cache lives in the server process, shared by all workers
+    frame_cache = None
+
+    def __init__(self, socket_path: str, transport: httpx.AsyncBaseTransport | None = None):
+        self.socket_path = socket_path
+        self.client = httpx.AsyncClient(
+            transport=transport or httpx.AsyncHTTPTransport(uds=socket_path),
+            base_url="http://vlm",
+            # The server gives up after INFERENCE_TIMEOUT; leave it room to say so
+            timeout=httpx.Timeout(INFERENCE_TIMEOUT + 10.0, connect=5.0),
+        )
+
+    async def wait_until_loaded(self, timeout: float) -> None:
+        """Wait for the server to finish loading the model; MlxVlmLoadError if it fails or takes too long."""
+        give_up = time.monotonic() + timeout
+        while True:
+            try:
+                health = (await self.client.get("/health")).json()
+                if health.get("loaded"):
+                    return
+                if health.get("error"):
+                    raise MlxVlmLoadError(f"VLM server failed to load the model: {health['error']}")
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.RemoteProtocolError):
+                # Not listening yet
+                pass
+            if time.monotonic() >= give_up:
+                raise MlxVlmLoadError(f"VLM server at {self.socket_path} not ready after {timeout:.0f}s")
+            await asyncio.sleep(HEALTH_POLL_INTERVAL)
+
+    async def describe_image(self, image: str | bytes | bytearray, max_distance: int | None = None) -> str:
+        """Describe a CAD screenshot (encoded bytes or base64) in the VLM server process."""
+        image_bytes = base64.b64decode(image) if isinstance(image, str) else bytes(image)
+        params = {"max_distance": max_distance} if max_distance is not None else None
+        response = await self._post("/describe", content=image_bytes, params=params,
+                                    headers={"content-type": "application/octet-stream"})
+        return response["description"]
+
+    async def warm_up(self) -> float:
+        return (await self._post("/warm-up"))["seconds"]
+
+    async def _post(self, path: str, **kwargs) -> dict:
+        try:
+            resp = await self.client.post(path, **kwargs)
+        except httpx.TimeoutException as e:
+            raise MlxVlmTimeoutError(f"VLM server timed out on {path}") from e
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+            raise MlxVlmUnavailableError(f"VLM server not reachable at {self.socket_path}: {e}") from e
+        if resp.status_code == 504:
+            raise MlxVlmTimeoutError(resp.json().get("detail", "VLM inference timed out"))
+        if resp.status_code == 400:
+            raise ValueError(resp.json().get("detail", "Invalid image"))
+        if resp.status_code != 200:
+            raise MlxVlmUnavailableError(f"VLM server returned {resp.status_code}: {resp.text[:200]}")
+        return resp.json()
+
+    async def close(self) -> None:
+        await self.client.aclose()
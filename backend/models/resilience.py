@@ -0,0 +1,132 @@
+"""Retry backoff and circuit breaking for calls to the local inference server."""
+
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    """Jittered exponential backoff with a cap on total time spent retrying.
+
+    Attempt ``n`` (0-based) that failed is followed by a delay drawn
+    uniformly from the upper half of ``min(max_delay, base_delay * 2**n)``,
+    so concurrent callers spread out instead of retrying in lockstep. No
+    retry is made once ``max_attempts`` is reached or when the delay would
+    take the call past ``budget`` seconds since its first attempt.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        budget: float = 10.0,
+        rng: random.Random | None = None,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self._rng = rng or random.Random()
+
+    def next_delay(self, attempt: int, elapsed: float) -> float | None:
+        """Seconds to wait before retrying after failed ``attempt``, or None to give up."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = cap / 2 + self._rng.uniform(0, cap / 2)
+        if elapsed + delay > self.budget:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Fail fast after repeated failures, then probe for recovery.
+
+    ``failure_threshold`` consecutive failures open the breaker; while open,
+    ``allow()`` is False. After ``cooldown`` seconds one caller is let
+    through as a half-open probe: its success closes the breaker, its
+    failure re-opens it for another cooldown.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown:
+            return HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when calls are allowed now)."""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._state = HALF_OPEN
+            self._probe_in_flight = True
+            logger.info("Circuit %s half-open: probing", self.name)
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            logger.info("Circuit %s closed", self.name)
+        self._state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.times_opened += 1
+                logger.warning("Circuit %s opened after %d consecutive failures", self.name, self._failures)
+            self._state = OPEN
+            self._opened_at = self._clock()
+        self._probe_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """The allowed call ended without an outcome (e.g. it was cancelled)."""
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN:
+            # Let the next caller probe straight away
+            self._state = OPEN
+            self._opened_at = self._clock() - self.cooldown
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_after_s": round(self.retry_after(), 1),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import pytest
+from brain.analysis_store import AnalysisStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def _events(analysis_id: str, latency_ms: int = 42) -> list[dict]:
+    return [
+        {"event": "progress", "data": json.dumps({"layer": "student", "step": 1})},
+        {"event": "analysis_complete", "data": json.dumps({
+            "analysis_id": analysis_id,
+            "metadata": {"total_latency_ms": latency_ms, "stages": {"classify": {"duration_ms": 7}}},
+        })},
+    ]
+
+
+@pytest.fixture
+async def store(tmp_path):
+    s = await AnalysisStore.open(str(tmp_path / "analyses.db"), flush_interval=60, clock=FakeClock())
+    yield s
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_record_is_readable_before_commit(store):
+    store.save("a1", "hash1", _events("a1"), "12mm boss")
+    record = await store.get("a1")
+    assert store.stats()["pending"] == 1
+    assert record["status"] == "complete"
+    assert record["total_latency_ms"] == 42
+    assert record["stages"] == {"classify": {"duration_ms": 7}}
+    assert record["events"][0]["data"] == {"layer": "student", "step": 1}
+
+
+@pytest.mark.asyncio
+async def test_flush_commits_batch_in_one_transaction(store):
+    for i in range(3):
+        store.save(f"a{i}", "h", _events(f"a{i}"))
+    assert await store.flush() == 3
+    assert store.stats() == {"saved": 3, "batches": 1, "pending": 0}
+    assert (await store.get("a2"))["request_hash"] == "h"
+
+
+@pytest.mark.asyncio
+async def test_full_batch_wakes_background_writer(tmp_path):
+    store = await AnalysisStore.open(str(tmp_path / "analyses.db"), batch_size=2, flush_interval=60)
+    try:
+        store.save("a", "h", _events("a"))
+        store.save("b", "h", _events("b"))
+        for _ in range(100):
+            if not store.stats()["pending"]:
+                break
+            await asyncio.sleep(0.01)
+        assert store.stats()["batches"] == 1
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_error_runs_are_stored_with_error_status(store):
+    store.save("bad", "h", [{"event": "error", "data": json.dumps({"message": "boom", "layer": "ollama"})}])
+    record = await store.get("bad")
+    assert record["status"] == "error"
+    assert record["total_latency_ms"] is None
+
+
+@pytest.mark.asyncio
+async def test_list_is_newest_first_and_paginated(store):
+    for i in range(5):
+        store.save(f"a{i}", "h", _events(f"a{i}"), f"request {i}")
+    items, total = await store.list(limit=2, offset=1)
+    assert total == 5
+    assert [item["analysis_id"] for item in items] == ["a3", "a2"]
+    assert "events" not in items[0]
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_records(tmp_path):
+    path = str(tmp_path / "analyses.db")
+    store = await AnalysisStore.open(path, flush_interval=60)
+    store.save("a", "h", _events("a"))
+    await store.close()
+
+    reopened = await AnalysisStore.open(path)
+    try:
+        assert (await reopened.get("a"))["analysis_id"] == "a"
+        assert await reopened.get("missing") is None
+    finally:
+        await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_waits_for_other_writers(store):
+    async with store.conn.execute("PRAGMA busy_timeout") as cursor:
+        assert (await cursor.fetchone())[0] == 5000
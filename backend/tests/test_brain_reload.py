@@ -0,0 +1,204 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from api.brain_reload import REQUIRED_TABLES, BrainReloader, BrainSnapshotInvalidError, pinned
+from api.components import LOADERS, READY, UNAVAILABLE, Readiness
+from api.result_cache import AnalysisResultCache
+from api.routes import router
+from brain.database import Database
+from brain.lookup import BrainLookup
+from brain.manufacturing import ManufacturingLookup
+from models.embedder import Embedder
+
+
+def _seed(path, name="perpendicularity"):
+    conn = sqlite3.connect(str(path))
+    for table in REQUIRED_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute("CREATE TABLE geometric_characteristics (symbol TEXT, name TEXT, when_to_use TEXT)")
+    conn.execute("INSERT INTO geometric_characteristics VALUES ('⊥', ?, 'axis control')", (name,))
+    conn.execute("CREATE TABLE tolerance_tables (process TEXT, material TEXT, feature_type TEXT)")
+    conn.execute("INSERT INTO tolerance_tables VALUES ('cnc_milling', 'aluminum', 'hole')")
+    conn.execute("CREATE TABLE material_properties (material_id TEXT, name TEXT)")
+    conn.execute("INSERT INTO material_properties VALUES ('al6061', 'Aluminum 6061')")
+    conn.execute("CREATE TABLE datum_patterns (pattern_name TEXT)")
+    conn.execute("INSERT INTO datum_patterns VALUES ('boss_on_plate')")
+    conn.commit()
+    conn.close()
+
+
+def _embed(path, keys=("flatness", "perpendicularity"), dim=384):
+    rng = np.random.default_rng(len(keys))
+    np.savez(str(path), embeddings=rng.random((len(keys), dim)).astype(np.float32), keys=np.array(keys))
+
+
+@pytest.fixture
+async def state(tmp_path):
+    db_path, emb_path = tmp_path / "brain.db", tmp_path / "standards_embeddings.npz"
+    _seed(db_path)
+    _embed(emb_path)
+    db = await Database.connect(str(db_path))
+    embedder = Embedder()
+    embedder.model = object()
+    embedder.load_embeddings(str(emb_path))
+    state = SimpleNamespace(db=db, brain_lookup=BrainLookup(db), manufacturing_lookup=ManufacturingLookup(db),
+                            embedder=embedder, result_cache=AnalysisResultCache(), readiness=Readiness(LOADERS))
+    state.reloader = BrainReloader(state, db_path, emb_path, interval=0.01)
+    yield state
+    await state.reloader.stop()
+    await state.db.close()
+
+
+async def _names(state) -> list[str]:
+    return [r["name"] for r in await state.brain_lookup.search_standards("")]
+
+
+@pytest.mark.asyncio
+async def test_reload_swaps_in_the_new_database_and_embeddings(state, tmp_path):
+    old = state.brain_snapshot
+    state.result_cache.put("key", [{"event": "analysis_complete", "data": "{}"}])
+    _seed(tmp_path / "brain.db", name="perpendicularity (2018)")
+    _embed(tmp_path / "standards_embeddings.npz", keys=("flatness", "perpendicularity", "position"))
+
+    result = await state.reloader.reload()
+
+    assert result["version"] == 2 and result["previous_version"] == 1
+    assert result["standards_embedded"] == 3
+    assert state.brain_snapshot.version == 2
+    assert state.db is state.brain_snapshot.db is not old.db
+    assert await _names(state) == ["perpendicularity (2018)"]
+    # The sentence-transformer is shared, not reloaded
+    assert state.embedder is not old.embedder and state.embedder.model is old.embedder.model
+    assert len(old.embedder.standard_keys) == 2
+    assert len(state.result_cache) == 0
+    assert old.db.conn is None or old.retired
+
+
+@pytest.mark.asyncio
+async def test_in_flight_requests_finish_on_the_old_snapshot(state, tmp_path):
+    closed = asyncio.Event()
+    async with pinned(state) as snapshot:
+        lookup = state.brain_lookup
+        close = snapshot.db.close
+
+        async def tracked_close():
+            await close()
+            closed.set()
+
+        snapshot.db.close = tracked_close
+        _seed(tmp_path / "brain.db", name="flatness")
+        await state.reloader.reload()
+
+        assert state.brain_snapshot is not snapshot
+        assert snapshot.retired and not closed.is_set()
+        assert await lookup.lookup_standard("⊥") is not None
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_invalid_database_keeps_the_current_snapshot(state, tmp_path):
+    old = state.brain_snapshot
+    conn = sqlite3.connect(str(tmp_path / "brain.db"))
+    conn.execute("DELETE FROM tolerance_tables")
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(BrainSnapshotInvalidError, match="tolerance_tables is empty"):
+        await state.reloader.reload()
+
+    assert state.brain_snapshot is old and not old.retired
+    assert state.reloader.stats()["rejected"] == 1
+    assert "tolerance_tables" in state.reloader.stats()["last_error"]
+
+
+@pytest.mark.asyncio
+async def test_missing_database_is_rejected_without_creating_one(state, tmp_path):
+    old = state.brain_snapshot
+    state.reloader.db_path = tmp_path / "moved" / "brain.db"
+
+    with pytest.raises(BrainSnapshotInvalidError, match="not found"):
+        await state.reloader.reload()
+
+    assert state.brain_snapshot is old
+    assert not state.reloader.db_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_embeddings_of_another_dimension_are_rejected(state, tmp_path):
+    old = state.brain_snapshot
+    _embed(tmp_path / "standards_embeddings.npz", dim=768)
+
+    with pytest.raises(BrainSnapshotInvalidError, match="768-d"):
+        await state.reloader.reload()
+
+    assert state.brain_snapshot is old and state.embedder is old.embedder
+
+
+@pytest.mark.asyncio
+async def test_reload_makes_a_brain_seeded_after_startup_available(tmp_path):
+    state = SimpleNamespace(db=None, brain_lookup=None, manufacturing_lookup=None, embedder=None,
+                            readiness=Readiness(LOADERS))
+    state.readiness.mark("brain", UNAVAILABLE, "Brain database not found")
+    reloader = BrainReloader(state, tmp_path / "brain.db", tmp_path / "standards_embeddings.npz")
+    with pytest.raises(BrainSnapshotInvalidError, match="not found"):
+        await reloader.reload()
+
+    _seed(tmp_path / "brain.db")
+    await reloader.reload()
+    try:
+        assert state.readiness.components["brain"]["status"] == READY
+        assert await state.brain_lookup.lookup_standard("⊥") is not None
+    finally:
+        await state.db.close()
+
+
+@pytest.mark.asyncio
+async def test_watcher_reloads_once_the_files_stop_changing(state, tmp_path):
+    state.reloader.start()
+    _seed(tmp_path / "brain.db", name="flatness")
+    for _ in range(100):
+        if state.brain_snapshot.version == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert state.brain_snapshot.version == 2
+    assert await _names(state) == ["flatness"]
+
+
+@pytest.mark.asyncio
+async def test_admin_reload_route(state, tmp_path):
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.state.brain_reloader = state.reloader
+    app.state.readiness = state.readiness
+    for name in LOADERS:
+        state.readiness.mark(name, READY)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        ok = await client.post("/api/admin/reload")
+        (tmp_path / "standards_embeddings.npz").unlink()
+        rejected = await client.post("/api/admin/reload")
+
+    assert ok.status_code == 200 and ok.json()["version"] == 2
+    assert rejected.status_code == 422
+    assert "keeping the current brain" in rejected.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_admin_reload_requires_loopback_or_token(state, monkeypatch):
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.state.brain_reloader = state.reloader
+    remote = ASGITransport(app=app, client=("203.0.113.7", 40000))
+    async with AsyncClient(transport=remote, base_url="http://test") as client:
+        assert (await client.post("/api/admin/reload")).status_code == 403
+
+        monkeypatch.setattr("api.routes.ADMIN_TOKEN", "s3cret")
+        assert (await client.post("/api/admin/reload", headers={"X-Admin-Token": "wrong"})).status_code == 403
+        ok = await client.post("/api/admin/reload", headers={"X-Admin-Token": "s3cret"})
+
+    assert ok.status_code == 200 and ok.json()["version"] == 2
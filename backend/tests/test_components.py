@@ -0,0 +1,108 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api import components
+from api.components import (
+    COLD, LOADING, READY, UNAVAILABLE, WARM, Readiness, init_components, load_components,
+)
+
+
+def _fake_loaders(delay: float, fail: set[str] = frozenset()):
+    started = []
+
+    def loader(name):
+        async def load(state):
+            started.append(name)
+            await asyncio.sleep(delay)
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            return READY
+        return load
+
+    return {name: loader(name) for name in components.LOADERS}, started
+
+
+@pytest.mark.asyncio
+async def test_components_load_concurrently(monkeypatch):
+    loaders, started = _fake_loaders(0.1)
+    monkeypatch.setattr(components, "LOADERS", loaders)
+    state = SimpleNamespace()
+
+    t0 = time.monotonic()
+    await load_components(state)
+    elapsed = time.monotonic() - t0
+
+    assert sorted(started) == sorted(loaders)
+    # About the slowest single component, not the sum of all of them
+    assert elapsed < 0.1 * len(loaders) / 2
+    assert state.readiness.report()["ready"] is True
+    assert all(c["status"] == READY for c in state.readiness.components.values())
+    await state.ollama.close()
+    await state.freecad.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_component_is_unavailable_without_blocking_others(monkeypatch):
+    loaders, _ = _fake_loaders(0.01, fail={"vlm"})
+    monkeypatch.setattr(components, "LOADERS", loaders)
+    state = SimpleNamespace()
+
+    await load_components(state)
+
+    report = state.readiness.report()
+    assert report["ready"] is True
+    assert report["components"]["vlm"]["status"] == UNAVAILABLE
+    assert "vlm broke" in report["components"]["vlm"]["error"]
+    assert state.vlm is None
+    assert report["components"]["brain"]["status"] == READY
+    await state.ollama.close()
+    await state.freecad.close()
+
+
+@pytest.mark.asyncio
+async def test_state_is_usable_before_loading_finishes():
+    state = SimpleNamespace()
+    readiness = init_components(state)
+
+    assert state.vlm is None and state.brain_lookup is None
+    assert readiness.loading("brain", "vlm") == ["brain", "vlm"]
+    await state.ollama.close()
+    await state.freecad.close()
+
+
+@pytest.mark.asyncio
+async def test_readiness_tracks_each_component():
+    clock = iter([0.0, 1.5, 4.0]).__next__
+    readiness = Readiness(["brain", "vlm"], clock=clock)
+    waiter = asyncio.create_task(readiness.wait("brain"))
+
+    readiness.mark("brain", READY)
+    await asyncio.wait_for(waiter, timeout=1)
+    assert readiness.loading() == ["vlm"]
+    assert readiness.components["brain"] == {"status": READY, "load_seconds": 1.5}
+    assert readiness.components["vlm"] == {"status": LOADING}
+
+    readiness.mark("vlm", UNAVAILABLE, "timed out")
+    assert readiness.report() == {"ready": True, "warmup": {}, "components": {
+        "brain": {"status": READY, "load_seconds": 1.5},
+        "vlm": {"status": UNAVAILABLE, "load_seconds": 4.0, "error": "timed out"},
+    }}
+
+
+def test_ready_waits_for_model_warm_up():
+    readiness = Readiness(["ollama"])
+    readiness.mark("ollama", READY)
+    readiness.begin_warmup(["ollama:gemma3:1b", "vlm"])
+    assert readiness.report()["ready"] is False
+
+    readiness.mark_warm("ollama:gemma3:1b", 2.5)
+    readiness.mark_warm("vlm", None, "no model")
+    report = readiness.report()
+    assert report["ready"] is True
+    assert report["warmup"] == {
+        "ollama:gemma3:1b": {"status": WARM, "seconds": 2.5},
+        "vlm": {"status": COLD, "error": "no model"},
+    }
@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 from pathlib import Path
-from models.embedder import Embedder
+from models.embedder import Embedder, write_matrix
 
 
 @pytest.fixture
@@ -57,3 +57,57 @@ def test_match_standards_no_embeddings():
     e.standard_embeddings = None
     results = e.match_standards("test", top_k=3)
     assert results == []
+
+
+def test_load_embeddings_maps_matrix_read_only(fake_embeddings):
+    matrix_path = write_matrix(fake_embeddings)
+    written_at = matrix_path.stat().st_mtime_ns
+    e = Embedder()
+    e.load_embeddings(fake_embeddings)
+
+    assert isinstance(e.standard_embeddings, np.memmap)
+    assert not e.standard_embeddings.flags.writeable
+    assert e.standard_embeddings.shape == (4, 384)
+    assert e.standard_keys == ["flatness", "perpendicularity", "position", "circular_runout"]
+    # Loading only maps the matrix, extracting it again is a no-op
+    assert write_matrix(fake_embeddings) == matrix_path
+    assert matrix_path.stat().st_mtime_ns == written_at
+
+
+def test_load_embeddings_without_matrix_reads_into_memory_and_writes_nothing(fake_embeddings):
+    before = sorted(Path(fake_embeddings).parent.iterdir())
+    e = Embedder()
+    e.load_embeddings(fake_embeddings)
+
+    assert not isinstance(e.standard_embeddings, np.memmap)
+    assert e.standard_embeddings.shape == (4, 384)
+    assert sorted(Path(fake_embeddings).parent.iterdir()) == before
+
+
+def test_matrix_extracted_from_other_content_is_not_mapped(fake_embeddings):
+    old_matrix = write_matrix(fake_embeddings)
+    old_values = np.load(str(old_matrix))
+    # Rewritten .npz, e.g. restored from a backup with an older mtime
+    np.savez(fake_embeddings, embeddings=np.ones((2, 384), dtype=np.float32), keys=np.array(["a", "b"]))
+
+    e = Embedder()
+    e.load_embeddings(fake_embeddings)
+    assert e.standard_embeddings.shape == (2, 384)
+    assert not isinstance(e.standard_embeddings, np.memmap)
+
+    new_matrix = write_matrix(fake_embeddings)
+    assert new_matrix != old_matrix and not old_matrix.exists()
+    e.load_embeddings(fake_embeddings)
+    assert isinstance(e.standard_embeddings, np.memmap)
+    assert not np.array_equal(e.standard_embeddings[:1], old_values[:1])
+
+
+def test_match_standards_on_mapped_embeddings(fake_embeddings):
+    e = Embedder()
+    e.load_embeddings(fake_embeddings)
+    query = np.asarray(e.standard_embeddings[1])
+    e.model = type("FakeModel", (), {"encode": lambda self, q, normalize_embeddings: query})()
+
+    results = e.match_standards("perpendicular to datum A", top_k=1)
+
+    assert results[0]["key"] == "perpendicularity"
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from api.event_buffer import PROGRESS_COALESCE_AFTER, EventBuffer, buffered
+from api.singleflight import Flight
+from models.metrics import SSE_COALESCED
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _progress(step: int) -> dict:
+    return {"event": "progress", "data": str(step)}
+
+
+@pytest.mark.asyncio
+async def test_stale_progress_is_replaced_by_newer_one():
+    clock = FakeClock()
+    buffer = EventBuffer(maxsize=8, clock=clock)
+    await buffer.put(_progress(1))
+    await buffer.put({"event": "cad_context", "data": "{}"})
+    # A client keeping up still sees every progress step
+    await buffer.put(_progress(2))
+    assert len(buffer) == 3
+    clock.now += PROGRESS_COALESCE_AFTER + 0.1
+    before = SSE_COALESCED.value()
+    await buffer.put(_progress(3))
+    await buffer.close()
+    events = []
+    while (event := await buffer.get()) is not None:
+        events.append(event)
+    assert [e["data"] for e in events] == ["{}", "3"]
+    assert buffer.coalesced == 2
+    assert SSE_COALESCED.value() - before == 2
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_stalls_producer_without_dropping_events():
+    buffer = EventBuffer(maxsize=2)
+    for i in range(2):
+        await buffer.put({"event": "feature_extraction", "data": str(i)})
+    blocked = asyncio.create_task(buffer.put({"event": "feature_extraction", "data": "2"}))
+    await asyncio.sleep(0.02)
+    assert not blocked.done()
+    assert (await buffer.get())["data"] == "0"
+    await blocked
+    assert buffer.stalled_s > 0
+    assert [(await buffer.get())["data"] for _ in range(2)] == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_producer_finishes_while_consumer_is_slow():
+    finished = asyncio.Event()
+
+    async def source():
+        for i in range(5):
+            yield {"event": "feature_extraction", "data": str(i)}
+        finished.set()
+
+    stream = buffered(source())
+    first = await anext(stream)
+    # The source runs to the end before the consumer asks for a second event
+    await asyncio.wait_for(finished.wait(), timeout=1)
+    rest = [event async for event in stream]
+    assert [e["data"] for e in [first, *rest]] == ["0", "1", "2", "3", "4"]
+
+
+@pytest.mark.asyncio
+async def test_source_exception_reaches_consumer_after_earlier_events():
+    async def source():
+        yield _progress(1)
+        raise RuntimeError("boom")
+
+    received = []
+    with pytest.raises(RuntimeError, match="boom"):
+        async for event in buffered(source()):
+            received.append(event)
+    assert received == [_progress(1)]
+
+
+@pytest.mark.asyncio
+async def test_closing_stream_cancels_source():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            yield _progress(1)
+            await asyncio.Event().wait()
+        finally:
+            closed.set()
+
+    stream = buffered(source())
+    assert await anext(stream) == _progress(1)
+    await stream.aclose()
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_lagging_flight_subscriber_skips_superseded_progress():
+    clock = FakeClock()
+    flight = Flight("k")
+    stream = buffered(flight.subscribe(), clock=clock)
+    flight._publish(_progress(1))
+    assert (await anext(stream))["data"] == "1"
+    # The client stops reading while the run goes on
+    for event in (_progress(2), {"event": "cad_context", "data": "{}"}, _progress(3)):
+        flight._publish(event)
+        await asyncio.sleep(0.01)
+        clock.now += PROGRESS_COALESCE_AFTER + 0.1
+    flight.done = True
+    flight._notify()
+    events = [event async for event in stream]
+    assert [e["data"] for e in events] == ["{}", "3"]
+    # Ids stay absolute so a resume still lines up
+    assert [e["id"] for e in events] == ["2", "3"]
@@ -1,4 +1,5 @@
-from api.routes import _merge_vision_and_cad
+from api.pipeline import _merge_vision_and_cad, _build_feature_records
+from models.mock_cad_contexts import get_desk_mock
 
 
 class TestMergeVisionAndCad:
@@ -170,3 +171,45 @@ class TestMergeVisionAndCad:
 
         # Should use the second object (Pad) which has dimensions
         assert result["geometry"]["length"] == 50.0
+
+
+class TestBuildFeatureRecords:
+    def _vision_features(self):
+        return {
+            "feature_type": "surface",
+            "geometry": {"length": 1.0, "unit": "mm"},
+            "material": "unspecified",
+            "manufacturing_process": "woodworking",
+            "mating_condition": None,
+            "parent_surface": None,
+        }
+
+    def test_one_record_per_dimensioned_object(self):
+        records = _build_feature_records(self._vision_features(), get_desk_mock())
+        names = [name for name, _ in records]
+        assert len(records) == 13
+        assert names[:2] == ["Tabletop", "Hole_FL"]
+
+    def test_feature_types_inferred_from_cad(self):
+        records = dict(_build_feature_records(self._vision_features(), get_desk_mock()))
+        assert records["Tabletop"]["feature_type"] == "surface"
+        assert records["Hole_FL"]["feature_type"] == "hole"
+        assert records["Leg_FL"]["feature_type"] == "shaft"
+        assert records["Boss_FL"]["feature_type"] == "boss"
+
+    def test_geometry_comes_from_each_object(self):
+        records = dict(_build_feature_records(self._vision_features(), get_desk_mock()))
+        assert records["Hole_FL"]["geometry"] == {"diameter": 60.0, "depth": 50.0, "unit": "mm"}
+        assert records["Hole_FL"]["parent_surface"] == "Tabletop"
+        assert records["Tabletop"]["material"] == "Birch Plywood"
+
+    def test_vision_features_not_mutated(self):
+        vision = self._vision_features()
+        _build_feature_records(vision, get_desk_mock())
+        assert vision["geometry"] == {"length": 1.0, "unit": "mm"}
+
+    def test_no_cad_falls_back_to_single_record(self):
+        records = _build_feature_records(self._vision_features(), None)
+        assert len(records) == 1
+        assert records[0][1]["feature_type"] == "surface"
+
@@ -0,0 +1,62 @@
+import io
+from PIL import Image, ImageDraw
+from models.frame_cache import LIVE_MAX_DISTANCE, FrameDescriptionCache, dhash, hamming
+
+
+def _png(box=None, cursor=None) -> bytes:
+    image = Image.new("RGB", (640, 480), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 300, 380), fill=(90, 90, 90))
+    if box:
+        draw.rectangle(box, fill="black")
+    if cursor:
+        draw.polygon([cursor, (cursor[0] + 12, cursor[1] + 12), (cursor[0], cursor[1] + 16)], fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_dhash_ignores_cursor_but_not_a_new_view():
+    base = dhash(_png())
+    assert hamming(base, dhash(_png(cursor=(500, 60)))) <= LIVE_MAX_DISTANCE
+    assert hamming(base, dhash(_png(box=(350, 50, 600, 450)))) > 2 * LIVE_MAX_DISTANCE
+
+
+def test_near_frame_reuses_description():
+    cache = FrameDescriptionCache(max_distance=4)
+    cache.put(0b1010, "a boss")
+
+    assert cache.get(0b1011) == "a boss"
+    assert cache.get(0b1010 ^ 0xFF00) is None
+    assert cache.stats() == {
+        "entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5,
+        "max_distance": 4, "distance_histogram": {1: 1, 8: 1},
+    }
+
+
+def test_lookup_distance_can_be_set_per_call():
+    cache = FrameDescriptionCache()
+    cache.put(0b1010, "a boss")
+
+    assert cache.get(0b1011) is None
+    assert cache.get(0b1011, max_distance=1) == "a boss"
+    assert cache.get(0b1010) == "a boss"
+
+
+def test_lookup_picks_nearest_entry():
+    cache = FrameDescriptionCache(max_distance=4)
+    cache.put(0b0000, "far")
+    cache.put(0b0111, "near")
+    assert cache.get(0b1111) == "near"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = FrameDescriptionCache(max_entries=2, max_distance=0)
+    cache.put(1, "one")
+    cache.put(2, "two")
+    assert cache.get(1) == "one"
+    cache.put(4, "four")
+
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
@@ -1,13 +1,19 @@
+import asyncio
 import json
 import pytest
 import httpx
 from unittest.mock import AsyncMock, patch
-from models.gemma import OllamaClient, OllamaUnavailableError, OllamaParseError
+from models.cancellation import cancellations
+from models.gemma import (
+    OllamaClient, OllamaCircuitOpenError, OllamaParseError, OllamaRequestError, OllamaUnavailableError,
+)
+from models.llm_cache import LLMResponseCache
+from models.resilience import RetryPolicy
 
 
 @pytest.fixture
 def ollama():
-    return OllamaClient(base_url="http://localhost:11434")
+    return OllamaClient(base_url="http://localhost:11434", retry_policy=RetryPolicy(base_delay=0.0))
 
 
 def _fake_request() -> httpx.Request:
@@ -54,6 +60,93 @@ async def test_chat_json_raises_on_invalid_json(ollama):
             await ollama.chat_json("gemma3n:e2b", [{"role": "user", "content": "test"}])
 
 
+@pytest.mark.asyncio
+async def test_chat_json_served_from_cache(tmp_path):
+    cache = await LLMResponseCache.open(str(tmp_path / "llm_cache.db"))
+    client = OllamaClient(base_url="http://localhost:11434", cache=cache)
+    mock_resp = _mock_chat_response({"primary_control": "flatness"})
+
+    with patch.object(client.client, "post", new_callable=AsyncMock, return_value=mock_resp) as mock_post:
+        first = await client.classify_gdt({"feature_type": "face"})
+        second = await client.classify_gdt({"feature_type": "face"})
+    assert first == second == {"primary_control": "flatness"}
+    assert mock_post.await_count == 1
+    assert cache.hits == 1
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_uncached_classification_reaches_ollama_with_warm_cache(tmp_path):
+    cache = await LLMResponseCache.open(str(tmp_path / "llm_cache.db"))
+    client = OllamaClient(base_url="http://localhost:11434", cache=cache)
+    responses = [_mock_chat_response({"primary_control": "flatness"}),
+                 _mock_chat_response({"primary_control": "position"})]
+
+    with patch.object(client.client, "post", new_callable=AsyncMock, side_effect=responses) as mock_post:
+        await client.classify_gdt({"feature_type": "face"})
+        base = await client.classify_gdt({"feature_type": "face"}, use_cache=False)
+    assert base == {"primary_control": "position"}
+    assert mock_post.await_count == 2
+    assert cache.hits == 0
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_chat_json_does_not_cache_invalid_json(tmp_path):
+    cache = await LLMResponseCache.open(str(tmp_path / "llm_cache.db"))
+    client = OllamaClient(base_url="http://localhost:11434", cache=cache)
+    bad_resp = httpx.Response(
+        200,
+        json={"model": "gemma3:1b", "message": {"role": "assistant", "content": "{{"}, "done": True},
+        request=_fake_request(),
+    )
+    with patch.object(client.client, "post", new_callable=AsyncMock, return_value=bad_resp) as mock_post:
+        for _ in range(2):
+            with pytest.raises(OllamaParseError):
+                await client.chat_json("gemma3:1b", [{"role": "user", "content": "test"}])
+    assert mock_post.await_count == 2
+    await cache.close()
+
+
+def _ndjson_stream(content: str, chunk_size: int = 7) -> httpx.MockTransport:
+    """Serve an Ollama-style NDJSON token stream for the given content."""
+    lines = []
+    for i in range(0, len(content), chunk_size):
+        lines.append(json.dumps({"message": {"role": "assistant", "content": content[i:i + chunk_size]}, "done": False}))
+    lines.append(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}))
+    body = ("\n".join(lines) + "\n").encode()
+    return httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+
+@pytest.mark.asyncio
+async def test_generate_output_stream_yields_callouts_then_result(ollama):
+    document = {
+        "callouts": [{"feature": "bore", "symbol": "⌖"}, {"feature": "face", "symbol": "▱"}],
+        "summary": "ok",
+        "warnings": [],
+    }
+    ollama.client = httpx.AsyncClient(base_url=ollama.base_url, transport=_ndjson_stream(json.dumps(document)))
+
+    events = [
+        event async for event in ollama.generate_output_stream(
+            features={}, classification={}, datum_scheme={}, standards=[], tolerances={},
+        )
+    ]
+    assert events == [
+        ("callout", document["callouts"][0]),
+        ("callout", document["callouts"][1]),
+        ("result", document),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chat_json_stream_raises_on_invalid_json(ollama):
+    ollama.client = httpx.AsyncClient(base_url=ollama.base_url, transport=_ndjson_stream("not json {"))
+    with pytest.raises(OllamaParseError):
+        async for _ in ollama.chat_json_stream("gemma3:1b", [{"role": "user", "content": "x"}], "callouts"):
+            pass
+
+
 @pytest.mark.asyncio
 async def test_chat_raises_on_connection_error(ollama):
     with patch.object(
@@ -111,3 +204,166 @@ async def test_health_check_ollama_down(ollama):
     ):
         with pytest.raises(OllamaUnavailableError):
             await ollama.health_check()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_chat_releases_slot_and_is_counted(ollama):
+    request_started = asyncio.Event()
+
+    async def hang(request):
+        request_started.set()
+        await asyncio.sleep(10)
+
+    ollama.client = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(hang))
+    cancellations.reset()
+    task = asyncio.create_task(ollama.chat("gemma3:1b", [{"role": "user", "content": "x"}]))
+    await asyncio.wait_for(request_started.wait(), timeout=1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert cancellations.stats()["ollama"]["calls"] == 1
+    assert ollama.scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_retries_unavailable_with_backoff(ollama):
+    responses = [httpx.ConnectError("refused"), _mock_chat_response({"ok": True})]
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, side_effect=responses) as post:
+        result = await ollama.chat("gemma3:1b", [{"role": "user", "content": "test"}])
+    assert post.call_count == 2
+    assert json.loads(result["message"]["content"]) == {"ok": True}
+    assert ollama.breaker("gemma3:1b").state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast_without_calling_ollama(ollama):
+    with patch.object(
+        ollama.client, "post", new_callable=AsyncMock, side_effect=httpx.ConnectError("refused")
+    ) as post:
+        with pytest.raises(OllamaUnavailableError):
+            await ollama.chat("gemma3:1b", [{"role": "user", "content": "test"}])
+        assert post.call_count == 3
+        assert ollama.breaker("gemma3:1b").state == "open"
+
+        with pytest.raises(OllamaCircuitOpenError):
+            await ollama.chat("gemma3:1b", [{"role": "user", "content": "test"}])
+        assert post.call_count == 3
+    # Breakers are per model
+    assert ollama.breaker("other-model").allow()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried_or_counted(ollama):
+    not_found = httpx.Response(404, json={"error": "model not found"}, request=_fake_request())
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=not_found) as post:
+        for _ in range(3):
+            with pytest.raises(OllamaRequestError):
+                await ollama.chat("gemma3:1b", [{"role": "user", "content": "test"}])
+    assert post.call_count == 3
+    assert ollama.breaker("gemma3:1b").state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_and_counted(ollama):
+    unavailable = httpx.Response(503, request=_fake_request())
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=unavailable) as post:
+        with pytest.raises(OllamaUnavailableError):
+            await ollama.chat("gemma3:1b", [{"role": "user", "content": "test"}])
+    assert post.call_count == 3
+    assert ollama.breaker("gemma3:1b").state == "open"
+
+
+@pytest.mark.asyncio
+async def test_stream_client_error_is_not_retried(ollama):
+    calls = []
+
+    def bad_request(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": "invalid format"})
+
+    ollama.client = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(bad_request))
+    with pytest.raises(OllamaRequestError):
+        async for _ in ollama.chat_stream("gemma3:1b", [{"role": "user", "content": "x"}]):
+            pass
+    assert len(calls) == 1
+    assert ollama.breaker("gemma3:1b").stats()["consecutive_failures"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_retries_before_first_token(ollama):
+    document = {"callouts": [], "summary": "ok"}
+    transport = _ndjson_stream(json.dumps(document))
+    calls = []
+
+    def flaky(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused")
+        return transport.handler(request)
+
+    ollama.client = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(flaky))
+    tokens = [t async for t in ollama.chat_stream("gemma3:1b", [{"role": "user", "content": "x"}])]
+    assert json.loads("".join(tokens)) == document
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_carry_keep_alive(ollama):
+    mock_resp = _mock_chat_response({"ok": True})
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=mock_resp) as mock_post:
+        await ollama.chat_json("gemma3:1b", [{"role": "user", "content": "test"}])
+    assert mock_post.call_args[1]["json"]["keep_alive"] == ollama.keep_alive
+
+
+@pytest.mark.asyncio
+async def test_warm_up_generates_one_token_in_background_slot(ollama):
+    resp = httpx.Response(200, json={"response": "ok", "done": True}, request=_fake_request())
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=resp) as mock_post:
+        elapsed = await ollama.warm_up("gemma3:1b")
+        await ollama.keep_resident("gemma3:1b")
+
+    assert elapsed >= 0
+    (path,), kwargs = mock_post.call_args_list[0]
+    assert path == "/api/generate"
+    assert kwargs["json"]["options"] == {"num_predict": 1}
+    assert kwargs["json"]["keep_alive"] == ollama.keep_alive
+    # keep_resident sends no prompt, so Ollama only loads the model
+    assert mock_post.call_args_list[1][1]["json"] == {"model": "gemma3:1b", "keep_alive": ollama.keep_alive}
+    assert ollama.scheduler.stats()["admitted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_keep_resident_omits_unset_keep_alive(ollama):
+    ollama.keep_alive = None
+    resp = httpx.Response(200, json={"done": True}, request=_fake_request())
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=resp) as mock_post:
+        await ollama.keep_resident("gemma3:1b")
+    assert mock_post.call_args[1]["json"] == {"model": "gemma3:1b"}
+
+
+@pytest.mark.asyncio
+async def test_warm_up_raises_unavailable_when_ollama_is_down(ollama):
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, side_effect=httpx.ConnectError("refused")):
+        with pytest.raises(OllamaUnavailableError):
+            await ollama.warm_up("gemma3:1b")
+
+
+@pytest.mark.asyncio
+async def test_load_duration_reaches_scheduler_and_refreshes_residency(ollama):
+    resp = httpx.Response(200, json={
+        "model": "gemma3:1b", "message": {"role": "assistant", "content": "{}"}, "done": True,
+        "load_duration": 2_000_000_000,
+    }, request=_fake_request())
+    ps = httpx.Response(200, json={"models": [{"name": "gemma3:1b", "model": "gemma3:1b"}]},
+                        request=httpx.Request("GET", "http://localhost:11434/api/ps"))
+    with patch.object(ollama.client, "post", new_callable=AsyncMock, return_value=resp), \
+            patch.object(ollama.client, "get", new_callable=AsyncMock, return_value=ps) as mock_get:
+        await ollama.chat_json("gemma3:1b", [{"role": "user", "content": "test"}])
+        await ollama._residency_refresh
+
+    mock_get.assert_awaited_once_with("/api/ps")
+    stats = ollama.scheduler.stats()
+    assert stats["model_loads"] == 1
+    assert stats["load_seconds"] == 2.0
+    assert stats["resident_models"] == ["gemma3:1b"]
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import pytest
+from api.job_queues import (
+    COMPLETE, ERROR, QUEUED, RUNNING, InProcessJobQueue, RespJobQueue, SQLiteJobQueue, open_job_queue,
+)
+from api.resp import RespConnection, RespError, RespServer
+
+REQUEST = json.dumps({"description": "12mm boss"})
+EVENTS = [{"event": "analysis_complete", "data": json.dumps({"analysis_id": "j1"})}]
+
+
+@pytest.fixture
+async def resp_server():
+    server = RespServer()
+    port = await server.start()
+    yield port
+    await server.close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "resp"])
+async def queue(request, tmp_path, resp_server):
+    if request.param == "memory":
+        q = InProcessJobQueue()
+    elif request.param == "sqlite":
+        q = await SQLiteJobQueue.open(str(tmp_path / "jobs.db"), poll_interval=0.01)
+    else:
+        q = await RespJobQueue.open("127.0.0.1", resp_server)
+    yield q
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_job_lifecycle(queue):
+    await queue.submit("j1", REQUEST)
+    assert (await queue.get("j1"))["status"] == QUEUED
+
+    assert await queue.claim("w1", timeout=1) == ("j1", REQUEST)
+    running = await queue.get("j1")
+    assert running["status"] == RUNNING and running["worker"] == "w1"
+
+    await queue.finish("j1", COMPLETE, EVENTS)
+    done = await queue.get("j1")
+    assert done["status"] == COMPLETE
+    assert done["events"] == EVENTS
+    assert done["request"] == {"description": "12mm boss"}
+    assert done["finished_at"] >= done["started_at"] >= done["created_at"]
+    assert await queue.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_claimed_once_in_submission_order(queue):
+    for job_id in ("a", "b", "c"):
+        await queue.submit(job_id, REQUEST)
+    claims = await asyncio.gather(*(queue.claim(f"w{i}", timeout=1) for i in range(3)))
+    assert sorted(job_id for job_id, _ in claims) == ["a", "b", "c"]
+    assert await queue.claim("w4", timeout=0.05) is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_job_survives_reopen_and_expired_lease_is_reclaimed(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first = await SQLiteJobQueue.open(path, lease_seconds=60)
+    await first.submit("j1", REQUEST)
+    assert await first.claim("dead-worker", timeout=0) is not None
+    await first.close()
+
+    clock = [0.0]
+    second = await SQLiteJobQueue.open(path, lease_seconds=60, clock=lambda: clock[0])
+    try:
+        clock[0] = (await second.get("j1"))["started_at"] + 30
+        assert await second.claim("w2", timeout=0) is None
+        clock[0] += 60
+        assert await second.claim("w2", timeout=0) == ("j1", REQUEST)
+    finally:
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_job_that_keeps_killing_workers_is_given_up(tmp_path):
+    clock = [1000.0]
+    queue = await SQLiteJobQueue.open(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2,
+                                      clock=lambda: clock[0])
+    try:
+        await queue.submit("poison", REQUEST)
+        clock[0] += 1
+        await queue.submit("next", REQUEST)
+        for attempt in (1, 2):
+            assert await queue.claim(f"w{attempt}", timeout=0) == ("poison", REQUEST)
+            assert (await queue.get("poison"))["attempts"] == attempt
+            clock[0] += 61
+        # The lease ran out on the last attempt: the queue moves on
+        assert await queue.claim("w3", timeout=0) == ("next", REQUEST)
+        poison = await queue.get("poison")
+        assert poison["status"] == ERROR and "2 attempts" in poison["error"]
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_resp_job_of_dead_worker_is_handed_out_again(resp_server):
+    clock = [1000.0]
+    first = await RespJobQueue.open("127.0.0.1", resp_server, lease_seconds=60, clock=lambda: clock[0])
+    await first.submit("j1", REQUEST)
+    assert await first.claim("dead-worker", timeout=1) == ("j1", REQUEST)
+    # The worker dies without finishing the job
+    await first.close()
+
+    second = await RespJobQueue.open("127.0.0.1", resp_server, lease_seconds=60, clock=lambda: clock[0])
+    try:
+        clock[0] += 30
+        assert await second.claim("w2", timeout=1) is None
+        clock[0] += 60
+        assert await second.claim("w2", timeout=1) == ("j1", REQUEST)
+        job = await second.get("j1")
+        assert job["status"] == RUNNING and job["worker"] == "w2"
+
+        await second.finish("j1", COMPLETE, [])
+        processing = [second.PROCESSING_KEY.format(w) for w in ("dead-worker", "w2")]
+        assert [await second._conn.execute("LLEN", key) for key in processing] == [0, 0]
+    finally:
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_resp_job_that_keeps_killing_workers_is_given_up(resp_server):
+    clock = [1000.0]
+    queue = await RespJobQueue.open("127.0.0.1", resp_server, lease_seconds=60, max_attempts=2,
+                                    clock=lambda: clock[0])
+    try:
+        await queue.submit("poison", REQUEST)
+        await queue.submit("next", REQUEST)
+        for attempt in (1, 2):
+            assert await queue.claim(f"w{attempt}", timeout=1) == ("poison", REQUEST)
+            assert (await queue.get("poison"))["attempts"] == attempt
+            clock[0] += 61
+        assert await queue.claim("w3", timeout=1) == ("next", REQUEST)
+        poison = await queue.get("poison")
+        assert poison["status"] == ERROR and "2 attempts" in poison["error"]
+        assert await queue.claim("w4", timeout=1) is None
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_resp_worker_slots_wait_for_jobs_independently(resp_server):
+    queue = await RespJobQueue.open("127.0.0.1", resp_server)
+    try:
+        idle = asyncio.create_task(queue.claim("w/0", timeout=5))
+        await asyncio.sleep(0.05)
+        # Another slot's wait ends after its own timeout, not after the first slot's
+        assert await asyncio.wait_for(queue.claim("w/1", timeout=1), timeout=2.5) is None
+        await queue.submit("j1", REQUEST)
+        assert await asyncio.wait_for(idle, timeout=1) == ("j1", REQUEST)
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_resp_cancelled_claim_does_not_leave_a_stale_reply(resp_server):
+    queue = await RespJobQueue.open("127.0.0.1", resp_server)
+    try:
+        waiting = asyncio.create_task(queue.claim("w/0", timeout=1))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        # Let the abandoned BRPOPLPUSH time out on the server
+        await asyncio.sleep(1.1)
+        await queue.submit("j1", REQUEST)
+        assert await queue.claim("w/0", timeout=1) == ("j1", REQUEST)
+    finally:
+        await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_resp_stand_in_speaks_the_protocol(resp_server):
+    conn = await RespConnection.open("127.0.0.1", resp_server)
+    try:
+        assert await conn.execute("PING") == "PONG"
+        assert await conn.execute("LPUSH", "q", "x", "y") == 2
+        assert await conn.execute("BRPOP", "q", 1) == ["q", "x"]
+        assert await conn.execute("BRPOPLPUSH", "q", "p", 1) == "y"
+        assert await conn.execute("LRANGE", "p", 0, -1) == ["y"]
+        assert await conn.execute("LREM", "p", 1, "y") == 1
+        assert await conn.execute("HSET", "h", "a", "1", "b", "2") == 2
+        assert await conn.execute("HGETALL", "h") == ["a", "1", "b", "2"]
+        assert await conn.execute("HGET", "h", "missing") is None
+        assert await conn.execute("HSETNX", "h", "a", "0") == 0
+        assert await conn.execute("HSETNX", "h", "c", "3") == 1
+        with pytest.raises(RespError):
+            await conn.execute("FLUSHALL")
+    finally:
+        await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_open_job_queue_selects_backend_from_url(tmp_path):
+    assert isinstance(await open_job_queue("memory://"), InProcessJobQueue)
+    sqlite_queue = await open_job_queue(f"sqlite://{tmp_path / 'jobs.db'}")
+    assert sqlite_queue.backend == "sqlite"
+    await sqlite_queue.close()
+    with pytest.raises(ValueError):
+        await open_job_queue("kafka://localhost")
@@ -0,0 +1,52 @@
+import json
+from models.json_stream import StreamingArrayParser
+
+
+DOC = {
+    "callouts": [
+        {"feature": "bore {A}", "symbol": "⌖", "datum_references": ["A", "B"]},
+        {"feature": "face \"top\"", "symbol": "▱", "nested": {"k": [1, 2]}},
+    ],
+    "summary": "callouts",
+    "warnings": [],
+}
+
+
+def _feed_in_chunks(parser, text, size):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+def test_yields_each_element_once_it_closes():
+    text = json.dumps(DOC)
+    parser = StreamingArrayParser("callouts")
+    first_close = text.index("}, {") + 1
+    assert parser.feed(text[:first_close - 1]) == []
+    assert parser.feed(text[first_close - 1:first_close]) == [DOC["callouts"][0]]
+
+
+def test_single_character_chunks():
+    text = json.dumps(DOC)
+    parser = StreamingArrayParser("callouts")
+    assert _feed_in_chunks(parser, text, 1) == DOC["callouts"]
+    assert json.loads(parser.text) == DOC
+
+
+def test_braces_inside_strings_are_ignored():
+    text = json.dumps({"callouts": [{"reasoning": "use {} and [] and \" quotes"}]})
+    parser = StreamingArrayParser("callouts")
+    assert _feed_in_chunks(parser, text, 3) == [{"reasoning": "use {} and [] and \" quotes"}]
+
+
+def test_other_arrays_are_not_emitted():
+    text = json.dumps({"warnings": [{"a": 1}], "callouts": [{"b": 2}]})
+    parser = StreamingArrayParser("callouts")
+    assert _feed_in_chunks(parser, text, 4) == [{"b": 2}]
+
+
+def test_value_matching_key_name_does_not_trigger():
+    text = json.dumps({"summary": "callouts", "other": [{"x": 1}]})
+    parser = StreamingArrayParser("callouts")
+    assert _feed_in_chunks(parser, text, 5) == []
@@ -0,0 +1,150 @@
+import asyncio
+import base64
+import io
+import pytest
+from PIL import Image, ImageDraw
+from unittest.mock import AsyncMock
+from api.components import LOADERS, READY, Readiness
+from api.live_session import LiveSession
+from .test_routes import _make_app
+
+
+def _frame(box: tuple[int, int, int, int] | None = None, noise: int = 0) -> str:
+    image = Image.new("RGB", (320, 240), (255 - noise, 255, 255))
+    if box:
+        ImageDraw.Draw(image).rectangle(box, fill=(0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def _events(session: LiveSession, message: dict) -> list[dict]:
+    return [event async for event in session.process(message)]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_frame_skips_the_vlm():
+    app = _make_app()
+    session = LiveSession(app.state)
+
+    first = await _events(session, {"image_base64": _frame(), "description": "12mm boss"})
+    second = await _events(session, {"image_base64": _frame(noise=2)})
+
+    assert first[0]["event"] == "frame_accepted"
+    assert first[-1]["event"] == "analysis_complete"
+    assert [e["event"] for e in second] == ["frame_skipped"]
+    assert app.state.vlm.describe_image.await_count == 1
+    assert session.stats() == {"frames": 2, "analyzed": 1, "skipped": 1, "superseded": 0}
+
+
+@pytest.mark.asyncio
+async def test_description_change_reuses_the_frame_description():
+    app = _make_app()
+    session = LiveSession(app.state)
+    await _events(session, {"image_base64": _frame(), "description": "12mm boss"})
+
+    events = await _events(session, {"description": "12mm boss, press fit"})
+
+    accepted = events[0]["data"]
+    assert "vision" not in accepted["rerun"] and "cad" not in accepted["rerun"]
+    assert {"extract", "classify", "worker"} <= set(accepted["rerun"])
+    assert events[-1]["event"] == "analysis_complete"
+    assert "vision" not in events[-1]["data"]["metadata"]["stages"]
+    assert app.state.vlm.describe_image.await_count == 1
+    assert app.state.ollama.extract_features.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_changed_frame_reruns_vision():
+    app = _make_app()
+    session = LiveSession(app.state)
+    await _events(session, {"image_base64": _frame(), "description": "12mm boss"})
+
+    events = await _events(session, {"image_base64": _frame((80, 60, 240, 180))})
+
+    assert events[0]["data"]["distance"] > session.max_distance
+    assert "vision" in events[0]["data"]["rerun"]
+    assert app.state.vlm.describe_image.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_changed_frame_rereads_live_cad_context():
+    app = _make_app()
+    app.state.freecad = AsyncMock()
+    app.state.freecad.extract_cad_context = AsyncMock(return_value={"document_name": "Part", "objects": []})
+    session = LiveSession(app.state)
+    await _events(session, {"image_base64": _frame(), "description": "12mm boss"})
+
+    events = await _events(session, {"image_base64": _frame((80, 60, 240, 180))})
+
+    assert {"vision", "cad"} <= set(events[0]["data"]["rerun"])
+    assert app.state.freecad.extract_cad_context.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_frames_wait_for_the_vlm_but_text_does_not():
+    app = _make_app()
+    app.state.readiness = Readiness(LOADERS)
+    for name in LOADERS:
+        if name != "vlm":
+            app.state.readiness.mark(name, READY)
+    session = LiveSession(app.state)
+
+    frame = await _events(session, {"image_base64": _frame(), "description": "12mm boss"})
+    text = await _events(session, {"description": "12mm boss"})
+
+    assert [e["event"] for e in frame] == ["error"]
+    assert "vlm" in frame[0]["data"]["error"]
+    assert text[-1]["event"] == "analysis_complete"
+    assert app.state.vlm.describe_image.await_count == 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_frame_reports_error_and_keeps_session():
+    app = _make_app()
+    session = LiveSession(app.state)
+
+    events = await _events(session, {"image_base64": "not an image"})
+
+    assert [e["event"] for e in events] == ["error"]
+    assert session.request is None
+
+
+@pytest.mark.asyncio
+async def test_frames_arriving_mid_analysis_are_superseded_by_the_newest():
+    app = _make_app()
+    gate = asyncio.Event()
+    features = app.state.ollama.extract_features.return_value
+
+    async def slow_extract(*args, **kwargs):
+        await gate.wait()
+        return features
+
+    app.state.ollama.extract_features = AsyncMock(side_effect=slow_extract)
+    session = LiveSession(app.state)
+    inbox: asyncio.Queue = asyncio.Queue()
+    sent = []
+
+    async def send(event):
+        sent.append(event)
+
+    serving = asyncio.create_task(session.serve(inbox.get, send))
+    inbox.put_nowait({"image_base64": _frame(), "description": "12mm boss"})
+    await asyncio.sleep(0.05)
+    assert app.state.ollama.extract_features.await_count == 1
+    newest = _frame((200, 100, 300, 200))
+    for image in (_frame((0, 0, 100, 100)), newest):
+        inbox.put_nowait({"image_base64": image})
+    await asyncio.sleep(0.01)
+    gate.set()
+    for _ in range(100):
+        if session.analyzed == 2 and sent[-1]["event"] == "analysis_complete":
+            break
+        await asyncio.sleep(0.01)
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+    assert session.superseded == 1
+    assert session.analyzed == 2
+    app.state.vlm.describe_image.assert_awaited_with(newest, max_distance=session.max_distance)
+    assert sent[-1]["event"] == "analysis_complete"
@@ -0,0 +1,98 @@
+import pytest
+from models.llm_cache import TOUCH_INTERVAL_SECONDS, LLMResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+async def cache(tmp_path):
+    c = await LLMResponseCache.open(str(tmp_path / "llm_cache.db"))
+    yield c
+    await c.close()
+
+
+def test_make_key_depends_on_every_input():
+    messages = [{"role": "user", "content": "x"}]
+    base = LLMResponseCache.make_key("gemma3:1b", messages, "json")
+    assert base == LLMResponseCache.make_key("gemma3:1b", [{"content": "x", "role": "user"}], "json")
+    assert base != LLMResponseCache.make_key("gemma3:270m", messages, "json")
+    assert base != LLMResponseCache.make_key("gemma3:1b", [{"role": "user", "content": "y"}], "json")
+    assert base != LLMResponseCache.make_key("gemma3:1b", messages, None)
+    assert base != LLMResponseCache.make_key("gemma3:1b", messages, "json", {"temperature": 0})
+
+
+@pytest.mark.asyncio
+async def test_put_then_get(cache):
+    await cache.put("k", "gemma3:1b", '{"a": 1}')
+    assert await cache.get("k") == '{"a": 1}'
+    assert await cache.get("other") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+@pytest.mark.asyncio
+async def test_survives_reopen(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    first = await LLMResponseCache.open(path)
+    await first.put("k", "gemma3:1b", '{"a": 1}')
+    await first.close()
+
+    second = await LLMResponseCache.open(path)
+    assert await second.get("k") == '{"a": 1}'
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_miss(tmp_path):
+    clock = FakeClock()
+    cache = await LLMResponseCache.open(str(tmp_path / "c.db"), max_age_seconds=60, clock=clock)
+    await cache.put("k", "gemma3:1b", "{}")
+    clock.now += 61
+    assert await cache.get("k") is None
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_prune_evicts_least_recently_used_over_size(tmp_path):
+    clock = FakeClock()
+    cache = await LLMResponseCache.open(str(tmp_path / "c.db"), max_bytes=20, clock=clock)
+    await cache.put("old", "m", "x" * 10)
+    clock.now += 1
+    await cache.put("new", "m", "y" * 10)
+    clock.now += TOUCH_INTERVAL_SECONDS
+    await cache.get("old")
+    clock.now += 1
+    await cache.put("newest", "m", "z" * 10)
+
+    removed = await cache.prune()
+    assert removed == 1
+    assert await cache.get("new") is None
+    assert await cache.get("old") is not None
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_recent_hit_does_not_write(tmp_path):
+    clock = FakeClock()
+    cache = await LLMResponseCache.open(str(tmp_path / "c.db"), clock=clock)
+    await cache.put("k", "m", "v")
+    changes = cache.conn.total_changes
+    clock.now += TOUCH_INTERVAL_SECONDS - 1
+    assert await cache.get("k") == "v"
+    assert cache.conn.total_changes == changes
+
+    clock.now += 1
+    assert await cache.get("k") == "v"
+    assert cache.conn.total_changes == changes + 1
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_waits_for_other_writers(cache):
+    async with cache.conn.execute("PRAGMA busy_timeout") as cursor:
+        assert (await cursor.fetchone())[0] == 5000
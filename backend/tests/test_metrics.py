@@ -0,0 +1,57 @@
+import pytest
+from models.metrics import Counter, Gauge, Histogram, Registry
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_renders_labelled_series(registry):
+    errors = Counter("errors_total", "Errors.", ("layer",), registry=registry)
+    errors.inc(layer="worker")
+    errors.inc(2, layer="worker")
+    errors.inc(layer='we"ird')
+    text = registry.render()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{layer="worker"} 3' in text
+    assert 'errors_total{layer="we\\"ird"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.7, 5.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_count 4" in lines
+    assert "latency_seconds_sum 6.25" in lines
+
+
+def test_histogram_time_observes_on_exception(registry):
+    latency = Histogram("op_seconds", "Op.", ("op",), registry=registry)
+    with pytest.raises(RuntimeError):
+        with latency.time(op="boom"):
+            raise RuntimeError
+    assert latency.count(op="boom") == 1
+
+
+def test_gauge_tracks_inprogress(registry):
+    in_flight = Gauge("in_flight", "In flight.", registry=registry)
+    with in_flight.track_inprogress():
+        assert in_flight.value() == 1
+    assert in_flight.value() == 0
+
+
+def test_wrong_labels_are_rejected(registry):
+    errors = Counter("errors_total", "Errors.", ("layer",), registry=registry)
+    with pytest.raises(ValueError):
+        errors.inc(stage="worker")
+
+
+def test_duplicate_registration_is_rejected(registry):
+    Counter("dup_total", "Dup.", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("dup_total", "Dup.", registry=registry)
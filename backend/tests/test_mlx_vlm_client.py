@@ -1,11 +1,26 @@
 import asyncio
+import base64
+import io
 import json
+import threading
 import pytest
+from PIL import Image
 from unittest.mock import patch, MagicMock, AsyncMock
 
+from models.cancellation import cancellations
 from models.mlx_vlm_client import MlxVlmClient, MlxVlmLoadError, MlxVlmTimeoutError, INFERENCE_TIMEOUT
 
 
+def _png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+PNG_BYTES = _png_bytes()
+PNG_BASE64 = base64.b64encode(PNG_BYTES).decode()
+
+
 @pytest.fixture
 def mock_model():
     return MagicMock(name="mock_model")
@@ -31,10 +46,14 @@ def client(mock_model, mock_processor, mock_config):
     return c
 
 
-def _mock_generation_result(text: str):
-    result = MagicMock()
-    result.text = text
-    return result
+def _mock_stream(text: str):
+    """Mimic mlx_vlm.stream_generate: one chunk per word, each with a .text segment."""
+    def stream(*args, **kwargs):
+        for i, word in enumerate(text.split(" ")):
+            chunk = MagicMock()
+            chunk.text = word if i == 0 else " " + word
+            yield chunk
+    return stream
 
 
 @patch("models.mlx_vlm_client.load_config")
@@ -63,15 +82,15 @@ def test_load_model_raises_on_failure(mock_load, mock_load_config):
 
 @pytest.mark.asyncio
 @patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
-@patch("models.mlx_vlm_client.mlx_generate")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
 async def test_describe_image_returns_text(mock_gen, mock_template, client):
-    mock_gen.return_value = _mock_generation_result("A rectangular tabletop with 4 cylindrical holes at corners")
+    mock_gen.side_effect = _mock_stream("A rectangular tabletop with 4 cylindrical holes at corners")
 
-    result = await client.describe_image("iVBORw0KGgo=")
+    result = await client.describe_image(PNG_BASE64)
 
     assert isinstance(result, str)
     assert "rectangular" in result
-    # Should have been called with image paths (a temp file)
+    # Should have been called with the decoded image
     call_args = mock_gen.call_args
     image_arg = call_args[0][3] if len(call_args[0]) > 3 else call_args[1].get("image")
     assert image_arg is not None
@@ -80,30 +99,30 @@ async def test_describe_image_returns_text(mock_gen, mock_template, client):
 
 @pytest.mark.asyncio
 @patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
-@patch("models.mlx_vlm_client.mlx_generate")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
 async def test_describe_image_strips_whitespace(mock_gen, mock_template, client):
-    mock_gen.return_value = _mock_generation_result("  some description with whitespace  \n")
+    mock_gen.side_effect = _mock_stream("  some description with whitespace  \n")
 
-    result = await client.describe_image("iVBORw0KGgo=")
+    result = await client.describe_image(PNG_BASE64)
 
     assert result == "some description with whitespace"
 
 
 @pytest.mark.asyncio
 @patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
-@patch("models.mlx_vlm_client.mlx_generate")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
 async def test_generate_runs_in_thread(mock_gen, mock_template, client):
     """Verify _generate uses asyncio.to_thread (wrapped in wait_for)."""
-    mock_gen.return_value = _mock_generation_result("description text")
+    mock_gen.side_effect = _mock_stream("description text")
 
-    result = await client.describe_image("iVBORw0KGgo=")
-    # mlx_generate is called inside asyncio.to_thread; verify it was called
+    result = await client.describe_image(PNG_BASE64)
+    # mlx_stream_generate is consumed inside asyncio.to_thread; verify it was called
     mock_gen.assert_called_once()
 
 
 @pytest.mark.asyncio
 @patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
-@patch("models.mlx_vlm_client.mlx_generate")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
 async def test_generate_timeout_raises(mock_gen, mock_template, client):
     """Verify MlxVlmTimeoutError is raised when inference exceeds timeout."""
     with patch("asyncio.wait_for", side_effect=asyncio.TimeoutError):
@@ -113,29 +132,112 @@ async def test_generate_timeout_raises(mock_gen, mock_template, client):
 
 @pytest.mark.asyncio
 @patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
-@patch("models.mlx_vlm_client.mlx_generate")
-async def test_temp_file_cleanup(mock_gen, mock_template, client):
-    mock_gen.return_value = _mock_generation_result("description text")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
+async def test_image_is_passed_in_memory_without_temp_file(mock_gen, mock_template, client):
+    mock_gen.side_effect = _mock_stream("description text")
+
+    with patch("tempfile.mkstemp") as mkstemp:
+        await client.describe_image(PNG_BYTES)
 
-    import tempfile
-    import os
+    mkstemp.assert_not_called()
+    images = mock_gen.call_args[0][3]
+    assert len(images) == 1
+    assert isinstance(images[0], Image.Image)
+    assert images[0].mode == "RGB" and images[0].size == (16, 16)
 
-    # Track temp files created
-    original_mkstemp = tempfile.mkstemp
-    created_files = []
 
-    def tracking_mkstemp(*args, **kwargs):
-        fd, path = original_mkstemp(*args, **kwargs)
-        created_files.append(path)
-        return fd, path
+@pytest.mark.asyncio
+@patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
+async def test_raw_bytes_and_base64_share_frame_cache_entry(mock_gen, mock_template, client):
+    mock_gen.side_effect = _mock_stream("A blank view")
+
+    assert await client.describe_image(bytearray(PNG_BYTES)) == "A blank view"
+    assert await client.describe_image(PNG_BASE64) == "A blank view"
+    assert mock_gen.call_count == 1
 
-    with patch("tempfile.mkstemp", side_effect=tracking_mkstemp):
-        await client.describe_image(image_base64="iVBORw0KGgo=")
 
-    # All temp files should have been cleaned up
-    for path in created_files:
-        assert not os.path.exists(path), f"Temp file {path} was not cleaned up"
+@pytest.mark.asyncio
+@patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
+async def test_cancelled_caller_stops_generation_between_tokens(mock_gen, mock_template, client):
+    first_token = threading.Event()
+    release = threading.Event()
+    produced = []
+
+    def stream(*args, **kwargs):
+        for i in range(kwargs["max_tokens"]):
+            produced.append(i)
+            first_token.set()
+            release.wait(timeout=1)
+            chunk = MagicMock()
+            chunk.text = "x"
+            yield chunk
+
+    mock_gen.side_effect = stream
+    cancellations.reset()
+    task = asyncio.create_task(client._generate("prompt", None, max_tokens=100))
+    await asyncio.to_thread(first_token.wait, 1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    release.set()
+    for _ in range(100):
+        if "vlm" in cancellations.stats():
+            break
+        await asyncio.sleep(0.01)
+
+    assert len(produced) < 100
+    stats = cancellations.stats()["vlm"]
+    assert stats["calls"] == 1
+    assert stats["tokens_skipped"] == 100 - len(produced) + 1
 
 
 def test_model_id_is_paligemma2():
     assert "paligemma2" in MlxVlmClient.MODEL_ID
+
+
+@pytest.mark.asyncio
+@patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
+async def test_describe_image_reuses_near_identical_frame_only_when_asked(mock_gen, mock_template, client):
+    import base64
+    import io
+    from PIL import Image, ImageDraw
+
+    def frame(cursor: tuple[int, int] | None = None) -> str:
+        image = Image.new("RGB", (320, 240), "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((40, 40, 200, 200), fill=(60, 60, 60))
+        if cursor:
+            draw.polygon([cursor, (cursor[0] + 12, cursor[1] + 12), (cursor[0], cursor[1] + 16)], fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    mock_gen.side_effect = _mock_stream("A square pocket")
+
+    await client.describe_image(frame())
+    # A few bits off: a one-shot analysis runs the model again...
+    await client.describe_image(frame(cursor=(100, 0)))
+    assert mock_gen.call_count == 2
+    # ...while live capture accepts it as the same view
+    assert await client.describe_image(frame(cursor=(100, 0)), max_distance=0) == "A square pocket"
+    assert await client.describe_image(frame(cursor=(120, 20)), max_distance=4) == "A square pocket"
+    assert mock_gen.call_count == 2
+    assert client.frame_cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+@patch("models.mlx_vlm_client.apply_chat_template", return_value="formatted prompt")
+@patch("models.mlx_vlm_client.mlx_stream_generate")
+async def test_warm_up_runs_blank_frame_without_caching(mock_gen, mock_template, client):
+    mock_gen.side_effect = _mock_stream("white")
+
+    elapsed = await client.warm_up()
+
+    assert elapsed >= 0
+    images = mock_gen.call_args[0][3]
+    assert images[0].size == (224, 224)
+    assert mock_gen.call_args[1]["max_tokens"] == 4
+    assert len(client.frame_cache) == 0
@@ -0,0 +1,166 @@
+import asyncio
+import pytest
+from models.ollama_scheduler import (
+    OllamaScheduler,
+    OllamaQueueFullError,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    request_priority,
+)
+
+
+@pytest.mark.asyncio
+async def test_admits_up_to_max_concurrency():
+    scheduler = OllamaScheduler(max_concurrency=2)
+    await scheduler.acquire()
+    await scheduler.acquire()
+    assert scheduler.active == 2
+    assert scheduler.queue_position() == 1
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_served_before_background():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    await scheduler.acquire()
+    order = []
+
+    async def worker(name, priority):
+        await scheduler.acquire(priority)
+        order.append(name)
+        scheduler.release()
+
+    background = asyncio.create_task(worker("background", PRIORITY_BACKGROUND))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(worker("interactive", PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    assert scheduler.queue_position(PRIORITY_INTERACTIVE) == 2
+    assert scheduler.queue_position(PRIORITY_BACKGROUND) == 3
+
+    scheduler.release()
+    await asyncio.gather(background, interactive)
+    assert order == ["interactive", "background"]
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_saturated():
+    scheduler = OllamaScheduler(max_concurrency=1, max_queue_depth=1)
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(OllamaQueueFullError):
+        await scheduler.acquire()
+    assert scheduler.rejected == 1
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.queue_depth() == 0
+    scheduler.release()
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_request_priority_context_selects_lane():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    await scheduler.acquire()
+
+    async def background_call():
+        with request_priority(PRIORITY_BACKGROUND):
+            async with scheduler.slot():
+                pass
+
+    task = asyncio.create_task(background_call())
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth(PRIORITY_BACKGROUND) == 1
+    scheduler.release()
+    await task
+    stats = scheduler.stats()
+    assert stats["admitted"] == 2
+    assert stats["queue_depth"] == {"interactive": 0, "background": 0}
+
+
+async def _run_in_order(scheduler, requests):
+    """Queue ``requests`` (name, model) behind one held slot, then record the order they run in."""
+    order = []
+
+    async def worker(name, model):
+        async with scheduler.slot(model=model):
+            order.append(name)
+
+    await scheduler.acquire(model="gemma3:1b")
+    tasks = []
+    for name, model in requests:
+        tasks.append(asyncio.create_task(worker(name, model)))
+        await asyncio.sleep(0)
+    scheduler.release("gemma3:1b")
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_requests_for_resident_model_run_first():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    scheduler.set_resident(["gemma3:1b"])
+
+    order = await _run_in_order(scheduler, [
+        ("ft-1", "gemma3:1b-gdt-ft"), ("base-1", "gemma3:1b"), ("ft-2", "gemma3:1b-gdt-ft"), ("base-2", "gemma3:1b"),
+    ])
+
+    assert order == ["base-1", "base-2", "ft-1", "ft-2"]
+    assert scheduler.stats()["affinity_picks"] == 2
+
+
+@pytest.mark.asyncio
+async def test_bypassed_request_is_not_starved():
+    scheduler = OllamaScheduler(max_concurrency=1, max_bypass=2)
+    scheduler.set_resident(["gemma3:1b"])
+
+    order = await _run_in_order(scheduler, [("ft", "gemma3:1b-gdt-ft")] + [(f"base-{i}", "gemma3:1b") for i in range(4)])
+
+    assert order.index("ft") == 2
+
+
+@pytest.mark.asyncio
+async def test_priority_still_beats_residency():
+    scheduler = OllamaScheduler(max_concurrency=1)
+    scheduler.set_resident(["gemma3:1b"])
+    await scheduler.acquire()
+    order = []
+
+    async def worker(name, priority, model):
+        async with scheduler.slot(priority, model=model):
+            order.append(name)
+
+    background = asyncio.create_task(worker("background", PRIORITY_BACKGROUND, "gemma3:1b"))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(worker("interactive", PRIORITY_INTERACTIVE, "gemma3:1b-gdt-ft"))
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(background, interactive)
+    assert order == ["interactive", "background"]
+
+
+def test_record_load_counts_reloads_after_eviction_as_swaps():
+    scheduler = OllamaScheduler()
+
+    assert scheduler.record_load("gemma3:1b", 0.01) is False
+    assert scheduler.record_load("gemma3:1b-gdt-ft", 2.0) is True
+    scheduler.set_resident(["gemma3:1b-gdt-ft"])
+    assert scheduler.record_load("gemma3:1b-gdt-ft", 0.002) is False
+    # gemma3:1b was evicted and comes back: a swap
+    assert scheduler.record_load("gemma3:1b", 1.5) is True
+
+    stats = scheduler.stats()
+    assert stats["model_loads"] == 2
+    assert stats["model_swaps"] == 1
+    assert stats["load_seconds"] == 3.5
+    assert stats["resident_models"] == ["gemma3:1b", "gemma3:1b-gdt-ft"]
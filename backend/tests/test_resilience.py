@@ -0,0 +1,75 @@
+import random
+import pytest
+from models.resilience import CircuitBreaker, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_backoff_grows_and_stays_within_jitter_band():
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=4.0, budget=100, rng=random.Random(7))
+    for attempt, cap in enumerate([1.0, 2.0, 4.0, 4.0]):
+        delay = policy.next_delay(attempt, elapsed=0.0)
+        assert cap / 2 <= delay <= cap
+
+
+def test_backoff_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=2)
+    assert policy.next_delay(0, 0.0) is not None
+    assert policy.next_delay(1, 0.0) is None
+
+
+def test_backoff_respects_budget():
+    policy = RetryPolicy(max_attempts=10, base_delay=1.0, budget=5.0)
+    assert policy.next_delay(0, elapsed=4.9) is None
+    assert policy.next_delay(0, elapsed=1.0) is not None
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker("m", failure_threshold=2, cooldown=10, clock=FakeClock())
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_half_open_allows_single_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_cooldown():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == pytest.approx(10.0)
+    assert breaker.times_opened == 2
+
+
+def test_abandoned_probe_lets_next_caller_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.allow()
+    breaker.record_abandoned()
+    assert breaker.allow()
@@ -0,0 +1,82 @@
+from api.result_cache import AnalysisResultCache, request_hash
+from api.schemas import AnalyzeRequest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _events(tag: str) -> list[dict]:
+    return [
+        {"event": "progress", "data": '{"step": 1}'},
+        {"event": "analysis_complete", "data": f'{{"analysis_id": "{tag}"}}'},
+    ]
+
+
+def test_request_hash_is_stable_across_cad_key_order():
+    a = AnalyzeRequest(description="boss", cad_context={"objects": [{"a": 1, "b": 2}]})
+    b = AnalyzeRequest(description="boss", cad_context={"objects": [{"b": 2, "a": 1}]})
+    assert request_hash(a) == request_hash(b)
+
+
+def test_request_hash_distinguishes_fields():
+    base = AnalyzeRequest(description="boss")
+    assert request_hash(base) != request_hash(AnalyzeRequest(description="hole"))
+    assert request_hash(base) != request_hash(AnalyzeRequest(description="boss", compare=True))
+    assert request_hash(base) != request_hash(
+        AnalyzeRequest(description="boss", image_base64="iVBORw0KGgo=")
+    )
+
+
+def test_get_returns_stored_events():
+    cache = AnalysisResultCache()
+    cache.put("k", _events("one"))
+    assert cache.get("k") == _events("one")
+    assert cache.hits == 1
+
+
+def test_miss_is_counted():
+    cache = AnalysisResultCache()
+    assert cache.get("missing") is None
+    assert cache.misses == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = AnalysisResultCache(ttl_seconds=10, clock=clock)
+    cache.put("k", _events("one"))
+    clock.now = 11
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_by_entry_count():
+    cache = AnalysisResultCache(max_entries=2)
+    cache.put("a", _events("a"))
+    cache.put("b", _events("b"))
+    cache.get("a")
+    cache.put("c", _events("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+
+
+def test_eviction_by_total_bytes():
+    size = sum(len(e["data"]) for e in _events("a"))
+    cache = AnalysisResultCache(max_bytes=size * 2)
+    cache.put("a", _events("a"))
+    cache.put("b", _events("b"))
+    cache.put("c", _events("c"))
+    assert len(cache) == 2
+    assert cache.stats()["bytes"] <= size * 2
+
+
+def test_returned_events_are_copies():
+    cache = AnalysisResultCache()
+    cache.put("k", _events("one"))
+    cache.get("k")[0]["data"] = "mutated"
+    assert cache.get("k")[0]["data"] == '{"step": 1}'
@@ -1,9 +1,29 @@
+import asyncio
+import base64
 import json
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
-from api.routes import router
+from fastapi.testclient import TestClient
+from api.components import LOADERS, READY, UNAVAILABLE, Readiness
+from api.job_queues import InProcessJobQueue
+from api.jobs import JobWorker
+from api.routes import _until_disconnected, router
+from api.result_cache import AnalysisResultCache
+from api.singleflight import SingleFlight
+from brain.analysis_store import AnalysisStore
+from models.freecad_client import FreecadClient
+from models.gemma import OllamaParseError
+from models.ollama_scheduler import OllamaScheduler
+from models.resilience import CircuitBreaker
+
+
+async def _stream_worker(worker_result: dict):
+    """Mimic OllamaClient.generate_output_stream for a fixed worker result."""
+    for callout in worker_result["callouts"]:
+        yield "callout", callout
+    yield "result", worker_result
 
 
 def _make_app():
@@ -14,6 +34,7 @@ def _make_app():
     # Mock mlx-vlm client (PaliGemma 2 -- image description only)
     vlm = AsyncMock()
     vlm.describe_image = AsyncMock(return_value="A cylindrical aluminum boss, 12mm diameter, on a flat mounting face")
+    vlm.frame_cache = None
     # Mock Ollama client (feature extraction + classifier + worker layers)
     ollama = AsyncMock()
     ollama.extract_features = AsyncMock(return_value={
@@ -24,7 +45,7 @@ def _make_app():
         "mating_condition": "bearing_bore_concentric",
         "parent_surface": "planar_mounting_face",
     })
-    ollama.generate_output = AsyncMock(return_value={
+    worker_result = {
         "callouts": [{
             "feature": "boss",
             "symbol": "\u22a5",
@@ -41,7 +62,9 @@ def _make_app():
         "manufacturing_notes": "CNC can hold this tolerance",
         "standards_references": ["ASME Y14.5-2018 7.2"],
         "warnings": ["Consider position callout for bore"],
-    })
+    }
+    ollama.generate_output = AsyncMock(return_value=worker_result)
+    ollama.generate_output_stream = MagicMock(side_effect=lambda **kwargs: _stream_worker(worker_result))
     ollama.classify_gdt = AsyncMock(return_value={
         "primary_control": "perpendicularity",
         "symbol": "\u22a5",
@@ -53,6 +76,8 @@ def _make_app():
         "confidence": 0.92,
     })
     ollama.health_check = AsyncMock(return_value={"models": [{"name": "gemma3:1b"}]})
+    ollama.scheduler = OllamaScheduler(max_concurrency=1, max_queue_depth=2)
+    ollama.breakers = {}
 
     # Mock embedder
     embedder = MagicMock()
@@ -98,6 +123,84 @@ async def test_health_endpoint():
         assert data["status"] == "healthy"
 
 
+@pytest.mark.asyncio
+async def test_health_reports_open_circuit():
+    app = _make_app()
+    breaker = CircuitBreaker("ollama:gemma3:1b", failure_threshold=1)
+    breaker.record_failure()
+    app.state.ollama.breakers = {"gemma3:1b": breaker}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        data = (await client.get("/api/health")).json()
+    assert data["status"] == "degraded"
+    assert data["ollama_circuits"]["gemma3:1b"]["state"] == "open"
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_exposes_layer_histograms():
+    from models.metrics import LAYER_LATENCY
+
+    app = _make_app()
+    before = LAYER_LATENCY.count(layer="worker")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/api/analyze", json={"description": "12mm boss"})
+        resp = await client.get("/api/metrics")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert LAYER_LATENCY.count(layer="worker") == before + 1
+    assert 'toleranceai_layer_latency_seconds_bucket{layer="classifier",le="+Inf"}' in resp.text
+    assert 'toleranceai_ollama_queue_depth{lane="interactive"} 0' in resp.text
+    assert "toleranceai_pipelines_in_flight 0" in resp.text
+
+
+@pytest.mark.asyncio
+async def test_reference_routes_serve_while_other_components_load():
+    app = _make_app()
+    app.state.readiness = Readiness(LOADERS)
+    app.state.readiness.mark("brain", READY)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        loading = await client.get("/api/ready")
+        tolerances = await client.get("/api/tolerances?process=cnc_milling&material=AL6061-T6")
+        search = await client.get("/api/standards/search?q=perpendicularity")
+        analyze = await client.post("/api/analyze", json={"description": "12mm boss"})
+        for name in LOADERS:
+            if name != "brain":
+                app.state.readiness.mark(name, UNAVAILABLE if name == "vlm" else READY)
+        ready = await client.get("/api/ready")
+        search_after = await client.get("/api/standards/search?q=perpendicularity")
+
+    assert loading.status_code == 503
+    assert loading.headers["retry-after"]
+    assert loading.json()["components"]["brain"]["status"] == READY
+    assert loading.json()["components"]["vlm"] == {"status": "loading"}
+    assert tolerances.status_code == 200
+    assert search.status_code == 503 and "embedder" in search.json()["detail"]
+    assert analyze.status_code == 503
+    assert ready.status_code == 200 and ready.json()["ready"] is True
+    assert ready.json()["components"]["vlm"]["status"] == UNAVAILABLE
+    assert search_after.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_text_only_analyze_does_not_wait_for_the_vlm():
+    app = _make_app()
+    app.state.readiness = Readiness(LOADERS)
+    for name in LOADERS:
+        if name != "vlm":
+            app.state.readiness.mark(name, READY)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        text = await client.post("/api/analyze", json={"description": "12mm boss"})
+        image = await client.post("/api/analyze", json={"description": "12mm boss", "image_base64": "aW1n"})
+
+    assert text.status_code == 200
+    assert _parse_sse(text.text)[-1]["event"] == "analysis_complete"
+    assert image.status_code == 503 and "vlm" in image.json()["detail"]
+
+
 @pytest.mark.asyncio
 async def test_analyze_returns_sse_stream():
     app = _make_app()
@@ -138,6 +241,44 @@ async def test_analyze_with_compare_flag():
         assert "classification_comparison" in event_types
 
 
+@pytest.mark.asyncio
+async def test_compare_runs_base_model_alongside_finetuned(monkeypatch):
+    monkeypatch.setattr("api.pipeline.BASE_MODEL", "base-model")
+    app = _make_app()
+    classification = app.state.ollama.classify_gdt.return_value
+    base_started = asyncio.Event()
+    worker_started = asyncio.Event()
+    worker_stream = app.state.ollama.generate_output_stream.side_effect
+
+    async def classify(features, model, use_cache=True):
+        if model == "base-model":
+            assert use_cache is False
+            base_started.set()
+            # Held until the worker runs: datum/matcher must not wait on the base model
+            await asyncio.wait_for(worker_started.wait(), timeout=1)
+            return {**classification, "primary_control": "position"}
+        await asyncio.wait_for(base_started.wait(), timeout=1)
+        return classification
+
+    def start_worker(**kwargs):
+        worker_started.set()
+        return worker_stream(**kwargs)
+
+    app.state.ollama.classify_gdt = AsyncMock(side_effect=classify)
+    app.state.ollama.generate_output_stream = MagicMock(side_effect=start_worker)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss", "compare": True})
+
+    events = _parse_sse(resp.text)
+    comparison = json.loads(next(e for e in events if e["event"] == "classification_comparison")["data"])
+    assert comparison["base_model"]["primary_control"] == "position"
+    assert comparison["finetuned_model"]["primary_control"] == "perpendicularity"
+    assert set(comparison["latency_ms"]) == {"base_model", "finetuned_model"}
+    event_types = [e["event"] for e in events]
+    assert event_types.index("datum_recommendation") < event_types.index("classification_comparison")
+
+
 @pytest.mark.asyncio
 async def test_analyze_metadata_has_zero_cloud_calls():
     app = _make_app()
@@ -182,13 +323,614 @@ async def test_tolerances_lookup():
         assert resp.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_analyze_replays_cached_result():
+    app = _make_app()
+    app.state.result_cache = AnalysisResultCache()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.post("/api/analyze", json={"description": "12mm boss"})
+        second = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    first_events = _parse_sse(first.text)
+    second_events = _parse_sse(second.text)
+    assert [e["event"] for e in first_events] == [e["event"] for e in second_events]
+    assert app.state.ollama.extract_features.await_count == 1
+    assert app.state.ollama.generate_output_stream.call_count == 1
+
+    first_meta = json.loads(first_events[-1]["data"])["metadata"]
+    second_meta = json.loads(second_events[-1]["data"])["metadata"]
+    assert first_meta["cache_hit"] is False
+    assert second_meta["cache_hit"] is True
+
+
+@pytest.mark.asyncio
+async def test_analyze_does_not_cache_results_from_live_freecad():
+    app = _make_app()
+    app.state.result_cache = AnalysisResultCache()
+    app.state.freecad = AsyncMock()
+    app.state.freecad._mock_mode = False
+    app.state.freecad.extract_cad_context = AsyncMock(return_value={"document_name": "Part", "objects": []})
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/api/analyze", json={"description": "12mm boss"})
+        second = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    # The part may have been edited in between, so the second request re-reads it
+    assert app.state.freecad.extract_cad_context.await_count == 2
+    assert json.loads(_parse_sse(second.text)[-1]["data"])["metadata"]["cache_hit"] is False
+    assert len(app.state.result_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_analyze_caches_results_from_mock_freecad():
+    app = _make_app()
+    app.state.result_cache = AnalysisResultCache()
+    app.state.freecad = FreecadClient()
+    app.state.freecad._mock_mode = True
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/api/analyze", json={"description": "12mm boss"})
+            second = await client.post("/api/analyze", json={"description": "12mm boss"})
+    finally:
+        await app.state.freecad.close()
+
+    assert json.loads(_parse_sse(first.text)[-1]["data"])["metadata"]["cache_hit"] is False
+    assert json.loads(_parse_sse(second.text)[-1]["data"])["metadata"]["cache_hit"] is True
+    assert app.state.ollama.extract_features.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_analyze_does_not_cache_results_with_failed_lookups():
+    app = _make_app()
+    app.state.result_cache = AnalysisResultCache()
+    app.state.embedder.match_standards = MagicMock(side_effect=RuntimeError("index missing"))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    metadata = json.loads(_parse_sse(resp.text)[-1]["data"])["metadata"]
+    assert metadata["degradations"] == [{"stage": "standards", "layer": "matcher", "reason": "failed"}]
+    assert metadata["stages"]["standards"]["status"] == "degraded"
+    assert len(app.state.result_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_analyze_streams_partial_callouts_before_final():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    events = _parse_sse(resp.text)
+    callout_events = [json.loads(e["data"]) for e in events if e["event"] == "gdt_callouts"]
+    assert [c["partial"] for c in callout_events] == [True, False]
+    assert callout_events[0]["index"] == 0
+    assert callout_events[0]["callouts"] == callout_events[1]["callouts"]
+
+    event_types = [e["event"] for e in events]
+    first_partial = event_types.index("gdt_callouts")
+    assert first_partial < event_types.index("reasoning") < event_types.index("warnings")
+
+
+@pytest.mark.asyncio
+async def test_worker_retry_resets_streamed_callouts():
+    app = _make_app()
+    worker_result = app.state.ollama.generate_output.return_value
+    attempts = []
+
+    async def flaky_worker(**kwargs):
+        attempts.append(kwargs)
+        yield "callout", worker_result["callouts"][0]
+        if len(attempts) == 1:
+            raise OllamaParseError("truncated JSON")
+        yield "result", worker_result
+
+    app.state.ollama.generate_output_stream = MagicMock(side_effect=lambda **kwargs: flaky_worker(**kwargs))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    callout_events = [json.loads(e["data"]) for e in _parse_sse(resp.text) if e["event"] == "gdt_callouts"]
+    assert [len(c["callouts"]) for c in callout_events] == [1, 0, 1, 1]
+    assert callout_events[1]["reset"] is True
+    assert callout_events[2]["index"] == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_pipeline_run():
+    app = _make_app()
+    app.state.flights = SingleFlight()
+    gate = asyncio.Event()
+    features = app.state.ollama.extract_features.return_value
+
+    async def slow_extract(*args, **kwargs):
+        await gate.wait()
+        return features
+
+    app.state.ollama.extract_features = AsyncMock(side_effect=slow_extract)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        requests = [
+            asyncio.create_task(client.post("/api/analyze", json={"description": "12mm boss"}))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        gate.set()
+        responses = await asyncio.gather(*requests)
+
+    assert app.state.ollama.extract_features.await_count == 1
+    assert app.state.flights.coalesced == 2
+    sequences = [[e["event"] for e in _parse_sse(r.text)] for r in responses]
+    assert sequences[0] == sequences[1] == sequences[2]
+    assert sequences[0][-1] == "analysis_complete"
+
+
+@pytest.mark.asyncio
+async def test_analyze_upload_passes_image_bytes_to_vlm():
+    app = _make_app()
+    app.state.result_cache = AnalysisResultCache()
+    image = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post(
+            "/api/analyze/upload",
+            files={"image": ("frame.png", image, "image/png")},
+            data={"request": json.dumps({"description": "12mm boss"})},
+        )
+        # The same image as base64 JSON shares the cached result
+        replay = await client.post("/api/analyze", json={
+            "description": "12mm boss", "image_base64": base64.b64encode(image).decode(),
+        })
+
+    assert resp.status_code == 200
+    events = _parse_sse(resp.text)
+    assert events[-1]["event"] == "analysis_complete"
+    (described,), _ = app.state.vlm.describe_image.await_args
+    assert bytes(described) == image
+    assert json.loads(_parse_sse(replay.text)[-1]["data"])["metadata"]["cache_hit"] is True
+
+
+@pytest.mark.asyncio
+async def test_analyze_upload_rejects_bad_bodies():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        not_multipart = await client.post("/api/analyze/upload", json={"description": "x"})
+        invalid = await client.post("/api/analyze/upload", files={"image": ("f.png", b"x", "image/png")},
+                                    data={"request": json.dumps({"deadline_ms": -1})})
+        too_large = await client.post("/api/analyze/upload", files={"image": ("f.png", b"x" * 64, "image/png")},
+                                      headers={"content-length": "999999999"})
+
+    assert not_multipart.status_code == 415
+    assert invalid.status_code == 422
+    assert too_large.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_analyze_returns_429_when_queue_saturated():
+    app = _make_app()
+    scheduler = app.state.ollama.scheduler
+    await scheduler.acquire()
+    waiters = [asyncio.create_task(scheduler.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "2"
+    for waiter in waiters:
+        waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_analyze_emits_queued_event_when_slots_busy():
+    app = _make_app()
+    scheduler = app.state.ollama.scheduler
+    await scheduler.acquire()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+    queued = [json.loads(e["data"]) for e in _parse_sse(resp.text) if e["event"] == "queued"]
+    assert queued
+    assert queued[0]["layer"] == "student"
+    assert queued[0]["position"] == 1
+
+
+@pytest.mark.asyncio
+async def test_multi_feature_fans_out_over_cad_objects():
+    from models.mock_cad_contexts import get_desk_mock
+
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={
+            "description": "table",
+            "multi_feature": True,
+            "cad_context": get_desk_mock(),
+        })
+
+    events = _parse_sse(resp.text)
+    extraction = json.loads(next(e["data"] for e in events if e["event"] == "feature_extraction"))
+    assert len(extraction["features"]) == 13
+    # Identical holes and legs collapse into one analysis each; bosses differ by parent leg
+    assert app.state.ollama.classify_gdt.await_count == 7
+    assert app.state.ollama.generate_output.await_count == 7
+
+    tagged = [json.loads(e["data"]) for e in events if e["event"] == "datum_recommendation"]
+    assert sorted(d["feature_index"] for d in tagged) == list(range(13))
+
+    final = [json.loads(e["data"]) for e in events if e["event"] == "gdt_callouts"][-1]
+    assert final["partial"] is False
+    assert len(final["callouts"]) == 13
+    complete = json.loads(events[-1]["data"])
+    assert complete["metadata"]["features_analyzed"] == 13
+    assert complete["metadata"]["unique_features"] == 7
+
+
+@pytest.mark.asyncio
+async def test_tolerance_lookup_does_not_wait_for_classification():
+    app = _make_app()
+    tolerance_lookup_started = asyncio.Event()
+    classification = app.state.ollama.classify_gdt.return_value
+    tolerance_range = app.state.manufacturing_lookup.get_tolerance_range.return_value
+
+    async def slow_classify(*args, **kwargs):
+        await asyncio.wait_for(tolerance_lookup_started.wait(), timeout=1)
+        return classification
+
+    async def record_tolerance_lookup(*args, **kwargs):
+        tolerance_lookup_started.set()
+        return tolerance_range
+
+    app.state.ollama.classify_gdt = AsyncMock(side_effect=slow_classify)
+    app.state.manufacturing_lookup.get_tolerance_range = AsyncMock(side_effect=record_tolerance_lookup)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    events = _parse_sse(resp.text)
+    assert events[-1]["event"] == "analysis_complete"
+    stages = json.loads(events[-1]["data"])["metadata"]["stages"]
+    assert stages["tolerances"]["start_ms"] <= stages["classify"]["start_ms"] + stages["classify"]["duration_ms"]
+
+
+@pytest.mark.asyncio
+async def test_deadline_falls_back_to_table_driven_worker():
+    app = _make_app()
+
+    async def hanging_worker(**kwargs):
+        await asyncio.sleep(10)
+        yield "result", {}
+
+    app.state.ollama.generate_output_stream = MagicMock(side_effect=lambda **kwargs: hanging_worker(**kwargs))
+    app.state.result_cache = AnalysisResultCache()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss", "deadline_ms": 300})
+
+    events = _parse_sse(resp.text)
+    assert events[-1]["event"] == "analysis_complete"
+    callouts = [json.loads(e["data"]) for e in events if e["event"] == "gdt_callouts"][-1]["callouts"]
+    assert callouts[0]["symbol_name"] == "perpendicularity"
+    # tight class takes the low end of the 0.02-0.1mm capability row
+    assert callouts[0]["feature_control_frame"] == "|\u22a5| \u23000.02 | A | B |"
+    metadata = json.loads(events[-1]["data"])["metadata"]
+    assert metadata["degraded"] is True
+    assert metadata["deadline_ms"] == 300
+    assert [d["stage"] for d in metadata["degradations"]] == ["worker"]
+    assert metadata["stages"]["worker"]["status"] == "degraded"
+    assert len(app.state.result_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_deadline_falls_back_to_rule_classification():
+    app = _make_app()
+
+    async def hanging_classify(features, model):
+        await asyncio.sleep(10)
+
+    app.state.ollama.classify_gdt = AsyncMock(side_effect=hanging_classify)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss", "deadline_ms": 300})
+
+    events = _parse_sse(resp.text)
+    assert events[-1]["event"] == "analysis_complete"
+    metadata = json.loads(events[-1]["data"])["metadata"]
+    assert [d["stage"] for d in metadata["degradations"]][0] == "classify"
+    callouts = [json.loads(e["data"]) for e in events if e["event"] == "gdt_callouts"][-1]["callouts"]
+    # A boss is classified by rule as perpendicularity
+    assert callouts[0]["symbol_name"] == "perpendicularity"
+
+
+@pytest.mark.asyncio
+async def test_deadline_in_extraction_still_completes():
+    app = _make_app()
+
+    async def hanging_extract(text):
+        await asyncio.sleep(10)
+
+    app.state.ollama.extract_features = AsyncMock(side_effect=hanging_extract)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss", "deadline_ms": 300})
+
+    events = _parse_sse(resp.text)
+    assert events[-1]["event"] == "analysis_complete"
+    stages = [d["stage"] for d in json.loads(events[-1]["data"])["metadata"]["degradations"]]
+    assert stages[0] == "extract" and "classify" in stages
+
+
+@pytest.mark.asyncio
+async def test_slow_vision_is_skipped_within_deadline():
+    app = _make_app()
+
+    async def slow_describe(image_base64, max_distance=None):
+        await asyncio.sleep(10)
+
+    app.state.vlm.describe_image = AsyncMock(side_effect=slow_describe)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={
+            "description": "12mm boss", "image_base64": "aW1n", "deadline_ms": 400,
+        })
+
+    events = _parse_sse(resp.text)
+    metadata = json.loads(events[-1]["data"])["metadata"]
+    assert [d["stage"] for d in metadata["degradations"]] == ["vision"]
+    assert metadata["total_latency_ms"] < 1000
+    extracted_text = app.state.ollama.extract_features.call_args.args[0]
+    assert extracted_text == "12mm boss"
+
+
+@pytest.mark.asyncio
+async def test_analyze_reports_no_degradation_within_deadline():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+
+    metadata = json.loads(_parse_sse(resp.text)[-1]["data"])["metadata"]
+    assert metadata["degraded"] is False
+    assert metadata["degradations"] == []
+
+
+@pytest.mark.asyncio
+async def test_deadline_is_opt_in(monkeypatch):
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+        # ANALYZE_DEADLINE_MS sets one for requests without deadline_ms
+        monkeypatch.setattr("api.pipeline.DEFAULT_DEADLINE_MS", 5000)
+        with_default = await client.post("/api/analyze", json={"description": "12mm bore"})
+
+    assert json.loads(_parse_sse(resp.text)[-1]["data"])["metadata"]["deadline_ms"] is None
+    assert json.loads(_parse_sse(with_default.text)[-1]["data"])["metadata"]["deadline_ms"] == 5000
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_in_flight_pipeline(monkeypatch):
+    from api.pipeline import run_pipeline
+    from api.schemas import AnalyzeRequest
+
+    monkeypatch.setattr("api.routes.DISCONNECT_POLL_INTERVAL", 0.01)
+    app = _make_app()
+    vision_started = asyncio.Event()
+    vision_cancelled = asyncio.Event()
+
+    async def slow_describe(image_base64, max_distance=None):
+        vision_started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            vision_cancelled.set()
+            raise
+
+    app.state.vlm.describe_image = AsyncMock(side_effect=slow_describe)
+    flights = SingleFlight()
+    body = AnalyzeRequest(description="12mm boss", image_base64="aW1n")
+    flight, _ = flights.join("k", lambda: run_pipeline(app.state, body))
+
+    request = MagicMock()
+    request.is_disconnected = AsyncMock(return_value=False)
+    received = []
+
+    async def consume():
+        async for event in _until_disconnected(request, flight.subscribe()):
+            received.append(event)
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.wait_for(vision_started.wait(), timeout=1)
+    request.is_disconnected.return_value = True
+    await asyncio.wait_for(consumer, timeout=1)
+    await asyncio.wait_for(vision_cancelled.wait(), timeout=1)
+    await asyncio.wait_for(flight.task, timeout=1)
+
+    assert flight.cancelled
+    assert received and received[0]["event"] == "progress"
+    app.state.ollama.extract_features.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_completed_analysis_is_retrievable_by_id(tmp_path):
+    app = _make_app()
+    app.state.analysis_store = await AnalysisStore.open(str(tmp_path / "analyses.db"))
+    app.state.result_cache = AnalysisResultCache()
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+            complete = json.loads(_parse_sse(resp.text)[-1]["data"])
+            analysis_id = complete["analysis_id"]
+
+            stored = (await client.get(f"/api/analysis/{analysis_id}")).json()
+            assert stored["status"] == "complete"
+            assert stored["stages"] == complete["metadata"]["stages"]
+            assert stored["events"][-1]["data"]["analysis_id"] == analysis_id
+
+            # A cache replay keeps the original id and is not stored again
+            replay = await client.post("/api/analyze", json={"description": "12mm boss"})
+            assert json.loads(_parse_sse(replay.text)[-1]["data"])["analysis_id"] == analysis_id
+
+            listing = (await client.get("/api/analysis", params={"limit": 10})).json()
+            assert listing["total"] == 1
+            assert listing["items"][0]["analysis_id"] == analysis_id
+
+            assert (await client.get("/api/analysis/nope")).status_code == 404
+    finally:
+        await app.state.analysis_store.close()
+
+
+@pytest.mark.asyncio
+async def test_analysis_history_unavailable_without_store():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/api/analysis/some-id")).status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_analyze_numbers_events_and_names_the_analysis():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+    events = _parse_sse(resp.text)
+    assert [e["id"] for e in events] == [str(i) for i in range(len(events))]
+    assert resp.headers["x-analysis-id"] == json.loads(events[-1]["data"])["analysis_id"]
+
+
+@pytest.mark.asyncio
+async def test_second_viewer_attaches_and_resumes_running_analysis():
+    app = _make_app()
+    app.state.flights = SingleFlight()
+    gate = asyncio.Event()
+    features = app.state.ollama.extract_features.return_value
+
+    async def slow_extract(*args, **kwargs):
+        await gate.wait()
+        return features
+
+    app.state.ollama.extract_features = AsyncMock(side_effect=slow_extract)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        first = asyncio.create_task(client.post("/api/analyze", json={"description": "12mm boss"}))
+        await asyncio.sleep(0.05)
+        (flight,) = app.state.flights._flights.values()
+        url = f"/api/analysis/{flight.analysis_id}/events"
+        viewer = asyncio.create_task(client.get(url))
+        resumed = asyncio.create_task(client.get(url, headers={"Last-Event-ID": "1"}))
+        await asyncio.sleep(0.05)
+        gate.set()
+        response = await first
+        original = _parse_sse(response.text)
+        viewer_events = _parse_sse((await viewer).text)
+        resumed_events = _parse_sse((await resumed).text)
+
+    assert response.headers["x-analysis-id"] == flight.analysis_id
+    assert app.state.ollama.extract_features.await_count == 1
+    assert app.state.flights.attached == 2
+    assert viewer_events == original
+    assert resumed_events == original[2:]
+
+
+@pytest.mark.asyncio
+async def test_finished_analysis_resumes_from_store(tmp_path):
+    app = _make_app()
+    app.state.flights = SingleFlight()
+    app.state.analysis_store = await AnalysisStore.open(str(tmp_path / "analyses.db"))
+    transport = ASGITransport(app=app)
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/api/analyze", json={"description": "12mm boss"})
+            original = _parse_sse(resp.text)
+            url = f"/api/analysis/{resp.headers['x-analysis-id']}/events"
+            resumed = await client.get(url, headers={"Last-Event-ID": original[-3]["id"]})
+            assert _parse_sse(resumed.text) == original[-2:]
+            assert (await client.get(url, headers={"Last-Event-ID": "x"})).status_code == 400
+            assert (await client.get("/api/analysis/nope/events")).status_code == 404
+    finally:
+        await app.state.analysis_store.close()
+
+
+@pytest.mark.asyncio
+async def test_analysis_job_runs_on_worker_and_returns_result():
+    app = _make_app()
+    app.state.job_queue = InProcessJobQueue()
+    worker = JobWorker(app.state, app.state.job_queue, concurrency=1)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        submitted = await client.post("/api/jobs/analyze", json={"description": "12mm boss"})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["job_id"]
+
+        pending = await client.get(f"/api/jobs/{job_id}/result")
+        assert pending.status_code == 202 and pending.json()["status"] == "queued"
+
+        worker.start()
+        try:
+            for _ in range(100):
+                status = (await client.get(f"/api/jobs/{job_id}")).json()
+                if status["status"] == "complete":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await worker.stop()
+
+        assert "events" not in status
+        result = (await client.get(f"/api/jobs/{job_id}/result")).json()
+        assert (await client.get("/api/jobs/nope")).status_code == 404
+
+    assert result["status"] == "complete"
+    assert result["events"][-1]["event"] == "analysis_complete"
+    assert result["events"][-1]["data"]["analysis_id"] == job_id
+    assert worker.completed == 1
+
+
+@pytest.mark.asyncio
+async def test_jobs_unavailable_without_queue():
+    app = _make_app()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/api/jobs/analyze", json={"description": "12mm boss"})
+    assert resp.status_code == 503
+
+
+def test_live_capture_websocket_pushes_results_and_skips_repeats():
+    import base64
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "white").save(buffer, format="PNG")
+    frame = base64.b64encode(buffer.getvalue()).decode()
+    app = _make_app()
+    with TestClient(app).websocket_connect("/api/live") as ws:
+        ws.send_json({"image_base64": frame, "description": "12mm boss"})
+        events = [ws.receive_json()]
+        while events[-1]["event"] != "analysis_complete":
+            events.append(ws.receive_json())
+        ws.send_json({"image_base64": frame})
+        skipped = ws.receive_json()
+
+    assert events[0]["event"] == "frame_accepted"
+    assert "gdt_callouts" in [e["event"] for e in events]
+    assert skipped["event"] == "frame_skipped"
+    assert app.state.vlm.describe_image.await_count == 1
+
+
 def _parse_sse(text: str) -> list[dict]:
-    """Parse raw SSE text into a list of {event, data} dicts."""
+    """Parse raw SSE text into a list of {event, data[, id]} dicts."""
     events = []
     current = {}
     for line in text.strip().split("\n"):
         line = line.strip()
-        if line.startswith("event:"):
+        if line.startswith("id:"):
+            current["id"] = line[len("id:"):].strip()
+        elif line.startswith("event:"):
             current["event"] = line[len("event:"):].strip()
         elif line.startswith("data:"):
             current["data"] = line[len("data:"):].strip()
@@ -0,0 +1,169 @@
+import asyncio
+import pytest
+from api.singleflight import SingleFlight
+
+
+async def _source(gate: asyncio.Event, n: int = 3):
+    for i in range(n):
+        if i == 1:
+            await gate.wait()
+        yield {"event": "progress", "data": str(i)}
+
+
+async def _collect(flight, after: int = -1):
+    return [event async for event in flight.subscribe(after)]
+
+
+@pytest.mark.asyncio
+async def test_second_join_attaches_to_running_flight():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    calls = []
+
+    def start():
+        calls.append(1)
+        return _source(gate)
+
+    first, leader = flights.join("k", start)
+    second, follower = flights.join("k", start)
+    assert leader is True and follower is False
+    assert first is second
+    assert len(calls) == 1
+    assert flights.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_receives_full_sequence():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    flight, _ = flights.join("k", lambda: _source(gate))
+    early = asyncio.create_task(_collect(flight))
+    await asyncio.sleep(0.01)
+    late = asyncio.create_task(_collect(flight))
+    gate.set()
+    early_events, late_events = await asyncio.gather(early, late)
+    assert [e["data"] for e in early_events] == ["0", "1", "2"]
+    assert late_events == early_events
+
+
+@pytest.mark.asyncio
+async def test_finished_flight_is_forgotten():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    gate.set()
+    flight, _ = flights.join("k", lambda: _source(gate))
+    await flight.task
+    await asyncio.sleep(0)
+    assert len(flights) == 0
+    _, leader = flights.join("k", lambda: _source(gate))
+    assert leader is True
+
+
+@pytest.mark.asyncio
+async def test_source_exception_ends_subscribers():
+    async def broken():
+        yield {"event": "progress", "data": "0"}
+        raise RuntimeError("boom")
+
+    flights = SingleFlight()
+    flight, _ = flights.join("k", broken)
+    events = await asyncio.wait_for(_collect(flight), timeout=1)
+    assert [e["data"] for e in events] == ["0"]
+
+
+@pytest.mark.asyncio
+async def test_last_subscriber_leaving_cancels_the_run():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    flight, _ = flights.join("k", lambda: _source(gate))
+    subscription = flight.subscribe()
+    assert (await anext(subscription))["data"] == "0"
+    await subscription.aclose()
+    await asyncio.wait_for(flight.task, timeout=1)
+
+    assert flight.cancelled
+    assert flights.stats()["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pending_join_keeps_the_run_alive():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    flight, _ = flights.join("k", lambda: _source(gate))
+    first = flight.subscribe()
+    await anext(first)
+    flights.join("k", lambda: _source(gate))  # joined, not yet subscribed
+    await first.aclose()
+    assert not flight.task.done()
+
+    gate.set()
+    events = await asyncio.wait_for(_collect(flight), timeout=1)
+    assert [e["data"] for e in events] == ["0", "1", "2"]
+    assert not flight.cancelled
+
+
+@pytest.mark.asyncio
+async def test_subscribe_resumes_after_event_id_from_bounded_buffer():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    gate.set()
+    flight, _ = flights.join("k", lambda: _source(gate, 5), analysis_id="a1")
+    flight.max_events = 3
+    await flight.task
+
+    assert [e["id"] for e in await _collect(flight)] == ["2", "3", "4"]
+    assert [e["data"] for e in await _collect(flight, after=2)] == ["3", "4"]
+    assert flights.attach("a1") is None
+
+
+@pytest.mark.asyncio
+async def test_attach_finds_running_flight_by_analysis_id():
+    flights = SingleFlight()
+    gate = asyncio.Event()
+    flight, _ = flights.join("k", lambda: _source(gate, 2), analysis_id="a1")
+
+    assert flights.attach("a1") is flight
+    assert flights.attach("other") is None
+    gate.set()
+    assert [e["data"] for e in await _collect(flight)] == ["0", "1"]
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_progress_before_other_events():
+    flights = SingleFlight()
+    events = [{"event": "progress", "data": "p0"}, {"event": "cad_context", "data": "c1"},
+              {"event": "progress", "data": "p2"}, {"event": "gdt_callouts", "data": "g3"},
+              {"event": "analysis_complete", "data": "a4"}]
+
+    async def source():
+        for event in events:
+            yield event
+
+    flight, _ = flights.join("k", source, analysis_id="a1")
+    flight.max_events = 3
+    await flight.task
+
+    received = await _collect(flight)
+    assert [e["data"] for e in received] == ["c1", "g3", "a4"]
+    assert [e["id"] for e in received] == ["1", "3", "4"]
+    assert [e["data"] for e in await _collect(flight, after=1)] == ["g3", "a4"]
+
+
+@pytest.mark.asyncio
+async def test_unread_dropped_event_ends_stream_with_error():
+    flights = SingleFlight()
+
+    async def source():
+        for i in range(4):
+            yield {"event": "gdt_callouts", "data": str(i)}
+
+    flight, _ = flights.join("k", source, analysis_id="a1")
+    flight.max_events = 3
+    await flight.task
+
+    # Event 0 was dropped before this subscriber read it
+    received = await _collect(flight)
+    assert [e["event"] for e in received] == ["error"]
+    assert "/api/analysis/a1" in received[0]["data"]
+    # A client that had already seen it resumes normally
+    assert [e["data"] for e in await _collect(flight, after=0)] == ["1", "2", "3"]
@@ -0,0 +1,247 @@
+import asyncio
+import time
+import pytest
+from api.stage_graph import (
+    DeadlineExceededError, Stage, StageGraph, StageGraphError, StageTimeoutError,
+)
+
+
+def _const(**outputs):
+    async def fn(ctx):
+        return outputs
+    return fn
+
+
+async def _drain(graph, initial=None):
+    return [event async for event in graph.run(initial)]
+
+
+@pytest.mark.asyncio
+async def test_dependent_stage_receives_inputs():
+    async def double(ctx):
+        return {"b": ctx["a"] * 2}
+
+    graph = StageGraph([
+        Stage("second", double, inputs=("a",), outputs=("b",)),
+        Stage("first", _const(a=21), outputs=("a",)),
+    ])
+    await _drain(graph)
+    assert graph.values["b"] == 42
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_run_concurrently():
+    both_started = asyncio.Event()
+    started = []
+
+    def waiter(name):
+        async def fn(ctx):
+            started.append(name)
+            if len(started) == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), timeout=1)
+            return {name: True}
+        return fn
+
+    graph = StageGraph([
+        Stage("left", waiter("left"), outputs=("left",)),
+        Stage("right", waiter("right"), outputs=("right",)),
+    ])
+    await _drain(graph)
+    assert sorted(started) == ["left", "right"]
+
+
+@pytest.mark.asyncio
+async def test_events_are_yielded_in_emit_order():
+    async def emitter(ctx):
+        ctx.emit({"event": "one"})
+        await asyncio.sleep(0)
+        ctx.emit({"event": "two"})
+        return {}
+
+    graph = StageGraph([
+        Stage("emit", emitter, start_events=[{"event": "start"}]),
+    ])
+    assert [e["event"] for e in await _drain(graph)] == ["start", "one", "two"]
+
+
+@pytest.mark.asyncio
+async def test_retry_on_listed_exceptions():
+    calls = []
+
+    async def flaky(ctx):
+        calls.append(ctx.attempt)
+        if ctx.attempt == 0:
+            raise ValueError("bad json")
+        return {"x": 1}
+
+    graph = StageGraph([Stage("flaky", flaky, outputs=("x",), retries=1, retry_on=(ValueError,))])
+    await _drain(graph)
+    assert calls == [0, 1]
+    assert graph.spans["flaky"].attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_unlisted_exception_propagates_and_cancels_siblings():
+    cancelled = asyncio.Event()
+
+    async def broken(ctx):
+        raise RuntimeError("boom")
+
+    async def slow(ctx):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return {"y": 1}
+
+    graph = StageGraph([
+        Stage("broken", broken, outputs=("x",), retries=3, retry_on=(ValueError,)),
+        Stage("slow", slow, outputs=("y",)),
+    ])
+    with pytest.raises(RuntimeError):
+        await _drain(graph)
+    assert cancelled.is_set()
+    assert graph.spans["slow"].status == "cancelled"
+
+
+@pytest.mark.asyncio
+async def test_timeout_raises_stage_timeout_error():
+    async def hang(ctx):
+        await asyncio.sleep(10)
+
+    graph = StageGraph([Stage("hang", hang, outputs=("x",), layer="matcher", timeout=0.01)])
+    with pytest.raises(StageTimeoutError) as excinfo:
+        await _drain(graph)
+    assert excinfo.value.layer == "matcher"
+
+
+@pytest.mark.asyncio
+async def test_initial_values_skip_producing_stages():
+    calls = []
+
+    async def produce(ctx):
+        calls.append("produce")
+        return {"a": 1}
+
+    async def consume(ctx):
+        return {"b": ctx["a"] + 1}
+
+    graph = StageGraph([
+        Stage("produce", produce, outputs=("a",)),
+        Stage("consume", consume, inputs=("a",), outputs=("b",)),
+    ])
+    await _drain(graph, {"a": 10})
+    assert calls == []
+    assert graph.values["b"] == 11
+
+
+def test_downstream_follows_dependencies_transitively():
+    graph = StageGraph([
+        Stage("a", _const(), outputs=("a",)),
+        Stage("b", _const(), inputs=("a",), outputs=("b",)),
+        Stage("c", _const(), inputs=("b", "x"), outputs=("c",)),
+        Stage("x", _const(), outputs=("x",)),
+    ])
+    assert graph.downstream({"a"}) == {"a", "b", "c"}
+    assert graph.downstream({"x"}) == {"x", "c"}
+
+
+def test_missing_input_is_rejected():
+    graph = StageGraph([Stage("orphan", _const(), inputs=("nothing",))])
+    with pytest.raises(StageGraphError):
+        asyncio.run(_drain(graph))
+
+
+@pytest.mark.asyncio
+async def test_layer_timings_cover_concurrent_spans():
+    async def sleeper(ctx):
+        await asyncio.sleep(0.02)
+        return {ctx.stage.name: True}
+
+    graph = StageGraph([
+        Stage("a", sleeper, outputs=("a",), layer="student"),
+        Stage("b", sleeper, outputs=("b",), layer="student"),
+    ])
+    await _drain(graph)
+    timings = graph.layer_timings()
+    assert 15 <= timings["student"] < 40
+    assert set(graph.span_summary()) == {"a", "b"}
+
+
+async def _hang(ctx):
+    await asyncio.sleep(10)
+
+
+@pytest.mark.asyncio
+async def test_deadline_cuts_stage_short_and_uses_fallback():
+    graph = StageGraph(
+        [Stage("slow", _hang, outputs=("x",), reserve=0.0, fallback=lambda ctx: {"x": "fallback"})],
+        deadline=time.monotonic() + 0.05,
+    )
+    await _drain(graph)
+    assert graph.values["x"] == "fallback"
+    assert graph.spans["slow"].status == "degraded"
+    assert graph.degradations == [{"stage": "slow", "layer": None, "reason": "timed_out"}]
+
+
+@pytest.mark.asyncio
+async def test_stage_can_record_its_own_degradation():
+    async def lookup(ctx):
+        ctx.degrade("failed")
+        return {"x": []}
+
+    graph = StageGraph([Stage("lookup", lookup, outputs=("x",), layer="matcher")])
+    await _drain(graph)
+    assert graph.spans["lookup"].status == "degraded"
+    assert graph.degradations == [{"stage": "lookup", "layer": "matcher", "reason": "failed"}]
+
+
+@pytest.mark.asyncio
+async def test_reserve_skips_stage_when_budget_is_spent():
+    calls = []
+
+    async def first(ctx):
+        await asyncio.sleep(0.06)
+        return {"a": 1}
+
+    async def optional(ctx):
+        calls.append("optional")
+        return {"b": "real"}
+
+    graph = StageGraph([
+        Stage("first", first, outputs=("a",)),
+        Stage("optional", optional, inputs=("a",), outputs=("b",), reserve=0.5,
+              fallback=lambda ctx: {"b": "skipped"}),
+    ], deadline=time.monotonic() + 0.1)
+    await _drain(graph)
+    assert calls == []
+    assert graph.values["b"] == "skipped"
+    assert graph.degradations[0]["reason"] == "skipped"
+
+
+@pytest.mark.asyncio
+async def test_deadline_without_fallback_raises():
+    graph = StageGraph(
+        [Stage("slow", _hang, outputs=("x",), layer="worker", reserve=0.0)],
+        deadline=time.monotonic() + 0.02,
+    )
+    with pytest.raises(DeadlineExceededError) as excinfo:
+        await _drain(graph)
+    assert excinfo.value.layer == "worker"
+    assert isinstance(excinfo.value, StageTimeoutError)
+
+
+@pytest.mark.asyncio
+async def test_stages_without_reserve_ignore_deadline():
+    async def after(ctx):
+        return {"y": ctx["x"]}
+
+    graph = StageGraph([
+        Stage("slow", _hang, outputs=("x",), reserve=0.0, fallback=lambda ctx: {"x": 1}),
+        Stage("after", after, inputs=("x",), outputs=("y",)),
+    ], deadline=time.monotonic() + 0.02)
+    await _drain(graph)
+    assert graph.values["y"] == 1
+    assert graph.spans["after"].status == "ok"
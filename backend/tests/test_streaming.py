@@ -1,5 +1,9 @@
 import json
-from api.streaming import sse_event, sse_error, sse_progress, SSE_EVENT_TYPES
+import pytest
+from sse_starlette.sse import ServerSentEvent
+from api import streaming
+from api.streaming import encode_event, sse_event, sse_error, sse_progress, SSE_EVENT_TYPES
+from models.mock_cad_contexts import get_desk_mock
 
 
 def test_sse_event_types_defined():
@@ -43,3 +47,24 @@ def test_sse_progress_format():
     assert data["message"] == "Extracting features..."
     assert data["step"] == 1
     assert data["total_steps"] == 5
+
+
+@pytest.mark.parametrize("event", [
+    sse_progress("worker", "Generating callouts...", 4, 5),
+    sse_event("cad_context", get_desk_mock()),
+    {**sse_event("gdt_callouts", {"symbol": "\u22a5"}), "id": "7"},
+    {"event": "custom", "data": "line one\nline two"},
+])
+def test_encode_event_matches_sse_starlette(event):
+    expected = ServerSentEvent(sep="\n", **event).encode()
+    assert encode_event(event) == expected
+
+
+def test_progress_events_are_built_once():
+    assert sse_progress("student", "Extracting...", 1, 5)["data"] is sse_progress("student", "Extracting...", 1, 5)["data"]
+
+
+def test_stdlib_json_fallback(monkeypatch):
+    monkeypatch.setattr(streaming, "orjson", None)
+    event = sse_event("warnings", {"warnings": ["check datum B"], "count": 1})
+    assert event["data"] == json.dumps({"warnings": ["check datum B"], "count": 1})
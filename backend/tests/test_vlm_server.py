@@ -0,0 +1,112 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api import components
+from api.components import PRELOADED, READY, init_components
+from api.vlm_server import create_app
+from models.mlx_vlm_client import MlxVlmLoadError, MlxVlmTimeoutError, MlxVlmUnavailableError
+from models.remote_vlm_client import RemoteVlmClient
+
+
+class FakeVlm:
+    MODEL_ID = "fake"
+    frame_cache = None
+
+    def __init__(self, fail_load=False, timeout=False):
+        self.fail_load = fail_load
+        self.timeout = timeout
+        self.images = []
+
+    def load(self):
+        if self.fail_load:
+            raise RuntimeError("no weights")
+
+    async def describe_image(self, image, max_distance=None):
+        self.max_distance = max_distance
+        if self.timeout:
+            raise MlxVlmTimeoutError("Inference timed out after 120s")
+        self.images.append(image)
+        return f"{len(image)} bytes of CAD view"
+
+    async def warm_up(self):
+        return 0.5
+
+
+async def _client_for(vlm):
+    app = create_app(lambda: vlm)
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    client = RemoteVlmClient("/unused.sock", transport=httpx.ASGITransport(app=app))
+    return client, lifespan
+
+
+@pytest.mark.asyncio
+async def test_remote_client_describes_raw_bytes_and_base64():
+    vlm = FakeVlm()
+    client, lifespan = await _client_for(vlm)
+    try:
+        await client.wait_until_loaded(timeout=1)
+        assert await client.describe_image(b"\x89PNG-frame") == "10 bytes of CAD view"
+        assert await client.describe_image("iVBORw0KGgo=") == "8 bytes of CAD view"
+        assert vlm.max_distance is None
+        await client.describe_image(b"frame", max_distance=4)
+        assert vlm.max_distance == 4
+        assert await client.warm_up() == 0.5
+    finally:
+        await client.close()
+        await lifespan.__aexit__(None, None, None)
+    assert vlm.images[0] == b"\x89PNG-frame"
+
+
+@pytest.mark.asyncio
+async def test_server_timeout_becomes_vlm_timeout_error():
+    client, lifespan = await _client_for(FakeVlm(timeout=True))
+    try:
+        await client.wait_until_loaded(timeout=1)
+        with pytest.raises(MlxVlmTimeoutError, match="timed out"):
+            await client.describe_image(b"frame")
+    finally:
+        await client.close()
+        await lifespan.__aexit__(None, None, None)
+
+
+@pytest.mark.asyncio
+async def test_failed_model_load_is_reported_to_workers():
+    client, lifespan = await _client_for(FakeVlm(fail_load=True))
+    try:
+        with pytest.raises(MlxVlmLoadError, match="no weights"):
+            await client.wait_until_loaded(timeout=1)
+        with pytest.raises(MlxVlmUnavailableError, match="503"):
+            await client.describe_image(b"frame")
+    finally:
+        await client.close()
+        await lifespan.__aexit__(None, None, None)
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_is_unavailable(tmp_path):
+    client = RemoteVlmClient(str(tmp_path / "missing.sock"))
+    try:
+        with pytest.raises(MlxVlmUnavailableError):
+            await client.describe_image(b"frame")
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_use_preloaded_embedder_and_shared_vlm(monkeypatch):
+    preloaded = object()
+    monkeypatch.setitem(PRELOADED, "embedder", preloaded)
+    monkeypatch.setenv(components.VLM_SERVER_SOCKET_ENV, "/tmp/toleranceai-test-vlm.sock")
+    monkeypatch.setattr(RemoteVlmClient, "wait_until_loaded", lambda self, timeout: asyncio.sleep(0))
+    state = type("State", (), {})()
+    init_components(state)
+    try:
+        assert await components._load_embedder(state) == READY
+        assert await components._load_vlm(state) == READY
+        assert state.embedder is preloaded
+        assert isinstance(state.vlm, RemoteVlmClient)
+    finally:
+        await components.close_components(state)
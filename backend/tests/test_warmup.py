@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from api.components import COLD, WARM, Readiness
+from api.warmup import PIPELINE_MODELS, ModelWarmer
+from models.gemma import OllamaUnavailableError
+
+
+def _state(vlm=None):
+    ollama = SimpleNamespace(
+        warm_up=AsyncMock(return_value=1.25),
+        keep_resident=AsyncMock(),
+        refresh_residency=AsyncMock(return_value=["gemma3:1b"]),
+        keep_alive="30m",
+    )
+    return SimpleNamespace(ollama=ollama, vlm=vlm, readiness=Readiness([]))
+
+
+def test_pipeline_models_are_deduplicated():
+    assert PIPELINE_MODELS == ("gemma3:1b",)
+
+
+@pytest.mark.asyncio
+async def test_warm_up_records_duration_per_model():
+    vlm = SimpleNamespace(warm_up=AsyncMock(side_effect=RuntimeError("kernel build failed")))
+    state = _state(vlm)
+
+    await ModelWarmer(state, models=("gemma3:1b", "gemma3:1b-gdt-ft")).warm_up()
+
+    assert state.ollama.warm_up.await_args_list[0].args == ("gemma3:1b",)
+    assert state.ollama.warm_up.await_args_list[1].args == ("gemma3:1b-gdt-ft",)
+    warmup = state.readiness.report()["warmup"]
+    assert warmup["ollama:gemma3:1b"] == {"status": WARM, "seconds": 1.25}
+    assert warmup["vlm"] == {"status": COLD, "error": "kernel build failed"}
+    assert state.readiness.report()["ready"] is True
+
+
+@pytest.mark.asyncio
+async def test_warm_ups_run_concurrently():
+    async def slow(*args):
+        await asyncio.sleep(0.1)
+        return 0.1
+
+    state = _state(SimpleNamespace(warm_up=slow))
+    state.ollama.warm_up = slow
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    await ModelWarmer(state, models=("a", "b")).warm_up()
+    assert loop.time() - t0 < 0.25
+
+
+@pytest.mark.asyncio
+async def test_refresher_keeps_models_resident_and_counts_failures():
+    state = _state()
+    state.ollama.keep_resident.side_effect = [None, OllamaUnavailableError("down"), None]
+    warmer = ModelWarmer(state, models=("gemma3:1b",), interval=0.01)
+
+    warmer.start()
+    for _ in range(100):
+        if state.ollama.keep_resident.await_count >= 3:
+            break
+        await asyncio.sleep(0.01)
+    await warmer.stop()
+
+    stats = warmer.stats()
+    assert stats["refreshes"] == 2
+    assert stats["refresh_failures"] == 1
+    assert stats["keep_alive"] == "30m"
@@ -1,5 +1,5 @@
 import { useState, type ReactNode } from 'react';
-import type { AnalysisState, CADContext } from '../types';
+import type { AnalysisState, CADContext, FeatureResult } from '../types';
 import { GDTCallout } from './GDTCallout';
 
 interface Props {
@@ -116,6 +116,31 @@ function CADContextPanel({ cadContext }: { cadContext: CADContext }) {
   );
 }
 
+function FeatureResultPanel({ result }: { result: FeatureResult }) {
+  const datums = result.datumScheme
+    ? [result.datumScheme.primary, result.datumScheme.secondary, result.datumScheme.tertiary].filter(Boolean)
+    : [];
+  return (
+    <div className="bg-surface-800 border border-surface-600 p-4 mb-4">
+      <div className="flex items-center justify-between mb-2">
+        <span className="text-sm text-surface-200 font-semibold">{result.feature_name}</span>
+        {datums.length > 0 && (
+          <span className="text-xs text-accent-400 font-mono">{datums.map((d) => d!.datum).join(' | ')}</span>
+        )}
+      </div>
+      {result.callouts ? (
+        result.callouts.map((callout, i) => <GDTCallout key={i} callout={callout} />)
+      ) : (
+        !result.warnings && <Shimmer lines={2} />
+      )}
+      {result.reasoning && <p className="text-xs text-surface-400 mt-2">{result.reasoning.summary}</p>}
+      {result.warnings?.map((warning, i) => (
+        <div key={i} className="text-xs text-yellow-200 mt-2">{warning}</div>
+      ))}
+    </div>
+  );
+}
+
 export function AnalysisStream({ state }: Props) {
   if (state.status === 'idle') {
     return (
@@ -181,61 +206,74 @@ export function AnalysisStream({ state }: Props) {
         </Section>
       )}
 
-      {/* Datum Scheme */}
-      <Section
-        title="Datum Scheme"
-        show={state.datumScheme !== null}
-        pending={isActive && state.datumScheme === null && state.features !== null}
-      >
-        {state.datumScheme && (
-          <div className="flex gap-3">
-            {[state.datumScheme.primary, state.datumScheme.secondary, state.datumScheme.tertiary]
-              .filter(Boolean)
-              .map((d) => (
-                <div key={d!.datum} className="bg-surface-700 border border-surface-600 p-3 flex-1">
-                  <div className="text-xl font-bold text-accent-400 font-mono">{d!.datum}</div>
-                  <div className="text-sm text-surface-300 mt-1">{d!.surface}</div>
-                  <div className="text-xs text-surface-500 mt-1">{d!.reasoning}</div>
-                </div>
-              ))}
-          </div>
-        )}
-      </Section>
+      {state.featureResults !== null ? (
+        /* multi_feature: one panel per feature instead of a single result */
+        <Section title="Per-Feature Results" show pending={false}>
+          {Object.entries(state.featureResults)
+            .sort(([a], [b]) => Number(a) - Number(b))
+            .map(([index, result]) => (
+              <FeatureResultPanel key={index} result={result} />
+            ))}
+        </Section>
+      ) : (
+        <>
+        {/* Datum Scheme */}
+        <Section
+          title="Datum Scheme"
+          show={state.datumScheme !== null}
+          pending={isActive && state.datumScheme === null && state.features !== null}
+        >
+          {state.datumScheme && (
+            <div className="flex gap-3">
+              {[state.datumScheme.primary, state.datumScheme.secondary, state.datumScheme.tertiary]
+                .filter(Boolean)
+                .map((d) => (
+                  <div key={d!.datum} className="bg-surface-700 border border-surface-600 p-3 flex-1">
+                    <div className="text-xl font-bold text-accent-400 font-mono">{d!.datum}</div>
+                    <div className="text-sm text-surface-300 mt-1">{d!.surface}</div>
+                    <div className="text-xs text-surface-500 mt-1">{d!.reasoning}</div>
+                  </div>
+                ))}
+            </div>
+          )}
+        </Section>
 
-      {/* GDT Callouts */}
-      <Section
-        title="GD&T Callouts"
-        show={state.callouts !== null}
-        pending={isActive && state.callouts === null && state.datumScheme !== null}
-      >
-        {state.callouts?.map((callout, i) => (
-          <GDTCallout key={i} callout={callout} />
-        ))}
-      </Section>
+        {/* GDT Callouts */}
+        <Section
+          title="GD&T Callouts"
+          show={state.callouts !== null}
+          pending={isActive && state.callouts === null && state.datumScheme !== null}
+        >
+          {state.callouts?.map((callout, i) => (
+            <GDTCallout key={i} callout={callout} />
+          ))}
+        </Section>
 
-      {/* Reasoning */}
-      <Section
-        title="Reasoning"
-        show={state.reasoning !== null}
-        pending={isActive && state.reasoning === null && state.callouts !== null}
-      >
-        {state.reasoning && (
-          <div className="space-y-3 text-sm">
-            <p className="text-surface-300">{state.reasoning.summary}</p>
-            <div className="bg-surface-700 border border-surface-600 p-3">
-              <h4 className="text-xs font-semibold text-surface-400 font-mono uppercase mb-1">Manufacturing Notes</h4>
-              <p className="text-surface-300">{state.reasoning.manufacturing_notes}</p>
-            </div>
-            <div className="flex flex-wrap gap-2">
-              {state.reasoning.standards_references.map((ref) => (
-                <span key={ref} className="px-2 py-1 bg-surface-700 border border-surface-600 text-xs text-surface-400 font-mono">
-                  {ref}
-                </span>
-              ))}
+        {/* Reasoning */}
+        <Section
+          title="Reasoning"
+          show={state.reasoning !== null}
+          pending={isActive && state.reasoning === null && state.callouts !== null}
+        >
+          {state.reasoning && (
+            <div className="space-y-3 text-sm">
+              <p className="text-surface-300">{state.reasoning.summary}</p>
+              <div className="bg-surface-700 border border-surface-600 p-3">
+                <h4 className="text-xs font-semibold text-surface-400 font-mono uppercase mb-1">Manufacturing Notes</h4>
+                <p className="text-surface-300">{state.reasoning.manufacturing_notes}</p>
+              </div>
+              <div className="flex flex-wrap gap-2">
+                {state.reasoning.standards_references.map((ref) => (
+                  <span key={ref} className="px-2 py-1 bg-surface-700 border border-surface-600 text-xs text-surface-400 font-mono">
+                    {ref}
+                  </span>
+                ))}
+              </div>
             </div>
-          </div>
-        )}
-      </Section>
+          )}
+        </Section>
+        </>
+      )}
 
       {/* Warnings */}
       <Section
@@ -1,11 +1,13 @@
 import { describe, it, expect } from 'vitest';
 import { analysisReducer, initialState, parseSSEFrame } from '../useSSE';
+import type { GDTCallout, SSEAction } from '../../types';
 
 describe('analysisReducer', () => {
   it('returns idle initial state', () => {
     expect(initialState.status).toBe('idle');
     expect(initialState.features).toBeNull();
     expect(initialState.callouts).toBeNull();
+    expect(initialState.featureResults).toBeNull();
   });
 
   it('sets status to connecting', () => {
@@ -43,6 +45,15 @@ describe('analysisReducer', () => {
     expect(state.callouts).toEqual(callouts);
   });
 
+  it('clears streamed callouts when the worker retries', () => {
+    const streamed = analysisReducer(initialState, {
+      type: 'gdt_callouts',
+      payload: { callouts: [{ feature: 'boss' } as GDTCallout], partial: true, index: 0 },
+    });
+    const state = analysisReducer(streamed, { type: 'gdt_callouts', payload: { callouts: [], partial: true, reset: true } });
+    expect(state.callouts).toEqual([]);
+  });
+
   it('handles datum_recommendation event', () => {
     const datum_scheme = {
       primary: { datum: 'A', surface: 'mounting_face', reasoning: 'Largest flat surface' },
@@ -55,6 +66,53 @@ describe('analysisReducer', () => {
     expect(state.datumScheme).toEqual(datum_scheme);
   });
 
+  it('keeps multi_feature results per feature', () => {
+    const scheme = (datum: string) => ({ primary: { datum, surface: 'face', reasoning: '' } });
+    const callout = (feature: string) => ({
+      feature,
+      symbol: '\u2295',
+      symbol_name: 'position',
+      tolerance_value: '\u22050.1',
+      unit: 'mm',
+      datum_references: ['A'],
+      feature_control_frame: '|\u2295| \u22050.1 | A |',
+      reasoning: '',
+    });
+    let state = analysisReducer({ ...initialState, status: 'streaming' }, {
+      type: 'datum_recommendation',
+      payload: { datum_scheme: scheme('A'), feature_index: 0, feature_name: 'Pad' },
+    });
+    state = analysisReducer(state, {
+      type: 'datum_recommendation',
+      payload: { datum_scheme: scheme('B'), feature_index: 1, feature_name: 'Hole' },
+    });
+    state = analysisReducer(state, {
+      type: 'gdt_callouts',
+      payload: { callouts: [callout('pad')], partial: true, feature_index: 0, feature_name: 'Pad' },
+    });
+    state = analysisReducer(state, {
+      type: 'warnings',
+      payload: { warnings: ['Analysis failed for this feature: timeout'], feature_index: 2, feature_name: 'Slot' },
+    });
+
+    expect(state.datumScheme).toBeNull();
+    expect(state.callouts).toBeNull();
+    expect(state.featureResults![0].feature_name).toBe('Pad');
+    expect(state.featureResults![0].datumScheme).toEqual(scheme('A'));
+    expect(state.featureResults![0].callouts).toEqual([callout('pad')]);
+    expect(state.featureResults![1].datumScheme).toEqual(scheme('B'));
+    expect(state.featureResults![1].callouts).toBeNull();
+    expect(state.featureResults![2].warnings).toEqual(['Analysis failed for this feature: timeout']);
+
+    // The aggregated events at the end are untagged
+    const all = [{ ...callout('pad'), feature_index: 0, feature_name: 'Pad' }];
+    state = analysisReducer(state, { type: 'gdt_callouts', payload: { callouts: all, partial: false } });
+    state = analysisReducer(state, { type: 'warnings', payload: { warnings: ['Slot: analysis failed'] } });
+    expect(state.callouts).toEqual(all);
+    expect(state.warnings).toEqual(['Slot: analysis failed']);
+    expect(Object.keys(state.featureResults!)).toHaveLength(3);
+  });
+
   it('handles analysis_complete event and clears step fields', () => {
     const metadata = {
       analysis_id: 'test-123',
@@ -90,6 +148,21 @@ describe('analysisReducer', () => {
     expect(state.totalSteps).toBe(5);
   });
 
+  it('shows the queue position while waiting for Ollama', () => {
+    const state = analysisReducer(
+      { ...initialState, status: 'connecting' },
+      { type: 'queued', payload: { layer: 'classifier', position: 2, queue_depth: 3 } }
+    );
+    expect(state.status).toBe('streaming');
+    expect(state.currentStepMessage).toBe('Queued (#2)');
+  });
+
+  it('ignores events it does not handle', () => {
+    const current = { ...initialState, status: 'streaming' as const };
+    const state = analysisReducer(current, { type: 'frame_skipped', payload: {} } as unknown as SSEAction);
+    expect(state).toBe(current);
+  });
+
   it('handles error', () => {
     const state = analysisReducer(
       { ...initialState, status: 'streaming' },
@@ -1,5 +1,5 @@
 import { useReducer, useRef, useCallback } from 'react';
-import type { AnalysisState, SSEAction, AnalyzeRequest } from '../types';
+import type { AnalysisState, SSEAction, AnalyzeRequest, FeatureResult, FeatureTag } from '../types';
 
 export const initialState: AnalysisState = {
   status: 'idle',
@@ -9,6 +9,7 @@ export const initialState: AnalysisState = {
   callouts: null,
   reasoning: null,
   warnings: null,
+  featureResults: null,
   metadata: null,
   error: null,
   currentStep: null,
@@ -16,6 +17,32 @@ export const initialState: AnalysisState = {
   totalSteps: null,
 };
 
+function isFeatureEvent(payload: FeatureTag): payload is FeatureTag & { feature_index: number } {
+  return typeof payload.feature_index === 'number';
+}
+
+// multi_feature sends a datum scheme, callouts, reasoning and warnings per
+// feature: keep each feature's own instead of the last one overwriting the rest
+function mergeFeatureResult(
+  state: AnalysisState,
+  payload: FeatureTag & { feature_index: number },
+  update: Partial<FeatureResult>,
+): AnalysisState {
+  const index = payload.feature_index;
+  const current: FeatureResult = state.featureResults?.[index] ?? {
+    feature_name: payload.feature_name ?? `Feature ${index + 1}`,
+    datumScheme: null,
+    callouts: null,
+    reasoning: null,
+    warnings: null,
+  };
+  return {
+    ...state,
+    status: 'streaming',
+    featureResults: { ...state.featureResults, [index]: { ...current, ...update } },
+  };
+}
+
 export function analysisReducer(state: AnalysisState, action: SSEAction): AnalysisState {
   switch (action.type) {
     case 'reset':
@@ -27,19 +54,36 @@ export function analysisReducer(state: AnalysisState, action: SSEAction): Analys
     case 'cad_context':
       return { ...state, status: 'streaming', cadContext: action.payload };
     case 'datum_recommendation':
+      if (isFeatureEvent(action.payload)) {
+        return mergeFeatureResult(state, action.payload, { datumScheme: action.payload.datum_scheme });
+      }
       return { ...state, status: 'streaming', datumScheme: action.payload.datum_scheme };
     case 'gdt_callouts':
+      if (isFeatureEvent(action.payload)) {
+        return mergeFeatureResult(state, action.payload, { callouts: action.payload.callouts });
+      }
       return { ...state, status: 'streaming', callouts: action.payload.callouts };
     case 'reasoning':
+      if (isFeatureEvent(action.payload)) {
+        return mergeFeatureResult(state, action.payload, { reasoning: action.payload });
+      }
       return { ...state, status: 'streaming', reasoning: action.payload };
     case 'warnings':
+      if (isFeatureEvent(action.payload)) {
+        return mergeFeatureResult(state, action.payload, { warnings: action.payload.warnings });
+      }
       return { ...state, status: 'streaming', warnings: action.payload.warnings };
     case 'analysis_complete':
       return { ...state, status: 'complete', metadata: action.payload.metadata, currentStep: null, currentStepMessage: null, totalSteps: null };
     case 'progress':
       return { ...state, status: 'streaming', currentStep: action.payload.step, currentStepMessage: action.payload.message, totalSteps: action.payload.total_steps };
+    case 'queued':
+      return { ...state, status: 'streaming', currentStepMessage: `Queued (#${action.payload.position})` };
     case 'error':
       return { ...state, status: 'error', error: action.payload };
+    default:
+      // Events this client does not display (e.g. classification_comparison)
+      return state;
   }
 }
 
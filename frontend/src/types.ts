@@ -17,6 +17,7 @@ export interface AnalyzeRequest {
   manufacturing_process?: string;
   material?: string;
   compare?: boolean;
+  multi_feature?: boolean;
   cad_context?: CADContext | null;
 }
 
@@ -52,6 +53,8 @@ export interface GDTCallout {
   datum_references: string[];
   feature_control_frame: string;
   reasoning: string;
+  feature_index?: number;
+  feature_name?: string;
 }
 
 export interface ReasoningData {
@@ -71,6 +74,10 @@ export interface AnalysisMetadata {
   worker_latency_ms: number;
   cloud_calls: number;
   connectivity_required: boolean;
+  cache_hit?: boolean;
+  deadline_ms?: number;
+  degraded?: boolean;
+  degradations?: { stage: string; layer: string | null; reason: string; feature_index?: number }[];
 }
 
 export interface CreateDrawingRequest {
@@ -80,6 +87,20 @@ export interface CreateDrawingRequest {
   features: Record<string, unknown>;
 }
 
+// multi_feature events produced for one feature carry its index and name
+export interface FeatureTag {
+  feature_index?: number;
+  feature_name?: string;
+}
+
+export interface FeatureResult {
+  feature_name: string;
+  datumScheme: DatumScheme | null;
+  callouts: GDTCallout[] | null;
+  reasoning: ReasoningData | null;
+  warnings: string[] | null;
+}
+
 export type AnalysisStatus = 'idle' | 'connecting' | 'streaming' | 'complete' | 'error';
 
 export interface AnalysisState {
@@ -90,6 +111,8 @@ export interface AnalysisState {
   callouts: GDTCallout[] | null;
   reasoning: ReasoningData | null;
   warnings: string[] | null;
+  // multi_feature: per-feature results, keyed by feature_index
+  featureResults: Record<number, FeatureResult> | null;
   metadata: AnalysisMetadata | null;
   error: string | null;
   currentStep: number | null;
@@ -99,13 +122,14 @@ export interface AnalysisState {
 
 export type SSEAction =
   | { type: 'connecting' }
-  | { type: 'feature_extraction'; payload: { features: FeatureRecord[]; material_detected?: string | null; process_detected?: string | null } }
+  | { type: 'feature_extraction'; payload: { features: FeatureRecord[]; feature_names?: string[]; material_detected?: string | null; process_detected?: string | null } }
   | { type: 'cad_context'; payload: CADContext }
-  | { type: 'datum_recommendation'; payload: { datum_scheme: DatumScheme } }
-  | { type: 'gdt_callouts'; payload: { callouts: GDTCallout[] } }
-  | { type: 'reasoning'; payload: ReasoningData }
-  | { type: 'warnings'; payload: { warnings: string[] } }
+  | { type: 'datum_recommendation'; payload: { datum_scheme: DatumScheme } & FeatureTag }
+  | { type: 'gdt_callouts'; payload: { callouts: GDTCallout[]; partial?: boolean; index?: number; reset?: boolean } & FeatureTag }
+  | { type: 'reasoning'; payload: ReasoningData & FeatureTag }
+  | { type: 'warnings'; payload: { warnings: string[] } & FeatureTag }
   | { type: 'analysis_complete'; payload: { analysis_id: string; metadata: AnalysisMetadata } }
   | { type: 'progress'; payload: { layer: string; message: string; step: number; total_steps: number } }
+  | { type: 'queued'; payload: { layer: string; position: number; queue_depth: number } }
   | { type: 'error'; payload: string }
   | { type: 'reset' };
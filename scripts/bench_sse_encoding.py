@@ -0,0 +1,92 @@
+"""Microbenchmark: stdlib json + sse-starlette framing vs the pre-encoded SSE path.
+
+Encodes the event sequence of one desk analysis (the five progress events,
+the desk mock cad_context and a feature_extraction event) both ways and
+reports the time per sequence. No server or models needed.
+
+Usage:
+    python scripts/bench_sse_encoding.py
+    python scripts/bench_sse_encoding.py --iterations 20000
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from sse_starlette.sse import ServerSentEvent  # noqa: E402
+
+from api import streaming  # noqa: E402
+from api.streaming import encode_event, sse_event, sse_progress  # noqa: E402
+from models.mock_cad_contexts import get_desk_mock  # noqa: E402
+
+PROGRESS = [
+    ("student", "Extracting features with PaliGemma 2...", 1),
+    ("classifier", "Classifying GD&T controls...", 2),
+    ("matcher", "Matching ASME Y14.5 standards...", 3),
+    ("worker", "Generating callouts...", 4),
+    ("finalize", "Finalizing results...", 5),
+]
+
+
+def _payloads() -> list[tuple[str, dict]]:
+    cad = get_desk_mock()
+    payloads = [(
+        "progress", {"layer": layer, "message": message, "step": step, "total_steps": 5}
+    ) for layer, message, step in PROGRESS]
+    payloads.append(("cad_context", {"connected": True, **cad, "source": "freecad_rpc"}))
+    payloads.append(("feature_extraction", {
+        "features": [{"feature_type": obj.get("type"), "geometry": obj.get("dimensions", {})}
+                     for obj in cad.get("objects", [])],
+        "material_detected": "AL6061-T6",
+        "process_detected": "cnc_milling",
+    }))
+    return payloads
+
+
+def stdlib_path(payloads) -> int:
+    """The previous path: json.dumps per event, then sse-starlette builds each frame."""
+    size = 0
+    for index, (event_type, data) in enumerate(payloads):
+        event = {"event": event_type, "data": json.dumps(data), "id": str(index)}
+        size += len(ServerSentEvent(sep="\n", **event).encode())
+    return size
+
+
+def fast_path(payloads) -> int:
+    """sse_progress / sse_event (orjson when installed) and encode_event."""
+    size = 0
+    for index, (event_type, data) in enumerate(payloads):
+        if event_type == "progress":
+            event = sse_progress(data["layer"], data["message"], data["step"], data["total_steps"])
+        else:
+            event = sse_event(event_type, data)
+        size += len(encode_event({**event, "id": str(index)}))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    payloads = _payloads()
+    cad_bytes = len(json.dumps(payloads[len(PROGRESS)][1]))
+    print(f"Sequence: {len(payloads)} events, cad_context payload {cad_bytes} bytes")
+    print(f"Encoder: {'orjson ' + streaming.orjson.__version__ if streaming.orjson else 'stdlib json (orjson not installed)'}")
+
+    results = {}
+    for name, fn in (("stdlib json + ServerSentEvent", stdlib_path), ("pre-encoded", fast_path)):
+        fn(payloads)  # warm caches
+        best = min(timeit.repeat(lambda: fn(payloads), number=args.iterations, repeat=5))
+        results[name] = best / args.iterations * 1e6
+        print(f"  {name:<30} {results[name]:8.1f} us/sequence")
+    baseline, fast = results.values()
+    print(f"Speedup: {baseline / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
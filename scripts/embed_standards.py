@@ -2,17 +2,23 @@
 
 Loads data/standards/asme_y14_5.json, concatenates text fields per characteristic,
 encodes with sentence-transformers all-MiniLM-L6-v2 (384-dim), and saves to
-data/embeddings/standards_embeddings.npz.
+data/embeddings/standards_embeddings.npz, with the matrix extracted to a
+sibling .npy that the API memory-maps.
 
 NPZ keys: ids (string array), embeddings (float32 matrix), model_name (string).
 """
 
 import json
+import sys
 from pathlib import Path
 
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models.embedder import write_matrix  # noqa: E402
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 STANDARDS_FILE = BASE_DIR / "data" / "standards" / "asme_y14_5.json"
 EMBEDDINGS_DIR = BASE_DIR / "data" / "embeddings"
@@ -61,7 +67,11 @@ def main() -> None:
         model_name=np.array(MODEL_NAME),
     )
 
+    # The API memory-maps this instead of reading the .npz in every worker
+    matrix_path = write_matrix(OUTPUT_FILE)
+
     print(f"Saved embeddings: {OUTPUT_FILE}")
+    print(f"  Matrix: {matrix_path.name}")
     print(f"  Shape: {embeddings.shape}")
     print(f"  IDs: {ids}")
     print(f"  Model: {MODEL_NAME}")
@@ -0,0 +1,123 @@
+"""Measure the memory of each ToleranceAI server process, one launch mode at a time.
+
+Starts the server, waits for /api/ready, then reports RSS for every process
+in the server's tree (parent, API workers, VLM process). On Linux it also
+reports PSS from /proc/<pid>/smaps_rollup: RSS counts pages shared between
+forked workers once per worker, PSS splits them between the sharers, so
+the PSS total is what the server really costs.
+
+Usage:
+    python scripts/measure_worker_rss.py --mode uvicorn --workers 4
+    python scripts/measure_worker_rss.py --mode prefork --workers 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def launch(mode: str, workers: int, port: int) -> subprocess.Popen:
+    if mode == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--workers", str(workers)]
+    else:
+        cmd = [sys.executable, "-m", "api.serve", "--port", str(port), "--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR)
+
+
+def wait_ready(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/ready", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(2)
+    raise TimeoutError(f"Server not ready after {timeout:.0f}s")
+
+
+def process_tree(root: int) -> dict[int, tuple[int, str]]:
+    """pid -> (rss KB, command) for ``root`` and all its descendants."""
+    out = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,rss=,command="],
+                         capture_output=True, text=True, check=True).stdout
+    procs = {}
+    for line in out.splitlines():
+        pid, ppid, rss, command = line.split(None, 3)
+        procs[int(pid)] = (int(ppid), int(rss), command)
+    tree, frontier = {}, [root]
+    while frontier:
+        pid = frontier.pop()
+        if pid in procs:
+            tree[pid] = procs[pid][1:]
+            frontier.extend(p for p, (ppid, _, _) in procs.items() if ppid == pid)
+    return tree
+
+
+def smaps_rollup(pid: int) -> dict[str, int]:
+    """Rss/Pss/Shared/Private KB from /proc (Linux only; empty elsewhere)."""
+    try:
+        lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return {}
+    fields = {}
+    for line in lines[1:]:
+        key, value = line.split(":", 1)
+        fields[key] = int(value.split()[0])
+    return {
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def report(root: int) -> None:
+    def mb(kb):
+        return f"{kb / 1024:8.0f}"
+
+    tree = process_tree(root)
+    print(f"{'pid':>7} {'RSS MB':>8} {'PSS MB':>8} {'shared':>8} {'private':>8}  command")
+    total_rss = total_pss = 0
+    for pid, (rss, command) in sorted(tree.items()):
+        detail = smaps_rollup(pid)
+        total_rss += rss
+        total_pss += detail.get("pss", 0)
+        cols = [mb(detail[k]) if detail else f"{'-':>8}" for k in ("pss", "shared", "private")]
+        print(f"{pid:>7} {mb(rss)} {' '.join(cols)}  {command[:60]}")
+    print(f"{'total':>7} {mb(total_rss)} {mb(total_pss) if total_pss else '':>8}")
+    if not total_pss:
+        print("(No PSS on this platform: the RSS total counts shared pages once per process.)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-process memory of a ToleranceAI server")
+    parser.add_argument("--mode", choices=["uvicorn", "prefork"], default="prefork",
+                        help="uvicorn --workers N, or python -m api.serve --workers N")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for /api/ready")
+    args = parser.parse_args()
+
+    server = launch(args.mode, args.workers, args.port)
+    try:
+        wait_ready(args.port, args.timeout)
+        # Let every worker finish loading, not just the one that answered
+        time.sleep(5)
+        print(f"\n{args.mode}, {args.workers} workers:")
+        report(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.kill(server.pid, 9)
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,10 @@ def load_json(filename: str) -> dict:
 
 
 def create_tables(conn: sqlite3.Connection) -> None:
+    # One transaction for the whole reseed (committed in main): a running
+    # server keeps reading the old rows until the new ones are all in
     conn.executescript("""
+        BEGIN;
         DROP TABLE IF EXISTS characteristics_fts;
         DROP TABLE IF EXISTS geometric_characteristics;
         DROP TABLE IF EXISTS tolerance_tables;